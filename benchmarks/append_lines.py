@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Benchmark appending to a growing file
+
+Appends lines to a scratch file one at a time, the way the shell history
+grows, and reports the per-append latency for each stretch of appends so
+any growth with the file's length shows up
+
+Run from the project root: python3 -m benchmarks.append_lines
+"""
+from time import perf_counter
+from argparse import ArgumentParser
+
+from client_backend.fs_db_io import FSDatabase
+from client_backend.fs_db_file import RegularFile
+
+def parse_args():
+    parser = ArgumentParser(description="Time single-line appends as a file grows")
+    parser.add_argument("--config", help="Path to the DB config", default=".fs_db_rdbsh")
+    parser.add_argument("--lines", help="Lines appended one at a time", type=int, default=10000)
+    parser.add_argument("--buckets", help="Stretches of appends reported", type=int, default=10)
+    parser.add_argument("--file", help="Scratch file to append to", default="/bench_append_lines")
+    return parser.parse_args()
+
+def time_appends(fs, bench_file, lines):
+    timings = []
+    for idx in range(lines):
+        start_count = fs.query_count
+        start = perf_counter()
+        bench_file.append(f"line {idx:06}\n")
+        timings.append((perf_counter() - start, fs.query_count - start_count))
+    return timings
+
+if __name__ == "__main__":
+    args = parse_args()
+    fs = FSDatabase(args.config)
+    bench_file = RegularFile(fs, args.file, create_if_missing=True, contents="")
+    bench_file.write("")
+
+    timings = time_appends(fs, bench_file, args.lines)
+
+    bucket_size = max(1, args.lines // args.buckets)
+    print(f"{args.lines} single-line appends to {args.file}")
+    print(f"{'lines':<16} {'mean':>10} {'max':>10} {'statements':>11}")
+    for start in range(0, len(timings), bucket_size):
+        bucket = timings[start:start + bucket_size]
+        seconds = [elapsed for elapsed, _ in bucket]
+        statements = sum(count for _, count in bucket) / len(bucket)
+        label = f"{start + 1}-{start + len(bucket)}"
+        print(f"{label:<16} {sum(seconds) / len(seconds) * 1e3:>8.3f}ms {max(seconds) * 1e3:>8.3f}ms {statements:>11.1f}")
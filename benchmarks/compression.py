@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Benchmark compressed storage of file content
+
+Uploads a tree from setup_template/rootfs once per storage engine with
+compression on, and reports the compression ratio of the lines and blocks
+it stored along with upload, read and grep throughput. Chunks stored
+before keep the codec they were written with, so run it against a
+database that doesn't hold the tree yet
+
+Run from the project root: python3 -m benchmarks.compression
+"""
+from time import perf_counter
+from pathlib import Path, PurePosixPath
+from argparse import ArgumentParser
+
+from client_backend.fs_db_io import FSDatabase
+from client_backend.fs_db_file import Directory, RegularFile
+
+ENGINES = {
+    "lines": FSDatabase.LINE_STORAGE,
+    "blocks": FSDatabase.BLOCK_STORAGE,
+}
+
+DB_QUERY_CHUNKS_USED = (
+    "SELECT codec, COUNT(*), "
+    "COALESCE(SUM(IF(codec = 'z', UNCOMPRESSED_LENGTH(chunkContent), LENGTH(chunkContent))), 0), "
+    "COALESCE(SUM(LENGTH(chunkContent)), 0) "
+    "FROM ContentChunks WHERE chunkHash IN ("
+    "SELECT chunkHash FROM FileContents WHERE fileContentID IN ("
+    "SELECT fileContentID FROM HardLinks WHERE fileID IN ({fids})"
+    ")) GROUP BY codec"
+)
+
+def parse_args():
+    parser = ArgumentParser(description="Measure compression ratio and throughput on a real tree")
+    parser.add_argument("--config", help="Path to the DB config", default=".fs_db_rdbsh")
+    parser.add_argument("--source", help="Local tree to upload", default="setup_template/rootfs")
+    parser.add_argument("--directory", help="Scratch directory to upload into", default="/bench_compression")
+    parser.add_argument("--threshold", help="Bytes from which lines and blocks are compressed", type=int, default=256)
+    parser.add_argument("--pattern", help="Regex grepped for in every file", default="license")
+    parser.add_argument("--runs", help="Reads of the whole tree per engine", type=int, default=3)
+    return parser.parse_args()
+
+def upload(fs, source, destination):
+    files = []
+    start = perf_counter()
+    Directory(fs, destination, create_if_missing=True)
+    for local_path in sorted(Path(source).rglob("*")):
+        db_path = PurePosixPath(destination, local_path.relative_to(source).as_posix())
+        if local_path.is_symlink():
+            continue
+        with fs.transaction():
+            if local_path.is_dir():
+                Directory(fs, db_path, create_if_missing=True)
+            elif local_path.is_file():
+                with local_path.open("rb") as local_file:
+                    files.append(RegularFile(fs, db_path, create_if_missing=True, contents=local_file.readlines()))
+    return files, perf_counter() - start
+
+def chunks_used(fs, files):
+    fids = ", ".join(str(f.fid) for f in files) or "NULL"
+    with fs.pool.connection() as pooled:
+        cursor = pooled.connection.cursor()
+        cursor.execute(DB_QUERY_CHUNKS_USED.format(fids=fids))
+        used = {codec: (chunks, int(logical), int(stored)) for codec, chunks, logical, stored in cursor}
+        cursor.close()
+    return used
+
+def time_reads(fs, files, runs):
+    timings = []
+    for _ in range(runs):
+        start = perf_counter()
+        read = sum(len(line) for f in files for line in fs.readlines(f, decoded=False))
+        timings.append(perf_counter() - start)
+    return min(timings), read
+
+def time_grep(fs, files, pattern):
+    start = perf_counter()
+    matches = sum(1 for f in files for _ in fs.find_in_file(f, pattern))
+    return perf_counter() - start, matches
+
+if __name__ == "__main__":
+    args = parse_args()
+    fs = FSDatabase(args.config)
+    default_engine, default_threshold = fs.storage_engine, fs.compress_threshold
+
+    results = {}
+    try:
+        fs.compress_threshold = args.threshold
+        for name, engine in ENGINES.items():
+            fs.storage_engine = engine
+            files, upload_time = upload(fs, args.source, PurePosixPath(args.directory, name))
+            results[name] = (
+                chunks_used(fs, files), upload_time, *time_reads(fs, files, args.runs), *time_grep(fs, files, args.pattern)
+            )
+    finally:
+        fs.storage_engine = default_engine
+        fs.compress_threshold = default_threshold
+
+    print(f"{args.source} ({len(files)} files, threshold {args.threshold} bytes, reads best of {args.runs})")
+    print(f"{'engine':<8} {'compressed':>11} {'plain':>9} {'logical':>12} {'stored':>12} {'ratio':>7} "
+          f"{'upload':>9} {'read MB/s':>10} {'grep':>9}")
+    for name, (used, upload_time, read_time, read, grep_time, _) in results.items():
+        compressed = used.get(FSDatabase.ZLIB_CODEC, (0, 0, 0))
+        plain = used.get(FSDatabase.NO_CODEC, (0, 0, 0))
+        logical, stored = compressed[1] + plain[1], compressed[2] + plain[2]
+        print(f"{name:<8} {compressed[0]:>11} {plain[0]:>9} {logical:>12} {stored:>12} {logical / max(stored, 1):>7.2f} "
+              f"{upload_time:>8.3f}s {read / read_time / 1e6:>10.2f} {grep_time:>8.3f}s")
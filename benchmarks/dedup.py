@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Benchmark content-addressed storage of file data
+
+Uploads a tree from setup_template/rootfs twice and reports how much of its
+content is stored once and shared (the dedup ratio), and how much faster
+the second copy loads when none of its lines or blocks have to be sent
+
+Run from the project root: python3 -m benchmarks.dedup
+"""
+from time import perf_counter
+from pathlib import Path, PurePosixPath
+from argparse import ArgumentParser
+
+from client_backend.fs_db_io import FSDatabase
+from client_backend.fs_db_file import Directory, RegularFile
+
+DB_QUERY_LOGICAL_USED = (
+    "SELECT COUNT(*), COALESCE(SUM(IF(codec = 'z', UNCOMPRESSED_LENGTH(chunkContent), LENGTH(chunkContent))), 0) "
+    "FROM FileContents INNER JOIN ContentChunks USING (chunkHash) WHERE fileContentID IN ("
+    "SELECT fileContentID FROM HardLinks WHERE fileID IN ({fids})"
+    ")"
+)
+DB_QUERY_STORED_USED = (
+    "SELECT COUNT(*), COALESCE(SUM(IF(codec = 'z', UNCOMPRESSED_LENGTH(chunkContent), LENGTH(chunkContent))), 0) "
+    "FROM ContentChunks WHERE chunkHash IN ("
+    "SELECT chunkHash FROM FileContents WHERE fileContentID IN ("
+    "SELECT fileContentID FROM HardLinks WHERE fileID IN ({fids})"
+    "))"
+)
+
+def parse_args():
+    parser = ArgumentParser(description="Measure deduplication of a real tree")
+    parser.add_argument("--config", help="Path to the DB config", default=".fs_db_rdbsh")
+    parser.add_argument("--source", help="Local tree to upload", default="setup_template/rootfs")
+    parser.add_argument("--directory", help="New scratch directory to upload into", default="/bench_dedup")
+    return parser.parse_args()
+
+def upload(fs, source, destination):
+    files = []
+    start = perf_counter()
+    Directory(fs, destination, create_if_missing=True)
+    for local_path in sorted(Path(source).rglob("*")):
+        db_path = PurePosixPath(destination, local_path.relative_to(source).as_posix())
+        if local_path.is_symlink():
+            continue
+        with fs.transaction():
+            if local_path.is_dir():
+                Directory(fs, db_path, create_if_missing=True)
+            elif local_path.is_file():
+                with local_path.open("rb") as local_file:
+                    files.append(RegularFile(fs, db_path, create_if_missing=True, contents=local_file.readlines()))
+    return files, perf_counter() - start
+
+def storage_used(fs, files, query):
+    fids = ", ".join(str(f.fid) for f in files) or "NULL"
+    with fs.pool.connection() as pooled:
+        cursor = pooled.connection.cursor()
+        cursor.execute(query.format(fids=fids))
+        rows, payload = cursor.fetchone()
+        cursor.close()
+    return rows, int(payload)
+
+if __name__ == "__main__":
+    args = parse_args()
+    fs = FSDatabase(args.config)
+    if fs.find_file(args.directory):
+        raise SystemExit(f"{args.directory} already exists, pass a new --directory")
+
+    first_files, first_load = upload(fs, args.source, PurePosixPath(args.directory, "first"))
+    second_files, second_load = upload(fs, args.source, PurePosixPath(args.directory, "second"))
+
+    logical_rows, logical_bytes = storage_used(fs, first_files, DB_QUERY_LOGICAL_USED)
+    stored_rows, stored_bytes = storage_used(fs, first_files, DB_QUERY_STORED_USED)
+
+    print(f"{args.source} ({len(first_files)} files)")
+    print(f"{'':<16} {'rows':>10} {'bytes':>12}")
+    print(f"{'logical':<16} {logical_rows:>10} {logical_bytes:>12}")
+    print(f"{'stored':<16} {stored_rows:>10} {stored_bytes:>12}")
+    print(f"{'dedup ratio':<16} {logical_rows / max(stored_rows, 1):>10.2f} {logical_bytes / max(stored_bytes, 1):>12.2f}")
+    print(f"{'first load':<16} {first_load:>9.3f}s")
+    print(f"{'second load':<16} {second_load:>9.3f}s")
+    print(f"{'saved':<16} {first_load - second_load:>9.3f}s")
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Benchmark rewriting a large file with write_content
+
+Creates a long file (once) and times rewriting it with a single line
+changed (to one of another length, so every line after it moves) against
+rewriting it with every line changed, reporting wall time, the statements
+sent to the DB and the content rows written for each
+
+Run from the project root: python3 -m benchmarks.diff_write
+"""
+from time import perf_counter
+from argparse import ArgumentParser
+
+from client_backend.fs_db_io import FSDatabase, FSRegularFileQuery
+from client_backend.fs_db_file import RegularFile
+
+def parse_args():
+    parser = ArgumentParser(description="Time write_content when one line of a long file changes")
+    parser.add_argument("--config", help="Path to the DB config", default=".fs_db_rdbsh")
+    parser.add_argument("--lines", help="Lines in the file", type=int, default=50000)
+    parser.add_argument("--file", help="Scratch file to rewrite", default="/bench_diff_write")
+    parser.add_argument("--runs", help="Runs per configuration", type=int, default=3)
+    return parser.parse_args()
+
+def make_lines(count, tag):
+    return [f"{tag} config_key_{idx:06} = value_{idx:06}\n" for idx in range(count)]
+
+def count_rows_written(fs):
+    # Tallies the FileContents rows each write sends, on top of what _insert_rows does
+    written = [0]
+    insert_rows = fs._insert_rows
+    def counting_insert_rows(queries_enum, rows):
+        rows = list(rows)
+        if queries_enum is FSRegularFileQuery.DB_QUERY_ADD_FILE_CONTENTS:
+            written[0] += len(rows)
+        insert_rows(queries_enum, rows)
+    fs._insert_rows = counting_insert_rows
+    return written
+
+def time_write(fs, bench_file, base, variant, runs, written):
+    results = []
+    for _ in range(runs):
+        bench_file.write(base)
+        start_count, start_written = fs.query_count, written[0]
+        start = perf_counter()
+        bench_file.write(variant)
+        results.append((perf_counter() - start, fs.query_count - start_count, written[0] - start_written))
+    return min(results)
+
+if __name__ == "__main__":
+    args = parse_args()
+    fs = FSDatabase(args.config)
+    bench_file = RegularFile(fs, args.file, create_if_missing=True, contents="")
+    written = count_rows_written(fs)
+
+    base = make_lines(args.lines, "a")
+    one_changed = list(base)
+    # Shorter than the line it replaces, the rows after it keep their content but not their offsets
+    one_changed[args.lines // 2] = "changed line\n"
+    all_changed = make_lines(args.lines, "b")
+
+    one = time_write(fs, bench_file, base, one_changed, args.runs, written)
+    every = time_write(fs, bench_file, base, all_changed, args.runs, written)
+
+    print(f"write_content on {args.file} ({args.lines} lines, best of {args.runs})")
+    print(f"{'one line changed':<20} {one[0]:>9.3f}s {one[1]:>9} statements {one[2]:>9} rows written")
+    print(f"{'every line changed':<20} {every[0]:>9.3f}s {every[1]:>9} statements {every[2]:>9} rows written")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Benchmark `find / +name '*.py' +ls`
+
+Times find over the whole file system with full names built by walking up
+to the root one parent at a time (as before paths were materialized) against
+reading the stored path, reporting wall time and statements sent to the DB.
+The rest of what +ls prints comes back with find's query
+
+Run from the project root: python3 -m benchmarks.find_name
+"""
+from io import StringIO
+from time import perf_counter
+from runpy import run_path
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+
+from client_backend import shell_context
+from client_backend.fs_db_io import FSDatabase
+from client_backend.fs_db_file import File
+
+FIND_PATH = "utilities_raw/find.py"
+
+def parse_args():
+    parser = ArgumentParser(description="Time `find / +name PATTERN +ls`")
+    parser.add_argument("--config", help="Path to the DB config", default=".fs_db_rdbsh")
+    parser.add_argument("--pattern", help="Name pattern to search for", default="*.py")
+    parser.add_argument("--runs", help="Runs per configuration", type=int, default=3)
+    return parser.parse_args()
+
+def walk_full_name(entity):
+    # get_full_name before paths were stored, one query per ancestor
+    full_name = entity.fs_db.get_name(entity)
+    parent = entity.get_parent_directory()
+    grandparent = parent.get_parent_directory() if parent else None
+    while parent and grandparent:
+        full_name = f"{entity.fs_db.get_name(parent)}/{full_name}"
+        parent = grandparent
+        grandparent = parent.get_parent_directory()
+    return f"/{full_name}"
+
+def time_find(fs, pattern, runs):
+    results = []
+    for _ in range(runs):
+        start_count = fs.query_count
+        start = perf_counter()
+        with redirect_stdout(StringIO()):
+            try:
+                run_path(FIND_PATH, init_globals=dict(
+                    SHELL=shell_context,
+                    FS=fs,
+                    ARGV=["/", "+name", pattern, "+ls"],
+                ), run_name="__rdbsh__")
+            except SystemExit:
+                pass
+        results.append((perf_counter() - start, fs.query_count - start_count))
+    return min(results)
+
+if __name__ == "__main__":
+    args = parse_args()
+    fs = FSDatabase(args.config)
+
+    stored_full_name, stored_find_tree = File.full_name, File.find_tree
+    File.full_name = property(walk_full_name)
+    # The walk queries once per ancestor, so the streamed result is read in first to give its connection back
+    File.find_tree = lambda entity, **predicates: iter(list(stored_find_tree(entity, **predicates)))
+    walked = time_find(fs, args.pattern, args.runs)
+    File.full_name, File.find_tree = stored_full_name, stored_find_tree
+    stored = time_find(fs, args.pattern, args.runs)
+
+    print(f"find / +name '{args.pattern}' +ls (best of {args.runs})")
+    print(f"{'walk to root':<24} {walked[0]:>9.3f}s {walked[1]:>9} statements")
+    print(f"{'stored path':<24} {stored[0]:>9.3f}s {stored[1]:>9} statements")
+    print(f"{'saved':<24} {walked[0] - stored[0]:>9.3f}s {walked[1] - stored[1]:>9} statements")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Benchmark updatedb and locate against find
+
+Times a full updatedb, an incremental one after a few files are created,
+and then locate from the local index against find_tree asking the DB for
+the same names, with a substring, an anchored glob and a basename glob.
+Run fill_fs_rdb.py (or another benchmark) first, the more paths the better
+
+Run from the project root: python3 -m benchmarks.locate_paths
+"""
+from time import perf_counter
+from argparse import ArgumentParser
+from pathlib import PurePosixPath
+
+from client_backend.fs_db_io import FSDatabase
+from client_backend.fs_db_file import Directory, RegularFile
+from client_backend.fs_db_locate import update_index, locate
+
+def parse_args():
+    parser = ArgumentParser(description="Time updatedb and compare locate with find")
+    parser.add_argument("--config", help="Path to the DB config", default=".fs_db_rdbsh")
+    parser.add_argument("--index", help="Scratch index file", default=".fs_db_locatedb.bench")
+    parser.add_argument("--directory", help="Scratch directory new files go in", default="/bench_locate_paths")
+    parser.add_argument("--new-files", help="Files created before the incremental update", type=int, default=100)
+    parser.add_argument("--runs", help="Runs per search", type=int, default=5)
+    return parser.parse_args()
+
+def time_call(func, runs):
+    results = []
+    for _ in range(runs):
+        start = perf_counter()
+        found = func()
+        results.append((perf_counter() - start, found))
+    return min(results)
+
+def add_files(fs, directory, count):
+    directory = Directory(fs, directory, create_if_missing=True)
+    existing = sum(1 for _ in directory.walk())
+    with fs.transaction():
+        for idx in range(existing, existing + count):
+            RegularFile(fs, PurePosixPath(directory.full_name, f"new_{idx:06}.txt"), create_if_missing=True, contents="")
+
+if __name__ == "__main__":
+    args = parse_args()
+    fs = FSDatabase(args.config)
+    root = Directory(fs, "/")
+
+    full = time_call(lambda: update_index(fs, args.index, rebuild=True)[0], 1)
+    add_files(fs, args.directory, args.new_files)
+    incremental = time_call(lambda: update_index(fs, args.index)[0], 1)
+    print(f"updatedb over {incremental[1]} paths")
+    print(f"{'full':<12} {full[0]:>9.3f}s")
+    print(f"{'incremental':<12} {incremental[0]:>9.3f}s ({args.new_files} new files)")
+
+    searches = [
+        # (locate pattern, basename, find name pattern)
+        ("new_0000", False, "%new_0000%"),
+        (f"{args.directory}/new_00*", False, "new_00%"),
+        ("*.txt", True, "%.txt"),
+    ]
+    print(f"\nbest of {args.runs}")
+    print(f"{'pattern':<32} {'locate':>10} {'find':>10} {'matches':>9}")
+    for pattern, basename, name in searches:
+        located = time_call(lambda: sum(1 for _ in locate(pattern, args.index, basename)), args.runs)
+        found = time_call(lambda: sum(1 for _ in fs.find_tree(root, name=name, include_hidden=True)), args.runs)
+        print(f"{pattern:<32} {located[0] * 1000:>8.2f}ms {found[0] * 1000:>8.2f}ms {located[1]:>9}")
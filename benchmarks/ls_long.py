@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Benchmark `ls -l` over a large directory
+
+Fills a scratch directory with empty regular files (once) and then times
+`ls -l` on it with a cursor allocated per operation against the pooled
+long-lived cursors, reporting wall time and statements sent to the DB
+
+Run from the project root: python3 -m benchmarks.ls_long
+"""
+from io import StringIO
+from time import perf_counter
+from runpy import run_path
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from pathlib import PurePosixPath
+
+from client_backend import shell_context
+from client_backend.fs_db_io import FSDatabase
+from client_backend.fs_db_file import Directory, RegularFile
+
+LS_PATH = "utilities_raw/ls.py"
+
+def parse_args():
+    parser = ArgumentParser(description="Time `ls -l` over a large directory")
+    parser.add_argument("--config", help="Path to the DB config", default=".fs_db_rdbsh")
+    parser.add_argument("--entries", help="Number of files in the listed directory", type=int, default=5000)
+    parser.add_argument("--directory", help="Scratch directory to list", default="/bench_ls_long")
+    parser.add_argument("--runs", help="Runs per configuration", type=int, default=3)
+    return parser.parse_args()
+
+def populate(fs, directory, entries):
+    directory = Directory(fs, directory, create_if_missing=True)
+    existing = sum(1 for _ in directory.walk())
+    for idx in range(existing, entries):
+        RegularFile(fs, PurePosixPath(directory.full_name, f"entry_{idx:06}"), create_if_missing=True, contents="")
+
+def time_ls(fs, directory, runs):
+    results = []
+    for _ in range(runs):
+        start_count = fs.query_count
+        start = perf_counter()
+        with redirect_stdout(StringIO()):
+            try:
+                run_path(LS_PATH, init_globals=dict(
+                    SHELL=shell_context,
+                    FS=fs,
+                    ARGV=["-l", directory],
+                ), run_name="__rdbsh__")
+            except SystemExit:
+                pass
+        results.append((perf_counter() - start, fs.query_count - start_count))
+    return min(results)
+
+if __name__ == "__main__":
+    args = parse_args()
+    fs = FSDatabase(args.config)
+    populate(fs, args.directory, args.entries)
+
+    fs.pool.reuse_cursors = False
+    per_operation = time_ls(fs, args.directory, args.runs)
+    fs.pool.reuse_cursors = True
+    pooled = time_ls(fs, args.directory, args.runs)
+
+    print(f"ls -l {args.directory} ({args.entries} entries, best of {args.runs})")
+    print(f"{'cursor per operation':<24} {per_operation[0]:>9.3f}s {per_operation[1]:>9} statements")
+    print(f"{'pooled cursors':<24} {pooled[0]:>9.3f}s {pooled[1]:>9} statements")
+    print(f"{'saved':<24} {per_operation[0] - pooled[0]:>9.3f}s {per_operation[1] - pooled[1]:>9} statements")
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Benchmark `grep -r -j N` and `find -j N` on a large tree
+
+Fills a scratch tree with small regular files spread over subdirectories
+(once) and times grep -r for a rare token and find for a name pattern over
+it with 1, 2, 4 and 8 workers, reporting wall time and the speedup over a
+single worker. Workers past the pool_size set in the DB config only wait
+for a connection, so set it to the largest worker count measured
+
+Run from the project root: python3 -m benchmarks.parallel_scan
+"""
+from io import StringIO
+from time import perf_counter
+from runpy import run_path
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from pathlib import PurePosixPath
+
+from client_backend import shell_context
+from client_backend.fs_db_io import FSDatabase
+from client_backend.fs_db_file import Directory, RegularFile
+
+GREP_PATH = "utilities_raw/grep.py"
+FIND_PATH = "utilities_raw/find.py"
+RARE_TOKEN = "needle_0xC0FFEE"
+
+def parse_args():
+    parser = ArgumentParser(description="Time grep -r and find with a growing number of workers")
+    parser.add_argument("--config", help="Path to the DB config", default=".fs_db_rdbsh")
+    parser.add_argument("--files", help="Regular files in the tree", type=int, default=100000)
+    parser.add_argument("--subdirs", help="Subdirectories the files are spread over", type=int, default=100)
+    parser.add_argument("--directory", help="Scratch directory to fill", default="/bench_parallel_scan")
+    parser.add_argument("--jobs", help="Worker counts measured", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--runs", help="Runs per worker count", type=int, default=3)
+    return parser.parse_args()
+
+def populate(fs, directory, files, subdirs):
+    Directory(fs, directory, create_if_missing=True)
+    per_subdir = -(-files // subdirs)
+    for subdir_idx in range(subdirs):
+        subdir = Directory(fs, PurePosixPath(directory, f"dir_{subdir_idx:04}"), create_if_missing=True)
+        existing = sum(1 for _ in subdir.walk())
+        with fs.transaction():
+            for idx in range(subdir_idx * per_subdir + existing, min(files, (subdir_idx + 1) * per_subdir)):
+                # One file in a thousand holds the token grep looks for
+                token = RARE_TOKEN if idx % 1000 == 0 else f"value_{idx * 7}"
+                RegularFile(fs, PurePosixPath(subdir.full_name, f"file_{idx:06}.txt"), create_if_missing=True,
+                            contents=f"file {idx}\nkey = {token}\n")
+
+def time_utility(fs, utility_path, argv, runs):
+    timings = []
+    for _ in range(runs):
+        start = perf_counter()
+        with redirect_stdout(StringIO()):
+            try:
+                run_path(utility_path, init_globals=dict(
+                    SHELL=shell_context,
+                    FS=fs,
+                    ARGV=argv,
+                ), run_name="__rdbsh__")
+            except SystemExit:
+                pass
+        timings.append(perf_counter() - start)
+    return min(timings)
+
+if __name__ == "__main__":
+    args = parse_args()
+    fs = FSDatabase(args.config)
+    populate(fs, args.directory, args.files, args.subdirs)
+
+    results = {}
+    for jobs in args.jobs:
+        results[jobs] = (
+            time_utility(fs, GREP_PATH, ["-r", "-j", str(jobs), args.directory, RARE_TOKEN], args.runs),
+            time_utility(fs, FIND_PATH, ["-j", str(jobs), args.directory, "+name", "file_*5.txt"], args.runs),
+        )
+
+    grep_base, find_base = results[args.jobs[0]]
+    print(f"{args.files} files in {args.subdirs} subdirectories, pool_size {fs.pool.pool_size} (best of {args.runs})")
+    print(f"{'workers':<8} {'grep -r':>10} {'speedup':>8} {'find':>10} {'speedup':>8}")
+    for jobs, (grep_time, find_time) in results.items():
+        print(f"{jobs:<8} {grep_time:>9.3f}s {grep_base / grep_time:>7.2f}x {find_time:>9.3f}s {find_base / find_time:>7.2f}x")
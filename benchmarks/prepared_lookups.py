@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Benchmark path lookups over text against prepared statements
+
+Resolves and stats every file under a directory repeatedly with the dentry
+cache off, first sending each statement as text and then as server-side
+prepared statements, and reports the time spent per query template
+
+Run from the project root: python3 -m benchmarks.prepared_lookups
+"""
+from time import perf_counter
+from argparse import ArgumentParser
+
+from client_backend.fs_db_io import FSDatabase
+from client_backend.fs_db_file import File, Directory
+
+def parse_args():
+    parser = ArgumentParser(description="Time path lookups with and without prepared statements")
+    parser.add_argument("--config", help="Path to the DB config", default=".fs_db_rdbsh")
+    parser.add_argument("--directory", help="Directory whose files are looked up", default="/bin")
+    parser.add_argument("--runs", help="Lookups of every file per configuration", type=int, default=20)
+    return parser.parse_args()
+
+def time_lookups(fs, paths, runs):
+    fs.query_stats.clear()
+    start = perf_counter()
+    for _ in range(runs):
+        for path in paths:
+            fs.stat(File.from_type(fs, fs.find_file(path), File))
+    return perf_counter() - start, dict(fs.query_stats)
+
+def print_stats(label, elapsed, query_stats):
+    print(f"{label}: {elapsed:.3f}s")
+    for name, (count, seconds) in sorted(query_stats.items()):
+        print(f"  {name:<48} {count:>8} {seconds:>9.3f}s {seconds / count * 1e6:>9.1f}us/statement")
+
+if __name__ == "__main__":
+    args = parse_args()
+    fs = FSDatabase(args.config)
+    # Every lookup has to reach the DB
+    fs.dentries.size = 0
+    fs.dentries.clear()
+    paths = [child.full_name for child in Directory(fs, args.directory).walk(include_hidden=True)]
+
+    fs.pool.prepared = False
+    text = time_lookups(fs, paths, args.runs)
+    fs.pool.prepared = True
+    prepared = time_lookups(fs, paths, args.runs)
+
+    print(f"Resolving and stating {len(paths)} files under {args.directory} {args.runs} times")
+    print_stats("text protocol", *text)
+    print_stats("prepared statements", *prepared)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Benchmark line and block storage
+
+Uploads a tree from setup_template/rootfs once per storage engine and
+compares the rows and bytes stored for it and how fast it reads back
+
+Run from the project root: python3 -m benchmarks.storage_engines
+"""
+from time import perf_counter
+from pathlib import Path, PurePosixPath
+from argparse import ArgumentParser
+
+from client_backend.fs_db_io import FSDatabase
+from client_backend.fs_db_file import Directory, RegularFile
+
+ENGINES = {
+    "lines": FSDatabase.LINE_STORAGE,
+    "blocks": FSDatabase.BLOCK_STORAGE,
+}
+
+DB_QUERY_STORAGE_USED = (
+    "SELECT COUNT(*), COALESCE(SUM(LENGTH(chunkContent)), 0) "
+    "FROM FileContents INNER JOIN ContentChunks USING (chunkHash) WHERE fileContentID IN ("
+    "SELECT fileContentID FROM HardLinks WHERE fileID IN ({fids})"
+    ")"
+)
+DB_QUERY_INDEX_USED = (
+    "SELECT COUNT(*) FROM FileLineIndex WHERE fileContentID IN ("
+    "SELECT fileContentID FROM HardLinks WHERE fileID IN ({fids})"
+    ")"
+)
+
+def parse_args():
+    parser = ArgumentParser(description="Compare the storage engines on a real tree")
+    parser.add_argument("--config", help="Path to the DB config", default=".fs_db_rdbsh")
+    parser.add_argument("--source", help="Local tree to upload", default="setup_template/rootfs/etc")
+    parser.add_argument("--directory", help="Scratch directory to upload into", default="/bench_storage")
+    parser.add_argument("--runs", help="Reads of the whole tree per engine", type=int, default=3)
+    return parser.parse_args()
+
+def upload(fs, source, destination):
+    files = []
+    Directory(fs, destination, create_if_missing=True)
+    for local_path in sorted(Path(source).rglob("*")):
+        db_path = PurePosixPath(destination, local_path.relative_to(source).as_posix())
+        if local_path.is_symlink():
+            continue
+        with fs.transaction():
+            if local_path.is_dir():
+                Directory(fs, db_path, create_if_missing=True)
+            elif local_path.is_file():
+                with local_path.open("rb") as local_file:
+                    files.append(RegularFile(fs, db_path, create_if_missing=True, contents=local_file.readlines()))
+    return files
+
+def storage_used(fs, files):
+    fids = ", ".join(str(f.fid) for f in files) or "NULL"
+    with fs.pool.connection() as pooled:
+        cursor = pooled.connection.cursor()
+        cursor.execute(DB_QUERY_STORAGE_USED.format(fids=fids))
+        rows, payload = cursor.fetchone()
+        cursor.execute(DB_QUERY_INDEX_USED.format(fids=fids))
+        index_rows, = cursor.fetchone()
+        cursor.close()
+    return rows, int(payload), index_rows
+
+def time_reads(fs, files, runs):
+    timings = []
+    for _ in range(runs):
+        start = perf_counter()
+        read = sum(len(line) for f in files for line in fs.readlines(f, decoded=False))
+        timings.append(perf_counter() - start)
+    return min(timings), read
+
+if __name__ == "__main__":
+    args = parse_args()
+    fs = FSDatabase(args.config)
+    default_engine = fs.storage_engine
+
+    results = {}
+    try:
+        for name, engine in ENGINES.items():
+            fs.storage_engine = engine
+            files = upload(fs, args.source, PurePosixPath(args.directory, name))
+            results[name] = (*storage_used(fs, files), *time_reads(fs, files, args.runs))
+    finally:
+        fs.storage_engine = default_engine
+
+    print(f"{args.source} ({len(files)} files, reads best of {args.runs})")
+    print(f"{'engine':<8} {'rows':>9} {'index rows':>11} {'bytes':>12} {'read':>9} {'MB/s':>8}")
+    for name, (rows, payload, index_rows, elapsed, read) in results.items():
+        print(f"{name:<8} {rows:>9} {index_rows:>11} {payload:>12} {elapsed:>8.3f}s {read / elapsed / 1e6:>8.2f}")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Benchmark recursive grep with and without the trigram index
+
+Uploads setup_template/rootfs/usr/share (once, stored in lines) and times a
+recursive grep for a rare identifier over it with the trigram index off and
+on, reporting wall time, matches and the statements sent to the DB. Both
+the walk with one search per file and the single grep_tree query are
+timed, along with indexing the lines already stored
+
+Run from the project root: python3 -m benchmarks.trigram_grep
+"""
+from time import perf_counter
+from pathlib import Path, PurePosixPath
+from argparse import ArgumentParser
+
+from client_backend.fs_db_io import FSDatabase
+from client_backend.fs_db_file import Directory, RegularFile
+
+def parse_args():
+    parser = ArgumentParser(description="Time grep -r for a rare identifier with the trigram index off and on")
+    parser.add_argument("--config", help="Path to the DB config", default=".fs_db_rdbsh")
+    parser.add_argument("--source", help="Local tree to upload", default="setup_template/rootfs/usr/share")
+    parser.add_argument("--directory", help="Scratch directory to upload into", default="/bench_trigram_grep")
+    parser.add_argument("--pattern", help="Regex grepped for", default="_filedir_xspec")
+    parser.add_argument("--runs", help="Greps per configuration", type=int, default=3)
+    return parser.parse_args()
+
+def upload(fs, source, destination):
+    Directory(fs, destination, create_if_missing=True)
+    for local_path in sorted(Path(source).rglob("*")):
+        db_path = PurePosixPath(destination, local_path.relative_to(source).as_posix())
+        if local_path.is_symlink():
+            continue
+        with fs.transaction():
+            if local_path.is_dir():
+                Directory(fs, db_path, create_if_missing=True)
+            elif local_path.is_file():
+                with local_path.open("rb") as local_file:
+                    RegularFile(fs, db_path, create_if_missing=True, contents=local_file)
+
+def grep_files(fs, directory, pattern):
+    # One search per file, found by walking the tree a directory at a time
+    matches = 0
+    for file_to_search in fs.get_children_like(directory, "%", search_subdirs=True):
+        if type(file_to_search) is RegularFile:
+            matches += sum(1 for _ in file_to_search.find_in_file(f".*{pattern}.*"))
+    return matches
+
+def grep_tree(fs, directory, pattern):
+    return sum(1 for _ in fs.grep_tree(directory, f".*{pattern}.*"))
+
+def time_grep(fs, grep, directory, pattern, runs):
+    results = []
+    for _ in range(runs):
+        start_count = fs.query_count
+        start = perf_counter()
+        matches = grep(fs, directory, pattern)
+        results.append((perf_counter() - start, matches, fs.query_count - start_count))
+    return min(results)
+
+if __name__ == "__main__":
+    args = parse_args()
+    fs = FSDatabase(args.config)
+    default_engine, default_index = fs.storage_engine, fs.trigram_index
+
+    results = {}
+    try:
+        fs.storage_engine = FSDatabase.LINE_STORAGE
+        fs.trigram_index = False
+        if not fs.find_file(args.directory):
+            upload(fs, args.source, args.directory)
+        directory = Directory(fs, args.directory)
+        results["per file"] = time_grep(fs, grep_files, directory, args.pattern, args.runs)
+        results["grep_tree"] = time_grep(fs, grep_tree, directory, args.pattern, args.runs)
+        start = perf_counter()
+        fs.trigram_index = True
+        build_time = perf_counter() - start
+        results["per file, index"] = time_grep(fs, grep_files, directory, args.pattern, args.runs)
+        results["grep_tree, index"] = time_grep(fs, grep_tree, directory, args.pattern, args.runs)
+    finally:
+        fs.storage_engine = default_engine
+        fs.trigram_index = default_index
+
+    print(f"grep -r '{args.pattern}' over {args.source} (best of {args.runs}, index built in {build_time:.3f}s)")
+    print(f"{'':<18} {'time':>10} {'matches':>9} {'statements':>11}")
+    for name, (elapsed, matches, statements) in results.items():
+        print(f"{name:<18} {elapsed:>9.3f}s {matches:>9} {statements:>11}")
@@ -0,0 +1,84 @@
+"""Filesystem DB Dentry Cache
+
+Bounded LRU cache of directory entries, mapping (parent fid, name) to the
+child's fid and type so repeated path lookups don't go back to the DB
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+Dentry = namedtuple("Dentry", ["fid", "file_type"])
+# Cached answer for a name known not to exist in its directory
+NEGATIVE_DENTRY = Dentry(None, None)
+
+class DentryCache:
+    DEFAULT_SIZE = 4096
+
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # Reverse mapping so entries can be dropped knowing only the child
+        self._keys_by_fid = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, parent_fid, name):
+        """
+        Returns the cached Dentry, NEGATIVE_DENTRY if the name is known to be
+        missing or None when the entry isn't cached
+        """
+        key = (parent_fid, name)
+        with self._lock:
+            dentry = self._entries.get(key)
+            if dentry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return dentry
+
+    def parent_of(self, fid):
+        with self._lock:
+            key = self._keys_by_fid.get(fid)
+            return key[0] if key else None
+
+    def add(self, parent_fid, name, fid, file_type):
+        self._put((parent_fid, name), Dentry(fid, file_type))
+
+    def add_negative(self, parent_fid, name):
+        self._put((parent_fid, name), NEGATIVE_DENTRY)
+
+    def _put(self, key, dentry):
+        if not self.size:
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = dentry
+            if dentry.fid is not None:
+                self._keys_by_fid[dentry.fid] = key
+            while len(self._entries) > self.size:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        dentry = self._entries.pop(key, None)
+        if dentry is not None and self._keys_by_fid.get(dentry.fid) == key:
+            del self._keys_by_fid[dentry.fid]
+
+    def invalidate(self, parent_fid, name):
+        with self._lock:
+            self._drop((parent_fid, name))
+
+    def invalidate_fid(self, fid):
+        with self._lock:
+            key = self._keys_by_fid.get(fid)
+            if key is not None:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_fid.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "size": self.size}
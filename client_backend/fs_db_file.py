@@ -12,6 +12,9 @@ from os import PathLike, strerror
 from datetime import datetime
 from pathlib import PurePosixPath
 
+from client_backend.fs_db_users import User, Group
+from client_backend.fs_db_stream import open_regular_file
+
 class MissingFileError(IOError):
     def __init__(self, path):
         super().__init__(errno.ENOENT, strerror(errno.ENOENT), path)
@@ -31,6 +34,8 @@ class ExistingFileError(IOError):
 
 class File:
     MAX_LINK_DEPTH = 256
+    # Metadata snapshot taken by stat(), dropped whenever this object changes the file
+    _stat = None
     def __new__(cls, fs_db, path_or_id, *args, create_if_missing=False, bypass_typecheck=False, **kwargs):
         """
         Does error checking/reporting on instantiation of object
@@ -63,13 +68,32 @@ class File:
             raise IncorrectFileTypeError(f"Trying to create instance of type {cls.__name__} "
                              f"when file is {inst_type.__name__}. "
                              "Use generic types if type is unknown")
-        return inst if inst_type is cls else inst_type(fs_db, inst.fid)
+        return inst if inst_type is cls else File.from_type(fs_db, inst.fid, inst_type)
 
     def __init__(self, fs_db, path_or_id, create_if_missing=False, bypass_typecheck=False):
         if not self.fid and isinstance(path_or_id, (PathLike, str)) and create_if_missing:
             path = path_or_id
             self.fid = self.fs_db.add_file(path)
 
+    @staticmethod
+    def from_type(fs_db, fid, file_type):
+        """
+        Builds the entity for a file whose type is already known without looking it up again
+        """
+        inst = object.__new__(file_type)
+        inst.fs_db = fs_db
+        inst.fid = fid
+        return inst
+
+    @staticmethod
+    def from_stat(fs_db, file_stat):
+        """
+        Builds the entity for a file along with the metadata snapshot already fetched for it
+        """
+        inst = File.from_type(fs_db, file_stat.fid, file_stat.type)
+        inst._stat = file_stat
+        return inst
+
     @staticmethod
     def resolve_to(fs_db, path, file_type):
         not_at_max_depth = File.MAX_LINK_DEPTH
@@ -89,12 +113,23 @@ class File:
         return f
         
 
+    def stat(self):
+        """
+        Fetches all of the file's metadata at once, properties are served from it until the file changes
+        """
+        if not self._stat:
+            self._stat = self.fs_db.stat(self)
+        return self._stat
+
     @property
     def permissions(self):
+        if self._stat:
+            return self._stat.permissions
         return self.fs_db.get_permissions(self)
 
     @permissions.setter
     def permissions(self, permission_bits):
+        self._stat = None
         self.fs_db.set_permissions(self, permission_bits)
 
     def check_access(self, user, operation):
@@ -114,42 +149,59 @@ class File:
 
     @property
     def size(self):
+        if self._stat:
+            return self._stat.size
         return self.fs_db.get_size(self)
 
     @property
     def full_name(self):
+        if self._stat:
+            return self._stat.full_path
         return self.fs_db.get_full_name(self)
 
     @property
     def name(self):
+        if self._stat:
+            return self._stat.name
         return self.fs_db.get_name(self)
 
     @name.setter
     def name(self, new_name):
+        self._stat = None
         self.fs_db.set_name(self, new_name)
 
     @property
     def owner(self):
+        if self._stat:
+            return User(self.fs_db, uid=self._stat.owner_id)
         return self.fs_db.get_owner(self)
 
     @owner.setter
     def owner(self, new_owner):
+        self._stat = None
         self.fs_db.set_owner(self, new_owner)
 
     @property
     def group_owner(self):
+        if self._stat:
+            return Group(self.fs_db, gid=self._stat.group_owner_id)
         return self.fs_db.get_group_owner(self)
 
     @group_owner.setter
     def group_owner(self, new_owner):
+        self._stat = None
         self.fs_db.set_group_owner(self, new_owner)
 
     @property
     def author(self):
+        if self._stat:
+            return User(self.fs_db, uid=self._stat.author_id)
         return self.fs_db.get_author(self)
 
     @property
     def created_date(self):
+        if self._stat:
+            return self._stat.created_date
         return self.fs_db.get_created_date(self)
 
     @property
@@ -160,16 +212,21 @@ class File:
 
     @property
     def modified_date(self):
+        if self._stat:
+            return self._stat.modified_date
         return self.fs_db.get_modified_date(self)
 
     @property
     def last_opened_date(self):
+        if self._stat:
+            return self._stat.last_opened_date
         return self.fs_db.get_accessed_date(self)
 
     def get_parent_directory(self):
         return self.fs_db.get_parent_dir(self)
 
     def open(self):
+        self._stat = None
         self.fs_db.update_accessed_date(self)
 
     def modify(self):
@@ -181,6 +238,7 @@ class File:
             raise IncorrectFileTypeError()
         if new_directory.get_file(self.name):
             raise ExistingFileError(PurePosixPath(new_directory.full_name).joinpath(self.name))
+        self._stat = None
         self.fs_db.set_parent_dir(self, new_directory)
 
     def remove(self):
@@ -188,10 +246,17 @@ class File:
 
     @property
     def type(self):
-        own_type = self.fs_db.get_type(self)
+        own_type = self._stat.type if self._stat else self.fs_db.get_type(self)
         assert own_type is type(self)
         return own_type
 
+    def find_tree(self, **predicates):
+        """
+        Streams this file and everything below it matching the predicates (see FSDatabase.find_tree), metadata included
+        """
+        for file_stat in self.fs_db.find_tree(self, **predicates):
+            yield File.from_stat(self.fs_db, file_stat)
+
     def __eq__(self, other):
         if not isinstance(other, type(self)):
             return False
@@ -213,10 +278,13 @@ class SymbolicLink(File):
 
     @property
     def linked_path(self):
+        if self._stat:
+            return self._stat.linked_path
         return self.fs_db.get_linked_path(self)
 
     @linked_path.setter
     def linked_path(self, linked_path):
+        self._stat = None
         self.fs_db.set_linked_path(self, linked_path)
         self.modify()
 
@@ -251,6 +319,21 @@ class Directory(File):
         yield from self.fs_db.get_children_like(self, pattern, search_subdirs, include_hidden)
         self.open()
 
+    def grep_tree(self, pattern, include_hidden=False):
+        """
+        Streams (full path, line number, line) for the lines matching the regex in every file below the directory
+        """
+        yield from self.fs_db.grep_tree(self, pattern, include_hidden)
+        self.open()
+
+    def scandir(self, pattern="%", search_subdirs=False, include_hidden=False):
+        """
+        Like get_children_like but every child comes with its stat() snapshot
+        """
+        for file_stat in self.fs_db.scandir(self, include_hidden, pattern, search_subdirs):
+            yield File.from_stat(self.fs_db, file_stat)
+        self.open()
+
     def empty(self):
         for _ in self.walk(include_hidden=True):
             return False
@@ -278,6 +361,8 @@ class RegularFile(File):
 
     @property
     def num_of_hard_links(self):
+        if self._stat:
+            return self._stat.num_of_hard_links
         return self.fs_db.count_hardlinks(self)
 
     def remove(self):
@@ -298,9 +383,26 @@ class RegularFile(File):
         self.open()
         return res
 
-    def readlines(self, decoded=True):
-        yield from self.fs_db.readlines(self, decoded)
+    def readlines(self, start_line=1, count=None, decoded=True):
+        yield from self.fs_db.readlines(self, start_line, count, decoded)
+        self.open()
+
+    def open(self, mode=None, encoding="utf-8", buffer_size=None):
+        """
+        Returns an io stream over the file's contents for mode (see open_regular_file),
+        without a mode only marks the file as opened like File.open()
+        """
+        if mode is None:
+            return super().open()
+        return open_regular_file(self, mode, encoding, buffer_size)
+
+    def read(self, offset=0, length=None):
+        """
+        Returns up to length bytes of the file from offset, or everything after offset if length is None
+        """
+        contents = self.fs_db.read_content(self, offset, length)
         self.open()
+        return contents
 
     def append(self, new_content):
         self.fs_db.append_content(self, new_content)
@@ -6,18 +6,26 @@ from client_backend import shell_context
 
 from client_backend.fs_db_file import *
 from client_backend.fs_db_users import *
+from client_backend.fs_db_pool import FSConnectionPool, PoolScope, Statement
+from client_backend.fs_db_cache import DentryCache, Dentry, NEGATIVE_DENTRY
 
+import re
 import stat
+import json
 import yaml
 import struct
+import zlib
+import hashlib
+import threading
 from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from itertools import chain, islice
+from collections import namedtuple
 from pathlib import PurePosixPath
+from contextlib import contextmanager
 
-import mysql.connector as MySQLConnection
-from mysql.connector import errorcode as MySQLError
-from mysql.connector.errors import ProgrammingError
-from mysql.connector.cursor import MySQLCursor, MySQLCursorNamedTuple
-from mysql.connector.constants import SQLMode
+from mysql.connector.errors import InterfaceError, OperationalError
 
 class FSUserQuery(Enum):
     DB_QUERY_ADD_USER = (
@@ -102,12 +110,35 @@ class PermissionBits:
                     perm_string += "-"
         return perm_string
 
+# Everything `ls -l` shows about a file, shared by the queries building StatResults
+DB_STAT_COLUMNS = (
+    "Files.fileID, fileType, Files.fileName, "
+    "CAST(CONV(HEX(permissionBits), 16, 10) AS UNSIGNED) AS permissionValue, "
+    "ownerID, Owner.userName AS ownerName, groupOwnerID, GroupOwner.groupName AS groupOwnerName, authorID, "
+    "CASE fileType WHEN 'f' THEN RegularFileMetadata.size WHEN 'l' THEN CHAR_LENGTH(linkToFullPath) ELSE 0 END AS size, "
+    "dateCreated, "
+    "COALESCE(Directories.dateModified, RegularFileMetadata.dateModified, SymbolicLinks.dateModified) AS dateModified, "
+    "COALESCE(Directories.dateLastOpened, RegularFileMetadata.dateLastOpened, SymbolicLinks.dateLastOpened) AS dateLastOpened, "
+    "IF(fileType = 'f', ("
+    "SELECT COUNT(Links.fileID) FROM HardLinks AS Links WHERE Links.fileContentID = HardLinks.fileContentID"
+    "), 1) AS hardLinkCount, "
+    "linkToFullPath, fullPath"
+)
+DB_STAT_JOINS = (
+    "LEFT JOIN Users AS Owner ON Owner.userID = Files.ownerID "
+    "LEFT JOIN UserGroups AS GroupOwner ON GroupOwner.groupID = Files.groupOwnerID "
+    "LEFT JOIN Directories ON Directories.fileID = Files.fileID "
+    "LEFT JOIN HardLinks ON HardLinks.fileID = Files.fileID "
+    "LEFT JOIN RegularFileMetadata ON RegularFileMetadata.fileContentID = HardLinks.fileContentID "
+    "LEFT JOIN SymbolicLinks ON SymbolicLinks.fileID = Files.fileID "
+)
+
 class FSGenericFileQuery(Enum):
     DEFAULT_DIRECTORY_PERMISSIONS = 0b001_101_101
     DB_QUERY_ADD_FILE = (
         "INSERT INTO Files "
-        "(fileID, fileName, groupOwnerID, authorID, ownerID) "
-        "VALUES ({use_fid}, %(name)s, %(group)s, %(author)s, %(author)s)"
+        "(fileID, fileName, groupOwnerID, authorID, ownerID, fullPath) "
+        "VALUES ({use_fid}, %(name)s, %(group)s, %(author)s, %(author)s, %(full_path)s)"
     )
     DB_QUERY_DEL_FILE = (
         "DELETE FROM ParentDirectory WHERE fileID = %(fid)s",
@@ -123,20 +154,157 @@ class FSGenericFileQuery(Enum):
     DB_QUERY_GET_PROP = "SELECT {prop} FROM Files WHERE fileID = %(fid)s"
     DB_QUERY_SET_PROP = "UPDATE Files SET {prop}=%(value)s WHERE fileID = %(fid)s"
 
+    # Rewrites the materialized path of a file and everything below it after a rename/move
+    DB_QUERY_MOVE_SUBTREE_PATH = (
+        "WITH RECURSIVE Subtree (fileID) AS ("
+        "SELECT CAST(%(fid)s AS SIGNED) "
+        "UNION ALL "
+        "SELECT ParentDirectory.fileID "
+        "FROM Subtree INNER JOIN ParentDirectory ON ParentDirectory.parentDirectoryFileID = Subtree.fileID"
+        ") "
+        "UPDATE Files INNER JOIN Subtree USING (fileID) "
+        "SET fullPath = CONCAT(%(new_path)s, SUBSTRING(fullPath, CHAR_LENGTH(%(old_path)s) + 1))"
+    )
+
+    # Every remove, rename and move appends a row, so a copy of the paths knows when adding new files isn't
+    # enough. Rows are only ever inserted, so no two of them wait on the same lock
+    DB_QUERY_LOG_PATH_CHANGE = "INSERT INTO PathChanges (fileID) VALUES (%(fid)s)"
+    # Only rows committed long ago go, a copy of the paths taken now already shows them
+    DB_QUERY_PRUNE_PATH_CHANGES = "DELETE FROM PathChanges WHERE dateChanged < NOW() - INTERVAL %(seconds)s SECOND"
+    # The count catches changes that committed after one with a higher changeID was already seen
+    DB_QUERY_GET_PATH_INDEX_STATE = (
+        "SELECT (SELECT IFNULL(MAX(changeID), 0) FROM PathChanges), (SELECT COUNT(*) FROM PathChanges), "
+        "IFNULL(MAX(fileID), 0), COUNT(*), IFNULL(SUM(fileID > %(after_fid)s), 0) "
+        "FROM Files WHERE fullPath IS NOT NULL"
+    )
+    # utf8mb4_0900_bin orders by code point (the order of the UTF-8 bytes) and, unlike utf8mb4_bin,
+    # doesn't ignore trailing spaces
+    DB_QUERY_GET_PATHS = (
+        "SELECT fullPath FROM Files "
+        "WHERE fileID > %(after_fid)s AND fileID <= %(max_fid)s AND fullPath IS NOT NULL "
+        "ORDER BY fullPath COLLATE utf8mb4_0900_bin"
+    )
+
+    DB_QUERY_STAT = f"SELECT {DB_STAT_COLUMNS} FROM Files {DB_STAT_JOINS}WHERE Files.fileID = %(fid)s"
+
+    # Walks path components down from a directory, one row per component resolved.
+    # The walk stops early at a missing component or at anything that isn't a directory
+    DB_QUERY_WALK_PATH = (
+        "WITH RECURSIVE PathWalk (depth, fileID) AS ("
+        "SELECT 0, CAST(%(fid)s AS SIGNED) "
+        "UNION ALL "
+        "SELECT PathWalk.depth + 1, "
+        "IF(Component.name = '..', IFNULL(Up.parentDirectoryFileID, PathWalk.fileID), Down.fileID) "
+        "FROM PathWalk INNER JOIN Directories ON Directories.fileID = PathWalk.fileID "
+        "INNER JOIN JSON_TABLE(%(components)s, '$[*]' COLUMNS ("
+        "depth FOR ORDINALITY, name VARCHAR(255) PATH '$'"
+        ")) AS Component ON Component.depth = PathWalk.depth + 1 "
+        "LEFT JOIN ParentDirectory AS Up ON Up.fileID = PathWalk.fileID "
+        "LEFT JOIN ParentDirectory AS Down "
+        "ON Down.parentDirectoryFileID = PathWalk.fileID AND Down.fileName = Component.name COLLATE utf8mb4_bin "
+        "WHERE Component.name = '..' OR Down.fileID IS NOT NULL"
+        ") "
+        "SELECT depth, fileID, fileType "
+        "FROM PathWalk INNER JOIN Files USING (fileID) "
+        "ORDER BY depth"
+    )
+
+# Gives back the chunks of the FileContents rows matching {rows}, before those rows are deleted
+DB_RELEASE_CHUNKS = (
+    "UPDATE ContentChunks INNER JOIN ("
+    "SELECT chunkHash, COUNT(*) AS uses FROM FileContents WHERE {rows} GROUP BY chunkHash"
+    ") AS Released USING (chunkHash) "
+    "SET refCount = refCount - Released.uses"
+)
+# Chunk content uncompressed on the server, for filters that can't run on the compressed bytes
+DB_CHUNK_CONTENT = "IF(codec = 'z', UNCOMPRESS(chunkContent), chunkContent)"
+DB_FILE_ROWS = "fileContentID = (SELECT fileContentID FROM HardLinks WHERE fileID = %(fid)s)"
+DB_TRAILING_ROWS = "fileContentID = %(file_content_id)s AND lineNumber >= %(from_row)s"
+DB_RANGE_ROWS = "fileContentID = %(file_content_id)s AND lineNumber BETWEEN %(from_row)s AND %(to_row)s"
+# {rows} is left for FSDatabase._execute_batch to fill in with the listed line numbers
+DB_LISTED_ROWS = "fileContentID = %(file_content_id)s AND lineNumber IN ({rows})"
+# Every file below a directory, hidden ones (and everything under them) only with {include_hidden}
+DB_SUBTREE = (
+    "WITH RECURSIVE Subtree (fileID) AS ("
+    "SELECT CAST(%(fid)s AS SIGNED) "
+    "UNION ALL "
+    "SELECT ParentDirectory.fileID "
+    "FROM Subtree INNER JOIN ParentDirectory ON ParentDirectory.parentDirectoryFileID = Subtree.fileID "
+    "INNER JOIN Files ON Files.fileID = ParentDirectory.fileID "
+    "WHERE {include_hidden}"
+    ") "
+)
+# find predicates, FSDatabase.find_tree ANDs together the ones given
+DB_FIND_FILTERS = {
+    "name": "Files.fileName LIKE %(name)s COLLATE utf8mb4_bin",
+    "file_type": "Files.fileType = %(file_type)s",
+    "owner_id": "Files.ownerID = %(owner_id)s",
+    "group_id": "Files.groupOwnerID = %(group_id)s",
+    # Directories without children and regular files without content, nothing else is empty
+    "empty": (
+        "((Files.fileType = 'd' AND NOT EXISTS ("
+        "SELECT * FROM ParentDirectory AS Child WHERE Child.parentDirectoryFileID = Files.fileID"
+        ")) OR (Files.fileType = 'f' AND EXISTS ("
+        "SELECT * FROM HardLinks INNER JOIN RegularFileMetadata USING (fileContentID) "
+        "WHERE HardLinks.fileID = Files.fileID AND size = 0"
+        ")))"
+    ),
+}
+# Paths compared a component at a time by code point ('/' sorts before anything a name holds),
+# the order grep and find split across workers put back together
+DB_PATH_ORDER = "REPLACE(fullPath, '/', CHAR(0 USING utf8mb4)) COLLATE utf8mb4_0900_bin"
+DB_SUBTREE_REGULAR_FILES = (
+    "FROM Subtree INNER JOIN Files USING (fileID) "
+    "INNER JOIN HardLinks USING (fileID) "
+    "INNER JOIN RegularFileMetadata USING (fileContentID) "
+)
+
 class FSRegularFileQuery(Enum):
     # NOTE: size is calculate-able we may want to setup either a trigger/view for keeping this up to date
-    DB_QUERY_ADD_REG_FILE_METADATA = "INSERT INTO RegularFileMetadata (size) VALUES (%(size)s)"
+    DB_QUERY_ADD_REG_FILE_METADATA = (
+        "INSERT INTO RegularFileMetadata (size, storageEngine, lineCount, endsWithNewline) "
+        "VALUES (%(size)s, %(engine)s, %(line_count)s, %(ends_with_newline)s)"
+    )
     DB_QUERY_ADD_REG_FILE = (
         "INSERT INTO HardLinks "
         "(fileID, fileContentID) "
-        "VALUES (%(fid)s, %(file_content_id)s)"
+        "VALUES (%(fid)s, %(file_content_id)s)",
+        "UPDATE Files SET fileType = 'f' WHERE fileID = %(fid)s",
     )
     DB_QUERY_DELETE_ALL_FILE_CONTENT = (
-        "DELETE FROM FileContents "
+        DB_RELEASE_CHUNKS.format(rows=DB_FILE_ROWS),
+        f"DELETE FROM FileContents WHERE {DB_FILE_ROWS}",
+        "DELETE FROM ContentChunks WHERE refCount = 0",
+    )
+    # Rows from from_row on, for appends that rewrite the last line or block
+    DB_QUERY_DELETE_TRAILING_CONTENT = (
+        DB_RELEASE_CHUNKS.format(rows=DB_TRAILING_ROWS),
+        f"DELETE FROM FileContents WHERE {DB_TRAILING_ROWS}",
+        "DELETE FROM ContentChunks WHERE refCount = 0",
+    )
+    # Rows about to be rewritten in place. Their chunks are given back but only dropped by
+    # DROP_UNUSED_CHUNKS, once the rows replacing them had the chance to take them again
+    DB_QUERY_DELETE_ROW_RANGE = (
+        DB_RELEASE_CHUNKS.format(rows=DB_RANGE_ROWS),
+        f"DELETE FROM FileContents WHERE {DB_RANGE_ROWS}",
+    )
+    DB_QUERY_DROP_UNUSED_CHUNKS = "DELETE FROM ContentChunks WHERE refCount = 0"
+    # Renumbers the rows after a rewritten range that now holds more or fewer lines,
+    # {order} runs away from the shift so no two rows ever share a number
+    DB_QUERY_SHIFT_ROWS = (
+        "UPDATE FileContents SET lineNumber = lineNumber + %(shift)s "
+        "WHERE fileContentID = %(file_content_id)s AND lineNumber > %(after)s "
+        "ORDER BY lineNumber {order}"
+    )
+    # Moves the rows a rewrite kept but that now start elsewhere, after a row before them changed length
+    DB_QUERY_SHIFT_OFFSETS = f"UPDATE FileContents SET byteOffset = byteOffset + %(shift)s WHERE {DB_RANGE_ROWS}"
+    DB_QUERY_DELETE_LINE_INDEX = (
+        "DELETE FROM FileLineIndex "
         "WHERE fileContentID = (SELECT fileContentID FROM HardLinks WHERE fileID = %(fid)s)"
     )
     DB_QUERY_DEL_REG_FILE = (
-        DB_QUERY_DELETE_ALL_FILE_CONTENT,
+        *DB_QUERY_DELETE_ALL_FILE_CONTENT,
+        DB_QUERY_DELETE_LINE_INDEX,
         "DELETE FROM HardLinks WHERE fileID = %(fid)s",
         "DELETE FROM RegularFileMetadata WHERE fileContentID = (SELECT fileContentID FROM HardLinks WHERE fileID=%(fid)s)",
     )
@@ -144,7 +312,8 @@ class FSRegularFileQuery(Enum):
         "INSERT INTO HardLinks "
         "SELECT %(link_fid)s AS fileID, fileContentID "
         "FROM HardLinks "
-        "WHERE fileID=%(orig_fid)s"
+        "WHERE fileID=%(orig_fid)s",
+        "UPDATE Files SET fileType = 'f' WHERE fileID = %(link_fid)s",
     )
 
     DB_QUERY_COUNT_HARDLINKS = (
@@ -156,39 +325,89 @@ class FSRegularFileQuery(Enum):
         "DELETE FROM HardLinks WHERE fileID = %(fid)s"
     )
 
-    DB_QUERY_ADD_FILE_CONTENT = (
-        # Allow this command to replace existing lines
-        "REPLACE INTO FileContents "
-        "SELECT fileContentID, %(line_no)s AS lineNumber, %(line_content)s AS lineContent "
-        "FROM HardLinks WHERE fileID=%(fid)s"
-    )
-    DB_QUERY_GET_LAST_LINE = (
-        "SELECT lineNumber, lineContent "
-        "FROM FileContents INNER JOIN RegularFileMetadata USING (fileContentID) "
-        "INNER JOIN HardLinks USING (fileContentID) "
-        "WHERE fileID = %(fid)s AND "
-        "NOT EXISTS ("
-        "SELECT * "
-        "FROM (FileContents AS B) INNER JOIN (RegularFileMetadata AS C) USING (fileContentID) "
-        "INNER JOIN (HardLinks AS D) USING (fileContentID) "
-        "WHERE B.lineNumber > FileContents.lineNumber AND "
-        "D.fileID = HardLinks.fileID"
-        ")"
+    DB_QUERY_ADD_FILE_CONTENTS = (
+        # Overwrites rows being rewritten, {rows} is filled in by FSDatabase._insert_rows
+        "INSERT INTO FileContents "
+        "(fileContentID, lineNumber, byteOffset, chunkHash) "
+        "VALUES {rows} AS New "
+        "ON DUPLICATE KEY UPDATE byteOffset = New.byteOffset, chunkHash = New.chunkHash"
+    )
+    # Gives back the chunks of rows about to be overwritten
+    DB_QUERY_RELEASE_ROWS = DB_RELEASE_CHUNKS.format(rows=DB_LISTED_ROWS)
+    DB_QUERY_GET_ROW_HASHES = (
+        "SELECT lineNumber, byteOffset, chunkHash "
+        "FROM FileContents "
+        "WHERE fileContentID = %(file_content_id)s AND lineNumber > %(after)s "
+        "ORDER BY lineNumber LIMIT %(limit)s"
+    )
+    DB_QUERY_GET_CONTENT_STATS = (
+        "SELECT fileContentID, storageEngine, size, lineCount, endsWithNewline "
+        "FROM RegularFileMetadata INNER JOIN HardLinks USING (fileContentID) "
+        "WHERE fileID = %(fid)s "
+        "FOR UPDATE"
+    )
+    DB_QUERY_SET_CONTENT_STATS = (
+        "UPDATE RegularFileMetadata "
+        "SET size = %(size)s, lineCount = %(line_count)s, endsWithNewline = %(ends_with_newline)s "
+        "WHERE fileContentID = %(file_content_id)s"
+    )
+    DB_QUERY_GET_LINE = (
+        "SELECT byteOffset, chunkContent AS lineContent, codec "
+        "FROM FileContents INNER JOIN ContentChunks USING (chunkHash) "
+        "WHERE fileContentID = %(file_content_id)s AND lineNumber = %(line_no)s"
+    )
+    # Rows overlapping [offset, end), starting from the one the offset falls in
+    DB_QUERY_GET_BYTE_RANGE = (
+        "SELECT byteOffset, chunkContent AS lineContent, codec "
+        "FROM FileContents INNER JOIN ContentChunks USING (chunkHash) "
+        "WHERE fileContentID = %(file_content_id)s AND byteOffset < %(end)s AND byteOffset >= ("
+        "SELECT MAX(byteOffset) FROM FileContents "
+        "WHERE fileContentID = %(file_content_id)s AND byteOffset <= %(offset)s"
+        ") ORDER BY byteOffset, lineNumber"
+    )
+    # Same rows as GET_BYTE_RANGE along with the line each one starts in, which for files
+    # stored in lines is the row's own number
+    DB_QUERY_GET_ROWS_IN_RANGE = (
+        "SELECT lineNumber, byteOffset, IFNULL(firstLineNumber, lineNumber) AS firstLineNumber, "
+        "chunkContent AS rowContent, codec "
+        "FROM FileContents INNER JOIN ContentChunks USING (chunkHash) "
+        "LEFT JOIN FileLineIndex ON FileLineIndex.fileContentID = FileContents.fileContentID "
+        "AND FileLineIndex.blockNumber = FileContents.lineNumber "
+        "WHERE FileContents.fileContentID = %(file_content_id)s AND byteOffset < %(end)s AND byteOffset >= ("
+        "SELECT MAX(byteOffset) FROM FileContents "
+        "WHERE fileContentID = %(file_content_id)s AND byteOffset <= %(offset)s"
+        ") ORDER BY byteOffset, lineNumber"
     )
     DB_QUERY_CHECK_FOR_BANG = (
         "SELECT fileID "
         "FROM FileContents INNER JOIN HardLinks USING (fileContentID) "
-        "WHERE lineNumber = 1 AND fileID = %(fid)s AND lineContent LIKE '#!rdbsh%\\n'"
+        "INNER JOIN ContentChunks USING (chunkHash) "
+        f"WHERE lineNumber = 1 AND fileID = %(fid)s AND {DB_CHUNK_CONTENT} LIKE '#!rdbsh%\\n'"
     )
+    # Keyset paginated, each page starts after the last row of the one before
     DB_QUERY_GET_FILE_CONTENT = (
-        "SELECT lineNumber, lineContent "
-        "FROM FileContents INNER JOIN HardLinks USING (fileContentID) "
-        "WHERE fileID = %(fid)s ORDER BY lineNumber"
+        "SELECT lineNumber, chunkContent AS lineContent, codec "
+        "FROM FileContents INNER JOIN ContentChunks USING (chunkHash) "
+        "WHERE fileContentID = %(file_content_id)s AND lineNumber > %(after)s "
+        "ORDER BY lineNumber LIMIT %(limit)s"
     )
+    # Compressed lines are matched once the server uncompresses them, only the matches are sent back
     DB_QUERY_FIND_IN_FILE_CONTENT = (
-        "SELECT lineNumber, lineContent "
+        f"SELECT lineNumber, {DB_CHUNK_CONTENT} AS lineContent "
+        "FROM FileContents INNER JOIN HardLinks USING (fileContentID) "
+        "INNER JOIN ContentChunks USING (chunkHash) "
+        f"WHERE fileID = %(fid)s AND REGEXP_LIKE({DB_CHUNK_CONTENT}, %(pattern)s, 'c') "
+        "ORDER BY lineNumber"
+    )
+    # Only the lines holding every trigram of the pattern get the regex run on them
+    DB_QUERY_FIND_IN_INDEXED_FILE_CONTENT = (
+        f"SELECT lineNumber, {DB_CHUNK_CONTENT} AS lineContent "
         "FROM FileContents INNER JOIN HardLinks USING (fileContentID) "
-        "WHERE fileID = %(fid)s AND REGEXP_LIKE(lineContent, %(pattern)s, 'c') "
+        "INNER JOIN ContentChunks USING (chunkHash) "
+        "WHERE fileID = %(fid)s AND chunkHash IN ("
+        "SELECT chunkHash FROM ContentTrigrams WHERE trigram IN ({rows}) "
+        "GROUP BY chunkHash HAVING COUNT(*) = %(trigram_count)s"
+        f") AND REGEXP_LIKE({DB_CHUNK_CONTENT}, %(pattern)s, 'c') "
         "ORDER BY lineNumber"
     )
 
@@ -196,22 +415,105 @@ class FSRegularFileQuery(Enum):
     DB_QUERY_SET_PROP = "UPDATE RegularFileMetadata SET {prop}=%(value)s WHERE fileContentID = (SELECT fileContentID FROM HardLinks WHERE fileID=%(fid)s)"
     DB_QUERY_INCREMENT_PROP = "UPDATE RegularFileMetadata SET {prop} = {prop} + %(value)s WHERE fileContentID = (SELECT fileContentID FROM HardLinks WHERE fileID=%(fid)s)"
 
+class FSBlockFileQuery(Enum):
+    # Blocks live in FileContents with lineNumber as the block number, see FSRegularFileQuery
+    DB_QUERY_ADD_LINE_INDEXES = (
+        "REPLACE INTO FileLineIndex "
+        "(fileContentID, blockNumber, firstLineNumber, lineCount) "
+        "VALUES {rows}"
+    )
+    DB_QUERY_GET_LAST_BLOCK = (
+        "SELECT blockNumber, byteOffset, chunkContent AS blockContent, codec, firstLineNumber "
+        "FROM FileLineIndex INNER JOIN HardLinks USING (fileContentID) "
+        "INNER JOIN FileContents ON FileContents.fileContentID = FileLineIndex.fileContentID "
+        "AND FileContents.lineNumber = FileLineIndex.blockNumber "
+        "INNER JOIN ContentChunks USING (chunkHash) "
+        "WHERE fileID = %(fid)s "
+        "ORDER BY blockNumber DESC LIMIT 1"
+    )
+    # Blocks after a rewritten range whose line breaks changed start that many lines further on
+    DB_QUERY_SHIFT_LINE_INDEX = (
+        "UPDATE FileLineIndex SET firstLineNumber = firstLineNumber + %(shift)s "
+        "WHERE fileContentID = %(file_content_id)s AND blockNumber > %(after)s"
+    )
+    DB_QUERY_DELETE_TRAILING_LINE_INDEX = (
+        "DELETE FROM FileLineIndex WHERE fileContentID = %(file_content_id)s AND blockNumber >= %(from_row)s"
+    )
+    # Last block starting before the line, the line starts in it or right after it
+    DB_QUERY_GET_BLOCK_FOR_LINE = (
+        "SELECT blockNumber, firstLineNumber "
+        "FROM FileLineIndex "
+        "WHERE fileContentID = %(file_content_id)s AND firstLineNumber < %(line_no)s "
+        "ORDER BY firstLineNumber DESC, blockNumber DESC LIMIT 1"
+    )
+    DB_QUERY_CHECK_FOR_BANG = (
+        "SELECT fileID "
+        "FROM FileContents INNER JOIN HardLinks USING (fileContentID) "
+        "INNER JOIN ContentChunks USING (chunkHash) "
+        f"WHERE lineNumber = 1 AND fileID = %(fid)s AND {DB_CHUNK_CONTENT} LIKE '#!rdbsh%'"
+    )
+    # One file per content (hard links share it) not stored with the engine
+    DB_QUERY_GET_FILES_NOT_IN_ENGINE = (
+        "SELECT MIN(fileID) "
+        "FROM HardLinks INNER JOIN RegularFileMetadata USING (fileContentID) "
+        "WHERE storageEngine <> %(engine)s "
+        "GROUP BY fileContentID"
+    )
+
+class FSContentChunkQuery(Enum):
+    # Lines and blocks are stored once per distinct content, keyed by its SHA-256
+    DB_QUERY_FIND_EXISTING_CHUNKS = "SELECT chunkHash, trigramsIndexed FROM ContentChunks WHERE chunkHash IN ({rows}) FOR UPDATE"
+    DB_QUERY_ADD_CHUNKS = (
+        "INSERT INTO ContentChunks "
+        "(chunkHash, chunkContent, codec, trigramsIndexed, refCount) "
+        "VALUES {rows} AS New "
+        "ON DUPLICATE KEY UPDATE refCount = ContentChunks.refCount + New.refCount, "
+        "trigramsIndexed = ContentChunks.trigramsIndexed OR New.trigramsIndexed"
+    )
+    # Trigrams of the lines of files stored in lines, when FileSystemSettings.trigramIndex is on
+    DB_QUERY_ADD_TRIGRAMS = "INSERT IGNORE INTO ContentTrigrams (trigram, chunkHash) VALUES {rows}"
+    DB_QUERY_MARK_CHUNKS_INDEXED = "UPDATE ContentChunks SET trigramsIndexed = TRUE WHERE chunkHash IN ({rows})"
+    # Keyset paginated like GET_FILE_CONTENT
+    DB_QUERY_GET_UNINDEXED_LINES = (
+        f"SELECT chunkHash, {DB_CHUNK_CONTENT} AS chunkContent "
+        "FROM ContentChunks "
+        "WHERE NOT trigramsIndexed AND chunkHash > %(after)s AND EXISTS ("
+        "SELECT * FROM FileContents INNER JOIN RegularFileMetadata USING (fileContentID) "
+        "WHERE FileContents.chunkHash = ContentChunks.chunkHash AND storageEngine = %(engine)s"
+        ") "
+        "ORDER BY chunkHash LIMIT %(limit)s"
+    )
+    DB_QUERY_CLEAR_TRIGRAMS = (
+        "DELETE FROM ContentTrigrams",
+        "UPDATE ContentChunks SET trigramsIndexed = FALSE WHERE trigramsIndexed",
+    )
+
+class FSSettingsQuery(Enum):
+    DB_QUERY_GET_SETTINGS = "SELECT settingName, settingValue FROM FileSystemSettings"
+    DB_QUERY_GET_MAX_PACKET = "SELECT @@SESSION.max_allowed_packet"
+    DB_QUERY_SET_SETTING = "REPLACE INTO FileSystemSettings (settingName, settingValue) VALUES (%(name)s, %(value)s)"
+
 class FSDirectoryQuery(Enum):
     DB_QUERY_ADD_DIRECTORY = (
-        "INSERT INTO Directories (fileID) VALUES (%(fid)s)"
+        "INSERT INTO Directories (fileID) VALUES (%(fid)s)",
+        "UPDATE Files SET fileType = 'd' WHERE fileID = %(fid)s",
     )
     DB_QUERY_DEL_DIRECTORY = (
         "DELETE FROM Directories WHERE fileID = %(fid)s"
     )
     DB_QUERY_ADD_CHILD_FILE = (
         "INSERT INTO ParentDirectory "
-        "(fileID, parentDirectoryFileID) "
-        "VALUES (%(fid)s, %(parent_fid)s)"
+        "(fileID, parentDirectoryFileID, fileName) "
+        "VALUES (%(fid)s, %(parent_fid)s, %(name)s)",
+        "UPDATE Files INNER JOIN Files AS Parent ON Parent.fileID = %(parent_fid)s "
+        "SET Files.fullPath = CONCAT(IF(Parent.fullPath = '/', '', Parent.fullPath), '/', Files.fileName) "
+        "WHERE Files.fileID = %(fid)s",
     )
     DB_QUERY_MOVE_CHILD_FILE = "UPDATE ParentDirectory SET parentDirectoryFileID = %(parent_fid)s WHERE fileID = %(fid)s"
+    DB_QUERY_RENAME_CHILD_FILE = "UPDATE ParentDirectory SET fileName = %(value)s WHERE fileID = %(fid)s"
 
     DB_QUERY_GET_SUBDIRECTORIES = (
-        "SELECT fileID "
+        "SELECT fileID, fileType "
         "FROM ParentDirectory INNER JOIN Files USING (fileID) "
         "INNER JOIN Directories USING (fileID) "
         "WHERE parentDirectoryFileID = %(fid)s AND "
@@ -222,22 +524,84 @@ class FSDirectoryQuery(Enum):
     DB_QUERY_SET_PROP = "UPDATE Directories SET {prop}=%(value)s WHERE fileID = %(fid)s"
 
     DB_QUERY_GET_CHILDREN = (
-        "SELECT fileID "
+        "SELECT fileID, fileType "
         "FROM ParentDirectory INNER JOIN Files USING (fileID) "
         "WHERE parentDirectoryFileID = %(fid)s AND "
         "{include_hidden}"
     )
+    DB_QUERY_GET_CHILD = (
+        "SELECT fileID, fileType "
+        "FROM ParentDirectory INNER JOIN Files USING (fileID) "
+        "WHERE parentDirectoryFileID = %(fid)s AND ParentDirectory.fileName = %(name)s"
+    )
     DB_QUERY_GET_CHILDREN_LIKE = (
-        "SELECT fileID "
+        "SELECT fileID, fileType "
         "FROM ParentDirectory INNER JOIN Files USING (fileID) "
         "WHERE parentDirectoryFileID = %(fid)s AND "
-        "fileName LIKE %(pattern)s AND "
+        "Files.fileName LIKE %(pattern)s AND "
+        "{include_hidden}"
+    )
+    DB_QUERY_SCANDIR = (
+        f"SELECT {DB_STAT_COLUMNS} "
+        f"FROM ParentDirectory INNER JOIN Files ON Files.fileID = ParentDirectory.fileID {DB_STAT_JOINS}"
+        "WHERE parentDirectoryFileID = %(fid)s AND "
+        "Files.fileName LIKE %(pattern)s AND "
         "{include_hidden}"
     )
+    # Matching lines of the subtree's files stored in lines, plus one row with no line for each file
+    # stored in blocks (whose lines only exist once their blocks are put back together)
+    DB_QUERY_GREP_TREE = (
+        f"{DB_SUBTREE}"
+        "SELECT * FROM ("
+        f"SELECT Files.fileID, fullPath, lineNumber, {DB_CHUNK_CONTENT} AS lineContent "
+        f"{DB_SUBTREE_REGULAR_FILES}"
+        "INNER JOIN FileContents USING (fileContentID) "
+        "INNER JOIN ContentChunks USING (chunkHash) "
+        f"WHERE storageEngine = %(lines)s AND REGEXP_LIKE({DB_CHUNK_CONTENT}, %(pattern)s, 'c') "
+        "UNION ALL "
+        "SELECT Files.fileID, fullPath, NULL, NULL "
+        f"{DB_SUBTREE_REGULAR_FILES}"
+        "WHERE storageEngine = %(blocks)s"
+        f") AS Matches ORDER BY {DB_PATH_ORDER}, lineNumber"
+    )
+    # The file and everything below it down to {depth_limit}, filtered by the {filters} find_tree compiled
+    DB_QUERY_FIND_TREE = (
+        "WITH RECURSIVE Subtree (fileID, depth) AS ("
+        "SELECT CAST(%(fid)s AS SIGNED), 0 "
+        "UNION ALL "
+        "SELECT ParentDirectory.fileID, Subtree.depth + 1 "
+        "FROM Subtree INNER JOIN ParentDirectory ON ParentDirectory.parentDirectoryFileID = Subtree.fileID "
+        "INNER JOIN Files ON Files.fileID = ParentDirectory.fileID "
+        "WHERE {include_hidden} AND {depth_limit}"
+        ") "
+        f"SELECT {DB_STAT_COLUMNS} "
+        f"FROM Subtree INNER JOIN Files ON Files.fileID = Subtree.fileID {DB_STAT_JOINS}"
+        "WHERE {filters} "
+        f"ORDER BY {DB_PATH_ORDER}"
+    )
+    # Same as GREP_TREE, with lines narrowed down through the trigram index first
+    DB_QUERY_GREP_INDEXED_TREE = (
+        f"{DB_SUBTREE}"
+        "SELECT * FROM ("
+        f"SELECT Files.fileID, fullPath, lineNumber, {DB_CHUNK_CONTENT} AS lineContent "
+        f"{DB_SUBTREE_REGULAR_FILES}"
+        "INNER JOIN FileContents USING (fileContentID) "
+        "INNER JOIN ContentChunks USING (chunkHash) "
+        "WHERE storageEngine = %(lines)s AND chunkHash IN ("
+        "SELECT chunkHash FROM ContentTrigrams WHERE trigram IN ({rows}) "
+        "GROUP BY chunkHash HAVING COUNT(*) = %(trigram_count)s"
+        f") AND REGEXP_LIKE({DB_CHUNK_CONTENT}, %(pattern)s, 'c') "
+        "UNION ALL "
+        "SELECT Files.fileID, fullPath, NULL, NULL "
+        f"{DB_SUBTREE_REGULAR_FILES}"
+        "WHERE storageEngine = %(blocks)s"
+        f") AS Matches ORDER BY {DB_PATH_ORDER}, lineNumber"
+    )
 
 class FSSymbolicLinkQuery(Enum):
     DB_QUERY_ADD_SYMBOLIC_LINK = (
-        "INSERT INTO SymbolicLinks (fileID, linkToFullPath) VALUES (%(fid)s, %(path)s)"
+        "INSERT INTO SymbolicLinks (fileID, linkToFullPath) VALUES (%(fid)s, %(path)s)",
+        "UPDATE Files SET fileType = 'l' WHERE fileID = %(fid)s",
     )
     DB_QUERY_DEL_SYMBOLIC_LINK = (
         "DELETE FROM SymbolicLinks WHERE fileID = %(fid)s"
@@ -247,43 +611,288 @@ class FSSymbolicLinkQuery(Enum):
     DB_QUERY_SET_PROP = "UPDATE SymbolicLinks SET {prop}=%(value)s WHERE fileID = %(fid)s"
 
 
+class FSTransactionQuery(Enum):
+    DB_QUERY_START_TRANSACTION = "START TRANSACTION"
+    DB_QUERY_SAVEPOINT = "SAVEPOINT {savepoint}"
+    DB_QUERY_RELEASE_SAVEPOINT = "RELEASE SAVEPOINT {savepoint}"
+    DB_QUERY_ROLLBACK_TO_SAVEPOINT = "ROLLBACK TO SAVEPOINT {savepoint}"
+
+
+ResolvedPath = namedtuple("ResolvedPath", ["fid", "deepest_fid", "deepest_path"])
+StatResult = namedtuple("StatResult", [
+    "fid", "type", "name", "permissions",
+    "owner_id", "owner_name", "group_owner_id", "group_owner_name", "author_id",
+    "size", "created_date", "modified_date", "last_opened_date",
+    "num_of_hard_links", "linked_path", "full_path",
+])
+QueryStats = namedtuple("QueryStats", ["count", "seconds"])
+
+
 class FSDatabase:
     ROOTDIR_ID = 1
     ROOTUSER_ID = 0
     NOBODYUSER_ID = 99
+    # Files.fileType codes, a file without one is still a generic File
+    FILE_TYPES = {
+        "d": Directory,
+        "f": RegularFile,
+        "l": SymbolicLink,
+    }
+    # RegularFileMetadata.storageEngine codes
+    LINE_STORAGE = "l"
+    BLOCK_STORAGE = "b"
+    DEFAULT_BLOCK_SIZE = 65536
+    # ContentChunks.codec codes, compressed chunks use the format of MySQL's COMPRESS()
+    NO_CODEC = "n"
+    ZLIB_CODEC = "z"
+    DEFAULT_CONTENT_BATCH_SIZE = 1000
+    # Bytes of blocks fetched per page when reading a file stored in blocks
+    READ_BATCH_BYTES = 1 << 20
+    # Content held in memory at a time when a write is streamed in from an iterable or file object
+    WRITE_BATCH_BYTES = 1 << 20
+    # Trigrams of a grep pattern looked up in the index, any subset of them narrows the search just as safely
+    MAX_PATTERN_TRIGRAMS = 16
+    # Escapes matching a class of characters or a position, ones that aren't listed make grep skip the index
+    REGEX_ESCAPES = set("dDwWsSbBAzZGhHvVRXntrfea")
+    # Seconds a logged path change is kept, far longer than any transaction stays open, so one that
+    # committed late is still counted by every index update that could have missed it
+    PATH_CHANGE_RETENTION = 24 * 60 * 60
+    # Room left in a packet for everything in a batched insert besides its values
+    PACKET_HEADROOM = 4096
+    ROW_OVERHEAD = 32
+    # Bytes the text protocol sends backslash-escaped, each one taking two bytes in the statement
+    ESCAPED_BYTES = (b"\0", b"\n", b"\r", b"\\", b"'", b'"', b"\x1a")
+    # (query enum, format params) -> Statements, rendered on first use
+    _statements = {}
     def __init__(self, db_config_path):
         db_configs = dict()
         with open(db_config_path) as db_config_file:
-            db_configs = yaml.load(db_config_file)
-        self.connection = MySQLConnection.connect(**db_configs)
-        self.connection.sql_mode = [*self.connection.sql_mode.split(","), SQLMode.NO_AUTO_VALUE_ON_ZERO]
-        self.cursor = None
-        self.use_raw = False
-    
+            db_configs = yaml.safe_load(db_config_file)
+        # Pool settings live next to the connection settings but aren't connection arguments
+        pool_size = db_configs.pop("pool_size", FSConnectionPool.DEFAULT_POOL_SIZE)
+        pool_timeout = db_configs.pop("pool_timeout", FSConnectionPool.DEFAULT_TIMEOUT)
+        dentry_cache_size = db_configs.pop("dentry_cache_size", DentryCache.DEFAULT_SIZE)
+        prepared_statements = db_configs.pop("prepared_statements", True)
+        self.content_batch_size = db_configs.pop("content_batch_size", FSDatabase.DEFAULT_CONTENT_BATCH_SIZE)
+        # Commits are managed here, pooled connections only run in a transaction once something writes
+        autocommit = db_configs.pop("autocommit", True)
+        self.pool = FSConnectionPool(db_configs, pool_size=pool_size, timeout=pool_timeout, prepared=prepared_statements)
+        self._scope = PoolScope(autocommit=autocommit)
+        self.query_count = 0
+        # Per query enum: statements sent and time spent in them
+        self.query_stats = {}
+        self._stats_lock = threading.Lock()
+        self._root_verified = False
+        self._settings = None
+        self._max_packet = None
+        self.dentries = DentryCache(dentry_cache_size)
+
+    @property
+    def connection(self):
+        return self._scope.pooled.connection if self._scope.pooled else None
+
+    @property
+    def cursor(self):
+        return self._scope.cursors[-1] if self._scope.cursors else None
+
+    @property
+    def use_raw(self):
+        return self._scope.use_raw
+
+    @use_raw.setter
+    def use_raw(self, use_raw):
+        self._scope.use_raw = use_raw
+
     def __enter__(self):
-        # self.cursor = MySQLCursorNamedTuple(self.connection)
-        params = dict(named_tuple=True) if not self.use_raw else dict(raw=True)
-        self.cursor = self.connection.cursor(**params)
-    
+        # Nested operations on the same thread share the connection but get their own cursor
+        scope = self._scope
+        if scope.pooled is None:
+            scope.pooled = self.pool.checkout()
+        scope.cursors.append(scope.pooled.cursor(len(scope.cursors), raw=scope.use_raw))
+
     def __exit__(self, type, value, traceback):
-        if self.cursor:
-            self.cursor.close()
-        self.cursor = None
-        self.use_raw = False
+        scope = self._scope
+        scope.pooled.release_cursor(scope.cursors.pop())
+        scope.use_raw = False
+        # An open transaction keeps its connection until it ends
+        if scope.cursors or scope.tx_depth:
+            return
+        self._checkin(rollback=type is not None, broken=isinstance(value, (InterfaceError, OperationalError)))
+
+    def _checkin(self, rollback=False, broken=False):
+        scope = self._scope
+        pooled, scope.pooled = scope.pooled, None
+        if rollback and not broken:
+            pooled.connection.rollback()
+            # Entries cached from inside the discarded work may point at files that no longer exist
+            self.dentries.clear()
+        self.pool.checkin(pooled, discard=broken)
+
+    """
+    Transactions
+    """
+    @property
+    def autocommit(self):
+        return self._scope.autocommit
+
+    @autocommit.setter
+    def autocommit(self, autocommit):
+        if autocommit and not self._scope.autocommit:
+            self.commit()
+        self._scope.autocommit = autocommit
+
+    @property
+    def in_transaction(self):
+        """
+        Whether this thread is inside a fs_db.transaction() block
+        """
+        scope = self._scope
+        return scope.tx_depth > (1 if scope.implicit_tx else 0)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups every operation inside the block into a single commit
+
+        Nested blocks become savepoints so an inner failure only undoes the
+        inner block. Any exception leaving a block rolls it back.
+        """
+        savepoint = self._begin()
+        try:
+            yield self
+        except BaseException as e:
+            self._end(savepoint, commit=False, broken=isinstance(e, (InterfaceError, OperationalError)))
+            raise
+        self._end(savepoint, commit=True)
+
+    def parallel_map(self, func, items, workers=1):
+        """
+        Yields func(item) for every item, in the order of items, with up to
+        workers calls running at once. Each worker thread checks out its own
+        pooled connection, so more workers than pool_size connections only
+        wait for one. A caller already holding a connection (inside a
+        transaction, or with autocommit-off work pending) runs them all itself
+        on it, workers would neither see its uncommitted writes nor be sure
+        to get a connection while it keeps one
+        """
+        if workers <= 1 or self._scope.pooled is not None:
+            yield from map(func, items)
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(func, items)
+
+    def commit(self):
+        """
+        Commits the work pending from autocommit-off operations
+        """
+        scope = self._scope
+        if not scope.tx_depth:
+            return
+        if scope.tx_depth > 1 or not scope.implicit_tx:
+            raise ValueError("Cannot commit from inside fs_db.transaction()")
+        scope.implicit_tx = False
+        self._end(None, commit=True)
+
+    def rollback(self):
+        """
+        Discards the work pending from autocommit-off operations
+        """
+        scope = self._scope
+        if not scope.tx_depth:
+            return
+        if scope.tx_depth > 1 or not scope.implicit_tx:
+            raise ValueError("Cannot roll back from inside fs_db.transaction()")
+        scope.implicit_tx = False
+        self._end(None, commit=False)
+
+    def _begin(self):
+        scope = self._scope
+        if scope.pooled is None:
+            scope.pooled = self.pool.checkout()
+        savepoint = f"fs_db_tx_{scope.tx_depth}" if scope.tx_depth else None
+        # Raised first, so leaving the operation below doesn't check the connection back in
+        scope.tx_depth += 1
+        try:
+            with self:
+                if savepoint:
+                    self._execute_queries(FSTransactionQuery.DB_QUERY_SAVEPOINT, {}, {"savepoint": savepoint})
+                elif not self.connection.in_transaction:
+                    # Pooled connections run with autocommit on, work pending from autocommit-off
+                    # operations already started one with its first write
+                    self._execute_queries(FSTransactionQuery.DB_QUERY_START_TRANSACTION, {})
+        except BaseException as e:
+            scope.tx_depth -= 1
+            if not scope.tx_depth and not scope.cursors:
+                self._checkin(rollback=True, broken=isinstance(e, (InterfaceError, OperationalError)))
+            raise
+        return savepoint
+
+    def _end(self, savepoint, commit, broken=False):
+        scope = self._scope
+        scope.tx_depth -= 1
+        ended = False
+        try:
+            if broken:
+                pass
+            elif savepoint:
+                end_query = FSTransactionQuery.DB_QUERY_RELEASE_SAVEPOINT if commit else FSTransactionQuery.DB_QUERY_ROLLBACK_TO_SAVEPOINT
+                with self:
+                    self._execute_queries(end_query, {}, {"savepoint": savepoint})
+            elif commit:
+                self.connection.commit()
+            else:
+                self.connection.rollback()
+            if not commit:
+                self.dentries.clear()
+            ended = True
+        finally:
+            if not scope.tx_depth and not scope.cursors:
+                self._checkin(rollback=not ended, broken=broken)
+
+    def _commit(self):
+        scope = self._scope
+        if scope.tx_depth:
+            return
+        if scope.autocommit:
+            if self.connection.in_transaction:
+                self.connection.commit()
+            return
+        # Hold on to the connection and its pending work until commit()/rollback()
+        scope.implicit_tx = True
+        self._begin()
+
+    @staticmethod
+    def _render(queries_enum, format_params):
+        key = (queries_enum, tuple(sorted(format_params.items())))
+        statements = FSDatabase._statements.get(key)
+        if statements is None:
+            if not isinstance(queries_enum.value, tuple):
+                queries = (queries_enum.value,)
+            else:
+                queries = queries_enum.value
+            statements = FSDatabase._statements[key] = tuple(Statement(query.format(**format_params)) for query in queries)
+        return statements
 
     def _execute_queries(self, queries_enum, params, format_params=None):
         format_params = format_params or {}
-        if not isinstance(queries_enum.value, tuple):
-            queries = (queries_enum.value,)
-        else:
-            queries = queries_enum.value
-        for query in queries:
+        for statement in self._render(queries_enum, format_params):
+            if statement.transactional and not self.connection.in_transaction:
+                # Held until the operation's _commit(), so its writes land all together or not at all
+                self._execute_queries(FSTransactionQuery.DB_QUERY_START_TRANSACTION, {})
+            start = perf_counter()
             try:
-                formatted_query = query.format(**format_params)
-                self.cursor.execute(formatted_query, params)
+                self.cursor.execute(statement, params)
             except Exception:
-                print(">>>", query, params, format_params)
+                print(">>>", statement.sql, params, format_params)
                 raise
+            self._record_query(queries_enum, perf_counter() - start)
+
+    def _record_query(self, queries_enum, seconds):
+        name = f"{type(queries_enum).__name__}.{queries_enum.name}"
+        with self._stats_lock:
+            self.query_count += 1
+            count, total = self.query_stats.get(name, (0, 0.0))
+            self.query_stats[name] = QueryStats(count + 1, total + seconds)
     """
     User/Group Creation
     """
@@ -293,7 +902,7 @@ class FSDatabase:
         with self:
             # Add to group
             self._execute_queries(FSUserQuery.DB_QUERY_ADD_USER, user_params, format_params=format_params)
-            self.connection.commit()
+            self._commit()
             uid = self.cursor.lastrowid
         return uid
 
@@ -302,7 +911,7 @@ class FSDatabase:
         format_params = {"use_gid": "%(gid)s" if gid is not None else "NULL"}
         with self:
             self._execute_queries(FSUserQuery.DB_QUERY_ADD_GROUP, group_params, format_params)
-            self.connection.commit()
+            self._commit()
             gid = self.cursor.lastrowid
         return gid
 
@@ -311,14 +920,14 @@ class FSDatabase:
         with self:
             # Add to group
             self._execute_queries(FSUserQuery.DB_QUERY_ADD_GROUP_MEMBERSHIP, membership_params)
-            self.connection.commit()
+            self._commit()
 
     def revoke_membership(self, user_entity, group_entity):
         membership_params = {"uid": user_entity.uid, "gid": group_entity.gid}
         with self:
             # Remove from group
             self._execute_queries(FSUserQuery.DB_QUERY_REVOKE_GROUP_MEMBERSHIP, membership_params)
-            self.connection.commit()
+            self._commit()
 
     def get_user(self, uid_or_user_name):
         with self:
@@ -362,30 +971,62 @@ class FSDatabase:
     """
     def get_type(self, file_entity):
         params = {"fid": file_entity.fid if isinstance(file_entity, File) else file_entity}
-        format_params = {"prop": "fileID"}
-        with self:
-            self._execute_queries(FSDirectoryQuery.DB_QUERY_GET_PROP, params, format_params)
-            if self.cursor.fetchone():
-                return Directory
-            self._execute_queries(FSRegularFileQuery.DB_QUERY_GET_PROP, params, format_params)
-            if self.cursor.fetchone():
-                return RegularFile
-            self._execute_queries(FSSymbolicLinkQuery.DB_QUERY_GET_PROP, params, format_params)
-            if self.cursor.fetchone():
-                return SymbolicLink
-            self._execute_queries(FSGenericFileQuery.DB_QUERY_GET_PROP, params, format_params)
-            if self.cursor.fetchone():
-                return File
-        return None
+        with self:
+            self._execute_queries(FSGenericFileQuery.DB_QUERY_GET_PROP, params, {"prop": "fileType"})
+            file_type = self.cursor.fetchone()
+            return self._as_file_type(file_type[0]) if file_type else None
+
+    @staticmethod
+    def _as_file_type(file_type_code):
+        return FSDatabase.FILE_TYPES.get(file_type_code, File)
+
+    def stat(self, file_entity):
+        """
+        Returns a StatResult snapshot of the file's metadata from a single query
+        """
+        with self:
+            self._execute_queries(FSGenericFileQuery.DB_QUERY_STAT, {"fid": file_entity.fid})
+            row = self.cursor.fetchone()
+            return self._as_stat(row) if row else None
+
+    def _as_stat(self, row):
+        return StatResult(
+            fid=row.fileID,
+            type=self._as_file_type(row.fileType),
+            name=row.fileName,
+            permissions=PermissionBits(PermissionBits.as_bytes(row.permissionValue)),
+            owner_id=row.ownerID,
+            owner_name=row.ownerName,
+            group_owner_id=row.groupOwnerID,
+            group_owner_name=row.groupOwnerName,
+            author_id=row.authorID,
+            size=row.size,
+            created_date=row.dateCreated,
+            modified_date=row.dateModified,
+            last_opened_date=row.dateLastOpened,
+            num_of_hard_links=row.hardLinkCount,
+            linked_path=row.linkToFullPath,
+            full_path=row.fullPath,
+        )
 
     def find_file_in_dir(self, parent_dir, filename):
-        params = {"fid": parent_dir.fid if isinstance(parent_dir, Directory) else parent_dir, "pattern": filename}
+        parent_fid = parent_dir.fid if isinstance(parent_dir, Directory) else parent_dir
+        dentry = self._lookup_dentry(parent_fid, filename)
+        return dentry.fid
+
+    def _lookup_dentry(self, parent_fid, name):
+        dentry = self.dentries.lookup(parent_fid, name)
+        if dentry is not None:
+            return dentry
         with self:
-            self._execute_queries(FSDirectoryQuery.DB_QUERY_GET_CHILDREN_LIKE, params, {
-                "include_hidden": "TRUE",
-            })
+            self._execute_queries(FSDirectoryQuery.DB_QUERY_GET_CHILD, {"fid": parent_fid, "name": name})
             file_info = self.cursor.fetchone()
-            return file_info.fileID if file_info else None
+        if file_info is None:
+            self.dentries.add_negative(parent_fid, name)
+            return NEGATIVE_DENTRY
+        dentry = Dentry(file_info.fileID, self._as_file_type(file_info.fileType))
+        self.dentries.add(parent_fid, name, *dentry)
+        return dentry
 
     def _resolve_relative_path(self, path):
         ctx_path = PurePosixPath("/")
@@ -400,30 +1041,106 @@ class FSDatabase:
         return ctx_path.joinpath(path)
         
     def find_file(self, path, resolve_link=False):
+        return self.resolve_path(path, resolve_link).fid
+
+    def resolve_path(self, path, resolve_link=False):
+        """
+        Resolves a path to a ResolvedPath(fid, deepest_fid, deepest_path)
+
+        All components are looked up in one statement. Only a symbolic link
+        crossed part way through the path costs extra lookups, to follow the
+        link and resume the walk from its target. When the path does not
+        exist, fid is None and deepest_fid/deepest_path describe the last
+        component that does.
+        """
         path = self._resolve_relative_path(path)
-        if PurePosixPath(path) == PurePosixPath("/"):
+        if not self._root_verified:
             self._verify_root()
-            return FSDatabase.ROOTDIR_ID
-        parent = self.find_file(path.parent, resolve_link=True)
-        if parent is None:
-            return None
-
-        parent_type = self.get_type(parent)
-        if parent_type is not Directory:
-            if parent_type is None:
-                raise ValueError(f"Malformed path. '{path.parent}' does not exist")
-            raise ValueError(f"Malformed path. Path element '{path.parent}' resolved to type '{parent_type}'")
-
-        if path.name == "..":
-            if parent == FSDatabase.ROOTDIR_ID:
-                return FSDatabase.ROOTDIR_ID
-            return parent_type(self, parent).get_parent_directory().fid or FSDatabase.ROOTDIR_ID
-
-        fid = self.find_file_in_dir(parent, path.name)
-
-        while resolve_link and self.get_type(fid) is SymbolicLink:
-            fid = self.resolve_link(SymbolicLink(self, fid)).fid
-        return fid
+            self._root_verified = True
+        fid, file_type = FSDatabase.ROOTDIR_ID, Directory
+        resolved = PurePosixPath("/")
+        components = list(path.parts[1:])
+        links_left = File.MAX_LINK_DEPTH
+        while components:
+            depth, fid, file_type = self._walk(fid, file_type, components)
+            for component in components[:depth]:
+                resolved = resolved.parent if component == ".." else resolved.joinpath(component)
+            components = components[depth:]
+            if not components:
+                break
+            if file_type is not SymbolicLink:
+                if file_type is not Directory:
+                    raise ValueError(f"Malformed path. Path element '{resolved}' resolved to type '{file_type}'")
+                return ResolvedPath(None, fid, resolved)
+            # Crossed a symbolic link, follow it and carry on from wherever it points
+            link_fid = fid
+            fid, file_type, links_left = self._follow_link(fid, links_left, path)
+            if fid is None:
+                return ResolvedPath(None, link_fid, resolved)
+            resolved = PurePosixPath(self.get_full_name(File.from_type(self, fid, file_type)))
+
+        if resolve_link and file_type is SymbolicLink:
+            link_fid = fid
+            fid, _, _ = self._follow_link(fid, links_left, path)
+            if fid is None:
+                return ResolvedPath(None, link_fid, resolved)
+        return ResolvedPath(fid, fid, resolved)
+
+    def _walk(self, fid, file_type, components):
+        """
+        Walks components down from fid as far as they exist, returning
+        (depth, fid, file_type) for the last one reached
+
+        Leading components found in the dentry cache cost no statement, the
+        rest are walked in the DB and cached on the way back
+        """
+        depth = 0
+        while depth < len(components) and file_type is Directory:
+            component = components[depth]
+            if component == "..":
+                parent_fid = fid if fid == FSDatabase.ROOTDIR_ID else self.dentries.parent_of(fid)
+                if parent_fid is None:
+                    break
+                fid, depth = parent_fid, depth + 1
+                continue
+            dentry = self.dentries.lookup(fid, component)
+            if dentry is None:
+                break
+            if dentry is NEGATIVE_DENTRY:
+                return depth, fid, file_type
+            (fid, file_type), depth = dentry, depth + 1
+        if depth == len(components) or file_type is not Directory:
+            return depth, fid, file_type
+
+        remaining = components[depth:]
+        walked = self._walk_path(fid, remaining)
+        for (_, parent_fid, _), (step, child_fid, child_type) in zip(walked, walked[1:]):
+            if remaining[step - 1] != "..":
+                self.dentries.add(parent_fid, remaining[step - 1], child_fid, child_type)
+        step, fid, file_type = walked[-1]
+        if step < len(remaining) and file_type is Directory:
+            self.dentries.add_negative(fid, remaining[step])
+        return depth + step, fid, file_type
+
+    def _walk_path(self, fid, components):
+        with self:
+            self._execute_queries(FSGenericFileQuery.DB_QUERY_WALK_PATH, {
+                "fid": fid,
+                "components": json.dumps(components),
+            })
+            return [(depth, fid, self._as_file_type(file_type)) for depth, fid, file_type in self.cursor]
+
+    def _follow_link(self, fid, links_left, path):
+        file_type = SymbolicLink
+        while file_type is SymbolicLink:
+            if not links_left:
+                raise TooManyLinkError(path)
+            links_left -= 1
+            target = self.resolve_link(SymbolicLink(self, fid))
+            if target is None:
+                return None, None, links_left
+            fid, file_type = target.fid, type(target)
+        return fid, file_type, links_left
 
     def resolve_link(self, link_entity):
         fid = self.find_file(link_entity.linked_path)
@@ -451,7 +1168,7 @@ class FSDatabase:
             group = next(author.get_groups())
 
         path = self._resolve_relative_path(path)
-        params = {"name": path.name, "author": author.uid, "group": group.gid}
+        params = {"name": path.name, "author": author.uid, "group": group.gid, "full_path": None}
         format_params = {}
         if path != PurePosixPath("/"):
             parent_id = self.find_file(path.parent, resolve_link=True)
@@ -462,6 +1179,7 @@ class FSDatabase:
         else:
             format_params["use_fid"] = "%(fid)s"
             params["fid"] = FSDatabase.ROOTDIR_ID
+            params["full_path"] = str(path)
 
         with self:
             # Create file
@@ -471,7 +1189,8 @@ class FSDatabase:
             # Add to folder
             if "parent_fid" in params:
                 self._execute_queries(FSDirectoryQuery.DB_QUERY_ADD_CHILD_FILE, params)
-            self.connection.commit()
+                self.dentries.invalidate(params["parent_fid"], path.name)
+            self._commit()
         return params["fid"]
 
     def add_directory(self, entity):
@@ -480,32 +1199,36 @@ class FSDatabase:
         with self:
             # Add to group
             self._execute_queries(FSDirectoryQuery.DB_QUERY_ADD_DIRECTORY, params)
-            self.connection.commit()
+            self.dentries.invalidate_fid(entity.fid)
+            self._commit()
 
     def add_regular_file(self, entity, contents):
-        params = {"fid": entity.fid}
+        """
+        Creates the file from contents, which can be a string, bytes, a list
+        of lines or any iterable or file object, streamed in bounded batches
+        """
+        params = {"fid": entity.fid, "engine": self.storage_engine, "size": 0, "line_count": 0, "ends_with_newline": True}
         with self:
-            if isinstance(contents, str):
-                contents = contents.splitlines(keepends=True)
-            if not contents:
-                contents.append("")
-            params["size"] = sum(map(len, contents))
             # Add to group
             self._execute_queries(FSRegularFileQuery.DB_QUERY_ADD_REG_FILE_METADATA, params)
             params["file_content_id"] = self.cursor.lastrowid
             self._execute_queries(FSRegularFileQuery.DB_QUERY_ADD_REG_FILE, params)
-            for line_no, content in enumerate(contents, 1):
-                content_params = {"line_no": line_no, "line_content": content}
-                content_params.update(params)
-                self._execute_queries(FSRegularFileQuery.DB_QUERY_ADD_FILE_CONTENT, content_params)
-            self.connection.commit()
+            self.dentries.invalidate_fid(entity.fid)
+            if params["engine"] == FSDatabase.BLOCK_STORAGE:
+                self._write_blocks(params["file_content_id"], contents, stats=params)
+            else:
+                self._write_lines(params["file_content_id"], contents, stats=params)
+            # The stats are counted as the contents stream by, so they are only known once they are all written
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_SET_CONTENT_STATS, params)
+            self._commit()
 
     def add_symbolic_link(self, entity, linked_path):
         params = {"fid": entity.fid, "path": str(linked_path)}
         with self:
             # Add to group
             self._execute_queries(FSSymbolicLinkQuery.DB_QUERY_ADD_SYMBOLIC_LINK, params)
-            self.connection.commit()
+            self.dentries.invalidate_fid(entity.fid)
+            self._commit()
 
     def remove(self, entity):
         file_query_map = {
@@ -521,29 +1244,38 @@ class FSDatabase:
             elif isinstance(entity, File):
                 self._execute_queries(file_query_map[type(entity)], {"fid": entity.fid})
                 self._execute_queries(FSGenericFileQuery.DB_QUERY_DEL_FILE, {"fid": entity.fid})
-            self.connection.commit()
+                self._execute_queries(FSGenericFileQuery.DB_QUERY_LOG_PATH_CHANGE, {"fid": entity.fid})
+                self.dentries.invalidate_fid(entity.fid)
+            self._commit()
 
     def remove_hardlink(self, file_entity):
         with self:
             self._execute_queries(FSRegularFileQuery.DB_QUERY_DEL_HARDLINK, {"fid": file_entity.fid})
             self._execute_queries(FSGenericFileQuery.DB_QUERY_DEL_FILE, {"fid": file_entity.fid})
-            self.connection.commit()
+            self._execute_queries(FSGenericFileQuery.DB_QUERY_LOG_PATH_CHANGE, {"fid": file_entity.fid})
+            self.dentries.invalidate_fid(file_entity.fid)
+            self._commit()
 
     """
     Getters and Setters
     """
 
     def get_full_name(self, entity):
-        full_name = entity.name
-        parent = self.get_parent_dir(entity)
-        grandparent = self.get_parent_dir(parent) if parent else None
-
-        while parent and grandparent:
-            full_name = f"{parent.name}/{full_name}"
-            parent = grandparent
-            grandparent = self.get_parent_dir(parent)
-        
-        return f"/{full_name}"
+        with self:
+            self._execute_queries(FSGenericFileQuery.DB_QUERY_GET_PROP, {
+                "fid": entity.fid,
+            }, format_params={"prop": "fullPath"})
+            full_path = self.cursor.fetchone()
+            return full_path[0] if full_path else None
+
+    def _move_subtree_path(self, entity, new_path):
+        # Must run in the same operation as the rename/move so a failure leaves both undone
+        self._execute_queries(FSGenericFileQuery.DB_QUERY_MOVE_SUBTREE_PATH, {
+            "fid": entity.fid,
+            "old_path": self.get_full_name(entity),
+            "new_path": str(new_path),
+        })
+        self._execute_queries(FSGenericFileQuery.DB_QUERY_LOG_PATH_CHANGE, {"fid": entity.fid})
 
     def get_name(self, entity):
         with self:
@@ -575,11 +1307,20 @@ class FSDatabase:
                     "name": new_name
                 })
             elif isinstance(entity, File):
+                self._move_subtree_path(entity, PurePosixPath(self.get_full_name(entity)).with_name(new_name))
                 self._execute_queries(FSGenericFileQuery.DB_QUERY_SET_PROP, {
                     "fid": entity.fid,
                     "value": new_name
                 }, format_params={"prop": "fileName"})
-            self.connection.commit()
+                self._execute_queries(FSDirectoryQuery.DB_QUERY_RENAME_CHILD_FILE, {
+                    "fid": entity.fid,
+                    "value": new_name
+                })
+                self.dentries.invalidate_fid(entity.fid)
+                parent = self.get_parent_dir(entity)
+                if parent:
+                    self.dentries.invalidate(parent.fid, new_name)
+            self._commit()
 
     def get_owner(self, file_entity):
         uid = None
@@ -597,7 +1338,7 @@ class FSDatabase:
                 "fid": file_entity.fid,
                 "value": new_owner.uid
             }, format_params={"prop": "ownerID"})
-            self.connection.commit()
+            self._commit()
 
     def get_group_owner(self, file_entity):
         gid = None
@@ -615,7 +1356,7 @@ class FSDatabase:
                 "fid": file_entity.fid,
                 "value": new_owner.gid
             }, format_params={"prop": "groupOwnerID"})
-            self.connection.commit()
+            self._commit()
 
     def get_permissions(self, file_entity):
         self.use_raw = True
@@ -632,7 +1373,7 @@ class FSDatabase:
                 "fid": file_entity.fid,
                 "value": PermissionBits.as_bytes(permission_bits)
             }, format_params={"prop": "permissionBits"})
-            self.connection.commit()
+            self._commit()
 
     def get_created_date(self, file_entity):
         with self:
@@ -678,7 +1419,7 @@ class FSDatabase:
                 "fid": file_entity.fid,
                 "value": datetime.now()
             }, format_params={"prop": "dateModified",})
-            self.connection.commit()
+            self._commit()
 
     def get_accessed_date(self, file_entity):
         query_map = {
@@ -708,7 +1449,7 @@ class FSDatabase:
                 "fid": file_entity.fid,
                 "value": datetime.now()
             }, format_params={"prop": "dateLastOpened"})
-            self.connection.commit()
+            self._commit()
 
     def get_parent_dir(self, file_entity):
         with self:
@@ -720,11 +1461,14 @@ class FSDatabase:
 
     def set_parent_dir(self, file_entity, parent_dir):
         with self:
+            self._move_subtree_path(file_entity, PurePosixPath(self.get_full_name(parent_dir), self.get_name(file_entity)))
             self._execute_queries(FSDirectoryQuery.DB_QUERY_MOVE_CHILD_FILE, {
                 "fid": file_entity.fid,
                 "parent_fid": parent_dir.fid
             })
-            self.connection.commit()
+            self.dentries.invalidate_fid(file_entity.fid)
+            self.dentries.invalidate(parent_dir.fid, file_entity.name)
+            self._commit()
 
     def get_linked_path(self, link_entity):
         with self:
@@ -740,7 +1484,7 @@ class FSDatabase:
                 "fid": link_entity.fid,
                 "value": new_path,
             }, format_params={"prop": "linkToFullPath"})
-            self.connection.commit()
+            self._commit()
 
     def get_size(self, file_entity):
         if file_entity.type is not RegularFile:
@@ -757,105 +1501,1037 @@ class FSDatabase:
     """
     def get_children(self, directory_entity, include_hidden=False):
         params = {"fid": directory_entity.fid}
-        format_params = {"include_hidden": "TRUE" if  include_hidden else "fileName NOT LIKE '.%'"}
+        format_params = {"include_hidden": "TRUE" if  include_hidden else "Files.fileName NOT LIKE '.%'"}
         files = []
         with self:
             self._execute_queries(FSDirectoryQuery.DB_QUERY_GET_CHILDREN, params, format_params)
-            files = [fid for (fid,) in self.cursor]
-        for fid in files:
-            yield File(self, fid)
+            files = [(fid, file_type) for (fid, file_type) in self.cursor]
+        for fid, file_type in files:
+            yield File.from_type(self, fid, self._as_file_type(file_type))
 
     def get_children_like(self, directory_entity, pattern, search_subdirs=False, include_hidden=False):
         params = {"fid": directory_entity.fid, "pattern": pattern}
-        format_params = {"include_hidden": "TRUE" if  include_hidden else "fileName NOT LIKE '.%'"}
+        format_params = {"include_hidden": "TRUE" if  include_hidden else "Files.fileName NOT LIKE '.%'"}
         files = []
         with self:
             self._execute_queries(FSDirectoryQuery.DB_QUERY_GET_CHILDREN_LIKE, params, format_params)
-            files = [fid for (fid,) in self.cursor]
-        for fid in files:
-            yield File(self, fid)
+            files = [(fid, file_type) for (fid, file_type) in self.cursor]
+        for fid, file_type in files:
+            yield File.from_type(self, fid, self._as_file_type(file_type))
         if search_subdirs:
             subdirs = []
             with self:
                 self._execute_queries(FSDirectoryQuery.DB_QUERY_GET_SUBDIRECTORIES, params, format_params)
-                subdirs = [fid for (fid,) in self.cursor]
+                subdirs = [fid for (fid, _) in self.cursor]
             for subdir in subdirs:
-                yield from self.get_children_like(Directory(self, subdir), pattern, search_subdirs, include_hidden)
+                yield from self.get_children_like(File.from_type(self, subdir, Directory), pattern, search_subdirs, include_hidden)
+
+    def grep_tree(self, directory_entity, pattern, include_hidden=False):
+        """
+        Streams (full path, line number, line) for every line matching the
+        regex in the files below the directory, in path order. The whole
+        subtree is searched by one query, read as it arrives (see _stream_rows)
+        """
+        params = {
+            "fid": directory_entity.fid,
+            "pattern": pattern,
+            "lines": FSDatabase.LINE_STORAGE,
+            "blocks": FSDatabase.BLOCK_STORAGE,
+        }
+        format_params = {"include_hidden": "TRUE" if include_hidden else "Files.fileName NOT LIKE '.%'"}
+        query = FSDirectoryQuery.DB_QUERY_GREP_TREE
+        trigrams = self._pattern_trigrams(pattern) if self.trigram_index else []
+        if trigrams:
+            query = FSDirectoryQuery.DB_QUERY_GREP_INDEXED_TREE
+            params["trigram_count"] = len(trigrams)
+            params, format_params["rows"] = self._batch_params([(trigram,) for trigram in trigrams], params)
+        streaming = rows = self._stream_rows(query, params, format_params)
+        try:
+            while True:
+                row = next(rows, None)
+                if row is None:
+                    break
+                fid, full_path, line_no, line_content = row
+                if line_no is not None:
+                    yield full_path, line_no, bytes(line_content).decode("utf-8")
+                    continue
+                if rows is streaming:
+                    # Files stored in blocks are searched through another connection, which may have
+                    # to be the streaming one, so the rest of the result is read in to give it back
+                    rows = iter(list(streaming))
+                for line_no, line_content in self.find_in_file(File.from_type(self, fid, RegularFile), pattern):
+                    yield full_path, line_no, line_content
+        finally:
+            # Gives the connection back when the caller stops early
+            streaming.close()
+
+    def find_tree(self, file_entity, name=None, file_type=None, owner_id=None, group_id=None, empty=False,
+                  min_depth=0, max_depth=None, include_hidden=False):
+        """
+        Streams the StatResult of the file and everything below it that
+        matches all the given predicates, in path order. name is a LIKE
+        pattern and file_type a Files.fileType code. The predicates are
+        compiled into the WHERE clause of a single query over the subtree,
+        which also brings back everything `ls -l` shows. It is streamed like
+        grep_tree (see _stream_rows)
+        """
+        params = {
+            "fid": file_entity.fid,
+            "name": name,
+            "file_type": file_type,
+            "owner_id": owner_id,
+            "group_id": group_id,
+            "min_depth": min_depth,
+            "max_depth": max_depth,
+        }
+        predicates = {"name": name, "file_type": file_type, "owner_id": owner_id, "group_id": group_id, "empty": empty or None}
+        filters = ["Subtree.depth >= %(min_depth)s"]
+        filters.extend(DB_FIND_FILTERS[predicate] for predicate, value in predicates.items() if value is not None)
+        format_params = {
+            "include_hidden": "TRUE" if include_hidden else "Files.fileName NOT LIKE '.%'",
+            "depth_limit": "TRUE" if max_depth is None else "Subtree.depth < %(max_depth)s",
+            "filters": " AND ".join(filters),
+        }
+        for row in self._stream_rows(FSDirectoryQuery.DB_QUERY_FIND_TREE, params, format_params):
+            yield self._as_stat(row)
+
+    def prune_path_changes(self):
+        """
+        Drops the logged path changes older than PATH_CHANGE_RETENTION, for a
+        copy of the paths about to be taken from scratch. Copies taken before
+        see the count go down and are taken again too
+        """
+        with self:
+            self._execute_queries(FSGenericFileQuery.DB_QUERY_PRUNE_PATH_CHANGES, {"seconds": FSDatabase.PATH_CHANGE_RETENTION})
+            self._commit()
+
+    def get_path_index_state(self, after_fid=0):
+        """
+        (last path change, path changes, highest fid, file count, files
+        created after after_fid) for deciding whether a copy of the paths
+        taken at after_fid can be brought up to date by adding the newer
+        files alone
+        """
+        with self:
+            self._execute_queries(FSGenericFileQuery.DB_QUERY_GET_PATH_INDEX_STATE, {"after_fid": after_fid})
+            return tuple(int(value) for value in self.cursor.fetchone())
+
+    def stream_paths(self, after_fid=0, max_fid=None):
+        """
+        Streams the full path of every file with after_fid < fid <= max_fid,
+        sorted by their UTF-8 bytes
+        """
+        params = {"after_fid": after_fid, "max_fid": max_fid if max_fid is not None else self.get_path_index_state()[2]}
+        for (full_path,) in self._stream_rows(FSGenericFileQuery.DB_QUERY_GET_PATHS, params):
+            yield full_path
+
+    def _stream_rows(self, queries_enum, params, format_params=None):
+        """
+        Yields the rows of the query as the server sends them, read unbuffered
+        on a connection of its own. Operations run before the rows are all
+        read need a second connection, so with a pool_size of 1 the rest has
+        to be read in first. A thread already holding a connection (inside a
+        transaction, or with autocommit-off work pending) reads them in full
+        on that one instead, so it sees its own uncommitted writes and never
+        waits on a pool it is keeping busy itself
+        """
+        if self._scope.pooled is not None:
+            with self:
+                self._execute_queries(queries_enum, params, format_params)
+                rows = self.cursor.fetchall()
+            yield from rows
+            return
+        pooled = self.pool.checkout()
+        cursor, finished = pooled.connection.cursor(buffered=False, named_tuple=True), False
+        try:
+            for statement in self._render(queries_enum, format_params or {}):
+                start = perf_counter()
+                cursor.execute(statement.sql, params)
+                self._record_query(queries_enum, perf_counter() - start)
+            yield from cursor
+            finished = True
+        finally:
+            # A connection left with half a result read can't run anything else
+            if finished:
+                cursor.close()
+            self.pool.checkin(pooled, discard=not finished)
+
+    def scandir(self, directory_entity, include_hidden=False, pattern="%", search_subdirs=False):
+        """
+        Lists the StatResult of every child matching the LIKE pattern, with one statement per directory
+        """
+        params = {"fid": directory_entity.fid, "pattern": pattern}
+        format_params = {"include_hidden": "TRUE" if  include_hidden else "Files.fileName NOT LIKE '.%'"}
+        with self:
+            self._execute_queries(FSDirectoryQuery.DB_QUERY_SCANDIR, params, format_params)
+            stats = [self._as_stat(row) for row in self.cursor]
+        yield from stats
+        if search_subdirs:
+            subdirs = []
+            with self:
+                self._execute_queries(FSDirectoryQuery.DB_QUERY_GET_SUBDIRECTORIES, params, format_params)
+                subdirs = [fid for (fid, _) in self.cursor]
+            for subdir in subdirs:
+                yield from self.scandir(File.from_type(self, subdir, Directory), include_hidden, pattern, search_subdirs)
 
     def write_content(self, file_entity, new_content):
+        """
+        Replaces the file's contents with new_content, which is streamed the same way as by add_regular_file
+        """
         params = {"fid": file_entity.fid}
         with self:
-            self._execute_queries(FSRegularFileQuery.DB_QUERY_DELETE_ALL_FILE_CONTENT, params)
-            contents = new_content
-            if isinstance(contents, str):
-                contents = contents.splitlines(keepends=True)
-            if not contents:
-                contents.append("")
-            self._execute_queries(FSRegularFileQuery.DB_QUERY_SET_PROP, {
-                "fid": file_entity.fid,
-                "value": sum(map(len, contents)),
-            }, format_params={"prop": "size"})
-            for line_no, content in enumerate(contents, 1):
-                content_params = {"line_no": line_no, "line_content": content}
-                content_params.update(params)
-                self._execute_queries(FSRegularFileQuery.DB_QUERY_ADD_FILE_CONTENT, content_params)
-            self.connection.commit()
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_GET_CONTENT_STATS, params)
+            content_stats = self.cursor.fetchone()
+            params["file_content_id"] = content_stats.fileContentID
+            if content_stats.storageEngine == FSDatabase.BLOCK_STORAGE:
+                line_index = []
+                self._sync_rows(params["file_content_id"], self._block_rows(params["file_content_id"], new_content, line_index, params))
+                self._execute_queries(FSRegularFileQuery.DB_QUERY_DELETE_LINE_INDEX, params)
+                self._insert_rows(FSBlockFileQuery.DB_QUERY_ADD_LINE_INDEXES, line_index)
+            else:
+                self._sync_rows(params["file_content_id"], self._line_rows(new_content, params), self.trigram_index)
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_SET_CONTENT_STATS, params)
+            self._commit()
 
     def append_content(self, file_entity, new_content):
-        params = {"fid": file_entity.fid}
+        """
+        Appends to the file in constant time, using the line count and trailing newline kept on its metadata
+        """
         with self:
-            self._execute_queries(FSRegularFileQuery.DB_QUERY_GET_LAST_LINE, params)
-            start_length, start_contents = 1, ""
-            last_line = self.cursor.fetchone()
-            start_length, start_contents = last_line if last_line else (start_length, start_contents)
-            contents = new_content
-            if isinstance(contents, str):
-                contents = contents.splitlines(keepends=True)
-            if not contents:
-                contents.append("")
-            if start_contents.endswith("\n"):
-                contents.insert(0, start_contents)
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_GET_CONTENT_STATS, {"fid": file_entity.fid})
+            content_stats = self.cursor.fetchone()
+            if content_stats.storageEngine == FSDatabase.BLOCK_STORAGE:
+                self._append_blocks(file_entity, content_stats, self._as_bytes(new_content))
             else:
-                contents[0] = start_contents + contents[0]
-            self._execute_queries(FSRegularFileQuery.DB_QUERY_INCREMENT_PROP, {
-                "fid": file_entity.fid,
-                "value": sum(map(len, contents)),
-            }, format_params={"prop": "size"})
-            for line_no, content in enumerate(contents, start_length):
-                content_params = {"line_no": line_no, "line_content": content}
-                content_params.update(params)
-                self._execute_queries(FSRegularFileQuery.DB_QUERY_ADD_FILE_CONTENT, content_params)
-            self.connection.commit()
+                self._append_lines(content_stats, new_content)
+            self._commit()
+
+    def splice_content(self, file_entity, offset, new_content):
+        """
+        Overwrites the file's bytes from offset (inside the file) on with
+        new_content, growing the file if it runs past the end. Only the rows
+        the written range falls in are read and rewritten, along with the
+        line right after it for files stored in lines, since the write may
+        have joined or split lines there
+        """
+        new_content = self._as_bytes(new_content)
+        with self:
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_GET_CONTENT_STATS, {"fid": file_entity.fid})
+            content_stats = self.cursor.fetchone()
+            if not 0 <= offset < content_stats.size:
+                raise ValueError(f"Offset {offset} is outside the file, append past its end instead")
+            if not new_content:
+                return
+            file_content_id = content_stats.fileContentID
+            blocks = content_stats.storageEngine == FSDatabase.BLOCK_STORAGE
+            end = offset + len(new_content)
+            rows = self._rows_in_range(file_content_id, offset, end if blocks else end + 1)
+            first_row, region_offset, first_line, _ = rows[0]
+            last_row = rows[-1][0]
+            old = b"".join(content for *_, content in rows)
+            spliced = old[:offset - region_offset] + new_content + old[end - region_offset:]
+            at_end = region_offset + len(old) >= content_stats.size
+            params = {"file_content_id": file_content_id, "from_row": first_row, "to_row": last_row, "after": last_row}
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_DELETE_ROW_RANGE, params)
+            if blocks:
+                # Blocks keep their boundaries, only the lines the later ones start in can move
+                params["shift"] = spliced.count(b"\n") - old.count(b"\n")
+                if params["shift"] and not at_end:
+                    self._execute_queries(FSBlockFileQuery.DB_QUERY_SHIFT_LINE_INDEX, params)
+                self._write_blocks(file_content_id, spliced, first_row, first_line, region_offset)
+                newlines = content_stats.lineCount - (not content_stats.endsWithNewline) + params["shift"]
+            else:
+                new_rows = list(self._line_rows(spliced, None, first_row, region_offset))
+                params["shift"] = len(new_rows) - (last_row - first_row + 1)
+                if params["shift"] and not at_end:
+                    self._execute_queries(FSRegularFileQuery.DB_QUERY_SHIFT_ROWS, params, {
+                        "order": "DESC" if params["shift"] > 0 else "ASC",
+                    })
+                self._write_rows(file_content_id, new_rows, self.trigram_index)
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_DROP_UNUSED_CHUNKS, {})
+            ends_with_newline = spliced.endswith(b"\n") if at_end else content_stats.endsWithNewline
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_SET_CONTENT_STATS, {
+                "file_content_id": file_content_id,
+                "size": max(content_stats.size, end),
+                # Every row is a line for files stored in lines
+                "line_count": newlines + (not ends_with_newline) if blocks else content_stats.lineCount + params["shift"],
+                "ends_with_newline": ends_with_newline,
+            })
+            self._commit()
+
+    def truncate_content(self, file_entity, size):
+        """
+        Cuts the file down to its first size bytes, deleting the rows past
+        them and trimming the one the new end falls in
+        """
+        with self:
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_GET_CONTENT_STATS, {"fid": file_entity.fid})
+            content_stats = self.cursor.fetchone()
+            if size >= content_stats.size:
+                return
+            if size <= 0:
+                self.write_content(file_entity, b"")
+                return
+            file_content_id = content_stats.fileContentID
+            row_no, byte_offset, first_line, content = self._rows_in_range(file_content_id, size - 1, size)[0]
+            kept = content[:size - byte_offset]
+            params = {"file_content_id": file_content_id, "from_row": row_no}
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_DELETE_TRAILING_CONTENT, params)
+            ends_with_newline = kept.endswith(b"\n")
+            if content_stats.storageEngine == FSDatabase.BLOCK_STORAGE:
+                self._execute_queries(FSBlockFileQuery.DB_QUERY_DELETE_TRAILING_LINE_INDEX, params)
+                self._write_blocks(file_content_id, kept, row_no, first_line, byte_offset)
+                line_count = first_line - 1 + kept.count(b"\n") + (not ends_with_newline)
+            else:
+                self._write_lines(file_content_id, [kept], row_no, byte_offset)
+                line_count = row_no
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_SET_CONTENT_STATS, {
+                "file_content_id": file_content_id,
+                "size": size,
+                "line_count": line_count,
+                "ends_with_newline": ends_with_newline,
+            })
+            self._commit()
 
-    def readlines(self, file_entity, decoded=True):
+    def _rows_in_range(self, file_content_id, offset, end):
+        """
+        Returns (row number, byte offset, line it starts in, content) for the rows overlapping [offset, end)
+        """
         self.use_raw = True
-        contents = []
         with self:
-            self._execute_queries(FSRegularFileQuery.DB_QUERY_GET_FILE_CONTENT, {
-                "fid": file_entity.fid
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_GET_ROWS_IN_RANGE, {
+                "file_content_id": file_content_id,
+                "offset": offset,
+                "end": end,
             })
-            for _, line_content in self.cursor:
-                if decoded:
-                    line_content = line_content.decode("utf-8")
-                contents.append(line_content)
-        yield from contents
+            rows = self.cursor.fetchall()
+        return [
+            (int(row_no), int(byte_offset), int(first_line), bytes(self._decompress(content, codec)))
+            for row_no, byte_offset, first_line, content, codec in rows
+        ]
+
+    def _append_lines(self, content_stats, new_content):
+        contents = new_content.splitlines(keepends=True) if isinstance(new_content, (str, bytes, bytearray)) else list(new_content)
+        if not contents:
+            return
+        params = {"file_content_id": content_stats.fileContentID}
+        line_no, byte_offset = content_stats.lineCount + 1, content_stats.size
+        if content_stats.lineCount and not content_stats.endsWithNewline:
+            # The last line is still open, the first new line finishes it
+            line_no -= 1
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_GET_LINE, {**params, "line_no": line_no})
+            byte_offset, last_line, codec = self.cursor.fetchone()
+            last_line = self._decompress(last_line, codec)
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_DELETE_TRAILING_CONTENT, {**params, "from_row": line_no})
+            if isinstance(contents[0], str) and not isinstance(last_line, str):
+                last_line = bytes(last_line).decode("utf-8")
+            elif not isinstance(contents[0], str):
+                last_line = last_line.encode("utf-8") if isinstance(last_line, str) else bytes(last_line)
+            contents[0] = last_line + contents[0]
+        params["size"] = byte_offset + sum(map(self._byte_length, contents))
+        params["line_count"] = line_no + len(contents) - 1
+        params["ends_with_newline"] = self._ends_with_newline(contents[-1])
+        self._write_lines(params["file_content_id"], contents, line_no, byte_offset)
+        self._execute_queries(FSRegularFileQuery.DB_QUERY_SET_CONTENT_STATS, params)
+
+    def readlines(self, file_entity, start_line=1, count=None, decoded=True):
+        """
+        Streams count lines (all the rest when None) starting from start_line,
+        holding at most one page of rows in memory
+        """
+        if start_line < 1:
+            raise ValueError("Lines are numbered from 1")
+        if count is not None and count < 1:
+            return
+        with self:
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_GET_PROP, {
+                "fid": file_entity.fid,
+            }, format_params={"prop": "fileContentID, storageEngine"})
+            content = self.cursor.fetchone()
+        if content is None:
+            return
+        file_content_id, engine = content
+        if engine == FSDatabase.BLOCK_STORAGE:
+            yield from self._read_block_lines(file_content_id, decoded, start_line, count)
+            return
+        page_size = self.content_batch_size if count is None else min(self.content_batch_size, count)
+        for line_content in islice(self._read_rows(file_content_id, page_size, start_line - 1), count):
+            yield line_content.decode("utf-8") if decoded else line_content
+
+    def read_content(self, file_entity, offset=0, length=None):
+        """
+        Returns length bytes (all the rest when None) of the file starting at
+        offset, fetching only the rows that hold them
+        """
+        if offset < 0 or (length is not None and length < 0):
+            raise ValueError("Offset and length can't be negative")
+        with self:
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_GET_PROP, {
+                "fid": file_entity.fid,
+            }, format_params={"prop": "fileContentID, size"})
+            content = self.cursor.fetchone()
+        if content is None:
+            return b""
+        file_content_id, size = content
+        end = size if length is None else min(size, offset + length)
+        if offset >= end:
+            return b""
+        self.use_raw = True
+        with self:
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_GET_BYTE_RANGE, {
+                "file_content_id": file_content_id,
+                "offset": offset,
+                "end": end,
+            })
+            rows = self.cursor.fetchall()
+        first_offset = int(rows[0][0])
+        contents = b"".join(bytes(self._decompress(row_content, codec)) for _, row_content, codec in rows)
+        return contents[offset - first_offset:end - first_offset]
+
+    def _read_rows(self, file_content_id, page_size, after=0):
+        query = FSRegularFileQuery.DB_QUERY_GET_FILE_CONTENT
+        for _, content, codec in self._paged_rows(query, file_content_id, page_size, after):
+            yield self._decompress(content, codec)
+
+    def _paged_rows(self, queries_enum, file_content_id, page_size, after=0):
+        """
+        Yields the file's rows after row number `after` in order, a page at a
+        time. The connection is only held while a page is fetched, so a
+        consumer that is slow or stops early never keeps a cursor open
+        """
+        params = {"file_content_id": file_content_id, "after": after, "limit": page_size}
+        while True:
+            self.use_raw = True
+            with self:
+                self._execute_queries(queries_enum, params)
+                rows = self.cursor.fetchall()
+            yield from rows
+            if len(rows) < page_size:
+                return
+            params["after"] = int(rows[-1][0])
 
     def check_if_utility(self, file_entity):
+        query_type = FSRegularFileQuery
+        if self.get_storage_engine(file_entity) == FSDatabase.BLOCK_STORAGE:
+            query_type = FSBlockFileQuery
         with self:
-            self._execute_queries(FSRegularFileQuery.DB_QUERY_CHECK_FOR_BANG, {
+            self._execute_queries(query_type.DB_QUERY_CHECK_FOR_BANG, {
                 "fid": file_entity.fid
             })
             found = self.cursor.fetchone()
             return bool(found)
 
     def find_in_file(self, file_entity, pattern):
+        if self.get_storage_engine(file_entity) == FSDatabase.BLOCK_STORAGE:
+            # Lines can straddle blocks, so they are matched once put back together
+            regex = re.compile(pattern)
+            file_content_id = self._get_file_content_id(file_entity)
+            for line_no, line_content in enumerate(self._read_block_lines(file_content_id, True), 1):
+                if regex.search(line_content.rstrip("\n")):
+                    yield line_no, line_content
+            return
+        matches = []
+        params = {"fid": file_entity.fid, "pattern": pattern}
+        trigrams = self._pattern_trigrams(pattern) if self.trigram_index else []
+        with self:
+            if trigrams:
+                params["trigram_count"] = len(trigrams)
+                self._execute_batch(FSRegularFileQuery.DB_QUERY_FIND_IN_INDEXED_FILE_CONTENT, [(trigram,) for trigram in trigrams], params)
+            else:
+                self._execute_queries(FSRegularFileQuery.DB_QUERY_FIND_IN_FILE_CONTENT, params)
+            matches = [(line_no, line_content) for line_no, line_content in self.cursor]
+        yield from matches
+
+    """
+    Content writes
+    """
+    def _get_file_content_id(self, file_entity):
         with self:
-            self._execute_queries(FSRegularFileQuery.DB_QUERY_FIND_IN_FILE_CONTENT, {
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_GET_PROP, {
                 "fid": file_entity.fid,
-                "pattern": pattern
+            }, format_params={"prop": "fileContentID"})
+            file_content_id = self.cursor.fetchone()
+            return file_content_id[0] if file_content_id else None
+
+    @staticmethod
+    def _byte_length(line):
+        return len(line.encode("utf-8")) if isinstance(line, str) else len(line)
+
+    @staticmethod
+    def _ends_with_newline(line):
+        return line.endswith("\n" if isinstance(line, str) else b"\n")
+
+    def _write_lines(self, file_content_id, contents, line_no=1, byte_offset=0, stats=None):
+        self._write_rows(file_content_id, self._line_rows(contents, stats, line_no, byte_offset), self.trigram_index)
+
+    def _line_rows(self, contents, stats=None, line_no=1, byte_offset=0):
+        """
+        Yields the (line number, byte offset, line) rows of contents, which
+        is split into lines when it is a string and iterated over otherwise
+        (a file object yields its lines). The totals are left in stats
+        """
+        if isinstance(contents, (str, bytes, bytearray)):
+            contents = contents.splitlines(keepends=True)
+        first_line, content = line_no, ""
+        for content in contents:
+            yield line_no, byte_offset, content
+            line_no += 1
+            byte_offset += self._byte_length(content)
+        if line_no == first_line:
+            # An empty file is still stored as a single empty line
+            yield line_no, byte_offset, content
+            line_no += 1
+        if stats is not None:
+            stats.update(size=byte_offset, line_count=line_no - 1, ends_with_newline=self._ends_with_newline(content))
+
+    @staticmethod
+    def _hash_rows(rows):
+        """
+        Adds the bytes of each (row number, byte offset, content) row's content and their SHA-256
+        """
+        hashed = []
+        for row_no, byte_offset, content in rows:
+            content = content.encode("utf-8") if isinstance(content, str) else bytes(content)
+            hashed.append((row_no, byte_offset, content, hashlib.sha256(content).digest()))
+        return hashed
+
+    def _write_rows(self, file_content_id, rows, trigrams=False):
+        """
+        Stores the file's (row number, byte offset, content) rows, a batch at a time
+        """
+        for batch in self._stream_batches(rows):
+            hashed = self._hash_rows(batch)
+            self._add_chunks(hashed, trigrams)
+            self._insert_rows(FSRegularFileQuery.DB_QUERY_ADD_FILE_CONTENTS, [
+                (file_content_id, row_no, byte_offset, chunk_hash) for row_no, byte_offset, _, chunk_hash in hashed
+            ])
+
+    def _stream_batches(self, rows):
+        """
+        Groups rows into lists of up to content_batch_size rows and about WRITE_BATCH_BYTES of content
+        """
+        batch, batch_bytes = [], 0
+        for row in rows:
+            batch.append(row)
+            batch_bytes += self._byte_length(row[2])
+            if len(batch) == self.content_batch_size or batch_bytes >= FSDatabase.WRITE_BATCH_BYTES:
+                yield batch
+                batch, batch_bytes = [], 0
+        if batch:
+            yield batch
+
+    def _sync_rows(self, file_content_id, rows, trigrams=False):
+        """
+        Makes the file's stored rows match rows, comparing hashes with the
+        stored version so only the rows that changed, were added or were cut
+        off are written. Rows are compared a batch at a time against the
+        stored rows with the same numbers. A row whose content is unchanged is
+        kept even if it now starts elsewhere, each run of those moved by the
+        same amount gets its offsets fixed by one statement
+        """
+        last_row = 0
+        # Kept rows waiting for their offsets to move: [from_row, to_row, shift]
+        moved = None
+        query = FSRegularFileQuery.DB_QUERY_GET_ROW_HASHES
+        for batch in self._stream_batches(rows):
+            hashed = self._hash_rows(batch)
+            first_row, last_row = hashed[0][0], hashed[-1][0]
+            unchanged, overwritten = set(), []
+            stored = self._paged_rows(query, file_content_id, len(hashed), after=first_row - 1)
+            for row_no, byte_offset, chunk_hash in islice(stored, len(hashed)):
+                row_no = int(row_no)
+                if row_no > last_row:
+                    break
+                _, new_offset, _, new_hash = hashed[row_no - first_row]
+                if bytes(chunk_hash) != new_hash:
+                    overwritten.append((row_no,))
+                    continue
+                unchanged.add(row_no)
+                shift = new_offset - int(byte_offset)
+                if moved and moved[1] == row_no - 1 and moved[2] == shift:
+                    moved[1] = row_no
+                else:
+                    self._shift_offsets(file_content_id, moved)
+                    moved = [row_no, row_no, shift]
+            changed = [row for row in hashed if row[0] not in unchanged]
+            # New chunks are taken before old ones are given back, so content that only moved is never sent again
+            self._add_chunks(changed, trigrams)
+            for release_batch in self._batch_rows(overwritten):
+                self._execute_batch(FSRegularFileQuery.DB_QUERY_RELEASE_ROWS, release_batch, {"file_content_id": file_content_id})
+            self._insert_rows(FSRegularFileQuery.DB_QUERY_ADD_FILE_CONTENTS, [
+                (file_content_id, row_no, byte_offset, chunk_hash) for row_no, byte_offset, _, chunk_hash in changed
+            ])
+        self._shift_offsets(file_content_id, moved)
+        self._execute_queries(FSRegularFileQuery.DB_QUERY_DELETE_TRAILING_CONTENT, {
+            "file_content_id": file_content_id,
+            "from_row": last_row + 1,
+        })
+
+    def _shift_offsets(self, file_content_id, moved):
+        # A run never holds a rewritten row, so it doesn't matter whether those were written yet
+        if moved and moved[2]:
+            from_row, to_row, shift = moved
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_SHIFT_OFFSETS, {
+                "file_content_id": file_content_id,
+                "from_row": from_row,
+                "to_row": to_row,
+                "shift": shift,
+            })
+
+    def _add_chunks(self, hashed_rows, trigrams=False):
+        """
+        Takes a reference to the chunk of every hashed row, sending each
+        distinct content once and only when no file holds it yet. With
+        trigrams, chunks not in the trigram index yet are added to it
+        """
+        chunks = {}
+        compress_threshold = self.compress_threshold
+        for _, _, content, chunk_hash in hashed_rows:
+            chunks.setdefault(chunk_hash, [content, 0])[1] += 1
+        existing = {}
+        for batch in self._batch_rows([(chunk_hash,) for chunk_hash in chunks]):
+            self._execute_batch(FSContentChunkQuery.DB_QUERY_FIND_EXISTING_CHUNKS, batch)
+            existing.update((bytes(chunk_hash), bool(indexed)) for chunk_hash, indexed in self.cursor)
+        # Chunks already stored only get their refCount bumped
+        self._insert_rows(FSContentChunkQuery.DB_QUERY_ADD_CHUNKS, [
+            (chunk_hash, b"", FSDatabase.NO_CODEC, trigrams, uses) if chunk_hash in existing else
+            (chunk_hash, *self._compress(content, compress_threshold), trigrams, uses)
+            for chunk_hash, (content, uses) in chunks.items()
+        ])
+        if trigrams:
+            self._index_chunks([(chunk_hash, content) for chunk_hash, (content, _) in chunks.items() if not existing.get(chunk_hash)])
+
+    @property
+    def max_packet(self):
+        if self._max_packet is None:
+            with self:
+                self._execute_queries(FSSettingsQuery.DB_QUERY_GET_MAX_PACKET, {})
+                self._max_packet = self.cursor.fetchone()[0]
+        return self._max_packet
+
+    def _insert_rows(self, queries_enum, rows):
+        """
+        Inserts rows with as few multi-row statements as content_batch_size and max_allowed_packet allow
+        """
+        for batch in self._batch_rows(rows):
+            self._execute_batch(queries_enum, batch)
+
+    @staticmethod
+    def _compress(content, threshold):
+        """
+        Returns the content to store and its codec, compressing it when it is
+        at least threshold bytes (0 never compresses) and compression pays off
+        """
+        if threshold and len(content) >= threshold:
+            # Same layout as MySQL's COMPRESS(), so UNCOMPRESS() can read it on the server
+            compressed = struct.pack("<I", len(content)) + zlib.compress(content)
+            if len(compressed) < len(content):
+                return compressed, FSDatabase.ZLIB_CODEC
+        return content, FSDatabase.NO_CODEC
+
+    @staticmethod
+    def _decompress(content, codec):
+        if isinstance(codec, (bytes, bytearray)):
+            # Raw cursors return every column as bytes
+            codec = codec.decode("ascii")
+        if codec == FSDatabase.ZLIB_CODEC:
+            return zlib.decompress(memoryview(content)[4:])
+        return content
+
+    def _execute_batch(self, queries_enum, batch, params=None):
+        params, rows = self._batch_params(batch, params)
+        self._execute_queries(queries_enum, params, {"rows": rows})
+
+    @staticmethod
+    def _batch_params(batch, params=None):
+        """
+        Returns params with every value of the batch added, and the placeholders for its rows
+        """
+        placeholders, params = [], dict(params or {})
+        for row_idx, row in enumerate(batch):
+            names = [f"r{row_idx}_{col_idx}" for col_idx in range(len(row))]
+            params.update(zip(names, row))
+            placeholders.append("(" + ", ".join(f"%({name})s" for name in names) + ")")
+        return params, ", ".join(placeholders)
+
+    def _batch_rows(self, rows):
+        budget = self.max_packet - FSDatabase.PACKET_HEADROOM
+        # Without prepared statements values are inlined into the statement, escaped
+        escaped = not self.pool.prepared
+        batch, batch_bytes = [], 0
+        for row in rows:
+            row_bytes = FSDatabase.ROW_OVERHEAD + sum(self._param_length(value, escaped) for value in row)
+            if row_bytes > budget:
+                raise ValueError(f"Row of {row_bytes} bytes does not fit in max_allowed_packet, store the file in blocks instead")
+            if batch and (len(batch) == self.content_batch_size or batch_bytes + row_bytes > budget):
+                yield from self._split_batch(batch)
+                batch, batch_bytes = [], 0
+            batch.append(row)
+            batch_bytes += row_bytes
+        yield from self._split_batch(batch)
+
+    @staticmethod
+    def _param_length(value, escaped=False):
+        """
+        Bytes a parameter takes up in the packet, sent as is or escaped and quoted in a text statement
+        """
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        elif not isinstance(value, (bytes, bytearray)):
+            # Numbers, dates and NULL
+            return 32 if escaped else 8
+        if not escaped:
+            return len(value)
+        return len(value) + 2 + sum(value.count(char) for char in FSDatabase.ESCAPED_BYTES)
+
+    def _split_batch(self, batch):
+        # Short batches go out in power of two sizes, so only a handful of statement shapes get rendered and prepared
+        if len(batch) == self.content_batch_size:
+            yield batch
+            return
+        while batch:
+            size = 1 << (len(batch).bit_length() - 1)
+            yield batch[:size]
+            batch = batch[size:]
+
+    """
+    Block storage
+    """
+    @staticmethod
+    def _as_bytes(contents):
+        if isinstance(contents, str):
+            return contents.encode("utf-8")
+        if isinstance(contents, (bytes, bytearray)):
+            return bytes(contents)
+        return b"".join(line.encode("utf-8") if isinstance(line, str) else bytes(line) for line in contents)
+
+    @staticmethod
+    def _iter_bytes(contents):
+        """
+        Yields contents as pieces of bytes, reading file objects WRITE_BATCH_BYTES at a time
+        """
+        pieces = contents
+        if isinstance(contents, (str, bytes, bytearray)):
+            pieces = [contents]
+        elif hasattr(contents, "read"):
+            # read() returns an empty str or bytes at the end of the file
+            pieces = iter(lambda: contents.read(FSDatabase.WRITE_BATCH_BYTES), contents.read(0))
+        for piece in pieces:
+            yield piece.encode("utf-8") if isinstance(piece, str) else bytes(piece)
+
+    def _write_blocks(self, file_content_id, contents, block_no=1, first_line=1, byte_offset=0, stats=None):
+        """
+        Stores contents as blocks starting from block_no, along with the line each block starts in
+        """
+        line_index = []
+        self._write_rows(file_content_id, self._block_rows(file_content_id, contents, line_index, stats, block_no, first_line, byte_offset))
+        self._insert_rows(FSBlockFileQuery.DB_QUERY_ADD_LINE_INDEXES, line_index)
+
+    def _block_rows(self, file_content_id, contents, line_index, stats=None, block_no=1, first_line=1, byte_offset=0):
+        """
+        Yields contents cut into (block number, byte offset, block) rows,
+        adding the line each block starts in to line_index. Only one block's
+        worth of contents is buffered, the totals are left in stats
+        """
+        block_size = self.block_size
+        pending, block, line_no = bytearray(), b"", first_line
+        for piece in chain(self._iter_bytes(contents), [None]):
+            if piece is not None:
+                pending += piece
+            # The last, partial block goes out once the contents run out
+            while len(pending) >= block_size or (piece is None and pending):
+                block = bytes(pending[:block_size])
+                del pending[:block_size]
+                line_count = block.count(b"\n")
+                line_index.append((file_content_id, block_no, line_no, line_count))
+                yield block_no, byte_offset, block
+                block_no += 1
+                line_no += line_count
+                byte_offset += len(block)
+        if stats is not None:
+            ends_with_newline = not block or block.endswith(b"\n")
+            stats.update(size=byte_offset, line_count=line_no - first_line + (not ends_with_newline), ends_with_newline=ends_with_newline)
+
+    @staticmethod
+    def _block_line_stats(contents):
+        """
+        Returns the number of lines in the contents and whether the last one is terminated
+        """
+        ends_with_newline = not contents or contents.endswith(b"\n")
+        return contents.count(b"\n") + (not ends_with_newline), ends_with_newline
+
+    def _append_blocks(self, file_entity, content_stats, new_content):
+        if not new_content:
+            return
+        block_no, first_line, byte_offset, contents = 1, 1, 0, new_content
+        self._execute_queries(FSBlockFileQuery.DB_QUERY_GET_LAST_BLOCK, {"fid": file_entity.fid})
+        last_block = self.cursor.fetchone()
+        if last_block:
+            # Top up the last block before starting new ones
+            block_no, first_line, byte_offset = last_block.blockNumber, last_block.firstLineNumber, last_block.byteOffset
+            contents = bytes(self._decompress(last_block.blockContent, last_block.codec)) + new_content
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_DELETE_TRAILING_CONTENT, {
+                "file_content_id": content_stats.fileContentID,
+                "from_row": block_no,
             })
-            for line_no, line_content in self.cursor:
-                yield line_no, line_content
+        line_count, ends_with_newline = self._block_line_stats(new_content)
+        # Lines already terminated, the open one (if any) is counted again by the new content
+        terminated = content_stats.lineCount - (not content_stats.endsWithNewline)
+        self._write_blocks(content_stats.fileContentID, contents, block_no, first_line, byte_offset)
+        self._execute_queries(FSRegularFileQuery.DB_QUERY_SET_CONTENT_STATS, {
+            "file_content_id": content_stats.fileContentID,
+            "size": content_stats.size + len(new_content),
+            "line_count": terminated + line_count,
+            "ends_with_newline": ends_with_newline,
+        })
+
+    def _read_block_lines(self, file_content_id, decoded=True, start_line=1, count=None):
+        line_no, after = 1, 0
+        if start_line > 1:
+            with self:
+                self._execute_queries(FSBlockFileQuery.DB_QUERY_GET_BLOCK_FOR_LINE, {
+                    "file_content_id": file_content_id,
+                    "line_no": start_line,
+                })
+                block = self.cursor.fetchone()
+            if block:
+                # Skip straight to the block the line starts in, the lines before it in the block are dropped
+                line_no, after = block.firstLineNumber, block.blockNumber - 1
+        page_size = max(1, FSDatabase.READ_BATCH_BYTES // self.block_size)
+        lines = self._split_blocks(self._read_rows(file_content_id, page_size, after))
+        skip = start_line - line_no
+        for line_content in islice(lines, skip, None if count is None else skip + count):
+            yield line_content.decode("utf-8") if decoded else line_content
+
+    @staticmethod
+    def _split_blocks(blocks):
+        partial_line = b""
+        for block in blocks:
+            *lines, partial_line = (partial_line + bytes(block)).split(b"\n")
+            for line_content in lines:
+                yield line_content + b"\n"
+        if partial_line:
+            yield partial_line
+
+    """
+    Trigram index
+    """
+    @staticmethod
+    def _trigrams(content):
+        # In order of appearance, so a pattern's first trigrams are the ones kept
+        return list(dict.fromkeys(content[idx:idx + 3] for idx in range(len(content) - 2)))
+
+    def _index_chunks(self, chunks):
+        """
+        Adds the trigrams of each (chunk hash, content) to the index
+        """
+        self._insert_rows(FSContentChunkQuery.DB_QUERY_ADD_TRIGRAMS, [
+            (trigram, chunk_hash) for chunk_hash, content in chunks for trigram in self._trigrams(bytes(content))
+        ])
+
+    def _index_stored_lines(self):
+        """
+        Indexes the lines of files stored in lines that aren't in the index yet
+        """
+        after = b""
+        while True:
+            with self:
+                self._execute_queries(FSContentChunkQuery.DB_QUERY_GET_UNINDEXED_LINES, {
+                    "after": after,
+                    "engine": FSDatabase.LINE_STORAGE,
+                    "limit": self.content_batch_size,
+                })
+                chunks = [(bytes(chunk_hash), bytes(content)) for chunk_hash, content in self.cursor]
+                if not chunks:
+                    return
+                self._index_chunks(chunks)
+                for batch in self._batch_rows([(chunk_hash,) for chunk_hash, _ in chunks]):
+                    self._execute_batch(FSContentChunkQuery.DB_QUERY_MARK_CHUNKS_INDEXED, batch)
+                self._commit()
+            after = chunks[-1][0]
+
+    def _pattern_trigrams(self, pattern):
+        trigrams = []
+        for literal in self._required_literals(pattern):
+            trigrams.extend(self._trigrams(literal.encode("utf-8")))
+        return list(dict.fromkeys(trigrams))[:FSDatabase.MAX_PATTERN_TRIGRAMS]
+
+    @staticmethod
+    def _required_literals(pattern):
+        """
+        Returns runs of characters every match of the regex contains as is.
+        Only literals outside of groups and character classes count, and
+        patterns that can't be read with certainty (alternations, inline
+        flags, uncommon escapes) have none
+        """
+        if "|" in pattern or "(?" in pattern:
+            return []
+        literals, run, idx = [], "", 0
+        while idx < len(pattern):
+            char, literal = pattern[idx], None
+            if char == "\\":
+                escaped = pattern[idx + 1:idx + 2]
+                if escaped and not escaped.isalnum():
+                    literal = escaped
+                elif escaped not in FSDatabase.REGEX_ESCAPES:
+                    return []
+                idx += 2
+            elif char == "[":
+                idx = FSDatabase._skip_class(pattern, idx)
+            elif char == "(":
+                idx = FSDatabase._skip_group(pattern, idx)
+            elif char == "{":
+                idx = pattern.find("}", idx) + 1 or len(pattern)
+            elif char in ".^$)*+?":
+                idx += 1
+            else:
+                literal, idx = char, idx + 1
+            # A literal that can be repeated zero times isn't required
+            if literal is not None and pattern[idx:idx + 1] not in ("*", "?", "{"):
+                run += literal
+                if pattern[idx:idx + 1] != "+":
+                    continue
+            if len(run) >= 3:
+                literals.append(run)
+            run = ""
+        if len(run) >= 3:
+            literals.append(run)
+        return literals
+
+    @staticmethod
+    def _skip_class(pattern, idx):
+        idx += 1
+        if pattern[idx:idx + 1] == "^":
+            idx += 1
+        # A ']' right after the opening bracket is part of the class
+        if pattern[idx:idx + 1] == "]":
+            idx += 1
+        while idx < len(pattern):
+            if pattern[idx] == "\\":
+                idx += 2
+            elif pattern[idx] == "[":
+                idx = FSDatabase._skip_class(pattern, idx)
+            elif pattern[idx] == "]":
+                return idx + 1
+            else:
+                idx += 1
+        return idx
+
+    @staticmethod
+    def _skip_group(pattern, idx):
+        depth = 0
+        while idx < len(pattern):
+            if pattern[idx] == "\\":
+                idx += 2
+                continue
+            if pattern[idx] == "[":
+                idx = FSDatabase._skip_class(pattern, idx)
+                continue
+            if pattern[idx] == "(":
+                depth += 1
+            elif pattern[idx] == ")":
+                depth -= 1
+                if not depth:
+                    return idx + 1
+            idx += 1
+        return idx
+
+    """
+    Storage settings
+    """
+    def _get_setting(self, name, default):
+        if self._settings is None:
+            with self:
+                self._execute_queries(FSSettingsQuery.DB_QUERY_GET_SETTINGS, {})
+                self._settings = {setting_name: value for setting_name, value in self.cursor}
+        return self._settings.get(name, default)
+
+    def _set_setting(self, name, value):
+        with self:
+            self._execute_queries(FSSettingsQuery.DB_QUERY_SET_SETTING, {"name": name, "value": str(value)})
+            self._commit()
+        self._settings = None
+
+    @property
+    def storage_engine(self):
+        """
+        Engine new files are stored with
+        """
+        return self._get_setting("storageEngine", FSDatabase.LINE_STORAGE)
+
+    @storage_engine.setter
+    def storage_engine(self, engine):
+        if engine not in (FSDatabase.LINE_STORAGE, FSDatabase.BLOCK_STORAGE):
+            raise ValueError(f"Unknown storage engine '{engine}'")
+        self._set_setting("storageEngine", engine)
+
+    @property
+    def compress_threshold(self):
+        """
+        Size from which new lines and blocks are stored compressed, 0 when compression is off
+        """
+        return int(self._get_setting("compressThreshold", 0))
+
+    @compress_threshold.setter
+    def compress_threshold(self, threshold):
+        if threshold < 0:
+            raise ValueError("Compression threshold can't be negative")
+        self._set_setting("compressThreshold", threshold)
+
+    @property
+    def trigram_index(self):
+        """
+        Whether the lines of files stored in lines are indexed by trigram to narrow down grep
+        """
+        return self._get_setting("trigramIndex", "0") == "1"
+
+    @trigram_index.setter
+    def trigram_index(self, enabled):
+        if enabled and not self.trigram_index:
+            # Lines written while it was off (or before it existed) are indexed first, so grep never misses them
+            self._index_stored_lines()
+        elif not enabled:
+            with self:
+                self._execute_queries(FSContentChunkQuery.DB_QUERY_CLEAR_TRIGRAMS, {})
+                self._commit()
+        self._set_setting("trigramIndex", int(bool(enabled)))
+
+    @property
+    def block_size(self):
+        return int(self._get_setting("blockSize", FSDatabase.DEFAULT_BLOCK_SIZE))
+
+    def get_storage_engine(self, file_entity):
+        with self:
+            self._execute_queries(FSRegularFileQuery.DB_QUERY_GET_PROP, {
+                "fid": file_entity.fid,
+            }, format_params={"prop": "storageEngine"})
+            engine = self.cursor.fetchone()
+            return engine[0] if engine else None
+
+    def get_files_not_in_engine(self, engine):
+        with self:
+            self._execute_queries(FSBlockFileQuery.DB_QUERY_GET_FILES_NOT_IN_ENGINE, {"engine": engine})
+            fids = [fid for (fid,) in self.cursor]
+        for fid in fids:
+            yield File.from_type(self, fid, RegularFile)
+
+    def set_storage_engine(self, file_entity, engine):
+        """
+        Moves the file's contents over to the given storage engine
+        """
+        if engine not in (FSDatabase.LINE_STORAGE, FSDatabase.BLOCK_STORAGE):
+            raise ValueError(f"Unknown storage engine '{engine}'")
+        with self.transaction():
+            if self.get_storage_engine(file_entity) == engine:
+                return
+            contents = list(self.readlines(file_entity, decoded=False))
+            with self:
+                self._execute_queries(FSRegularFileQuery.DB_QUERY_DELETE_LINE_INDEX, {"fid": file_entity.fid})
+                self._execute_queries(FSRegularFileQuery.DB_QUERY_SET_PROP, {
+                    "fid": file_entity.fid,
+                    "value": engine,
+                }, format_params={"prop": "storageEngine"})
+            self.write_content(file_entity, contents)
 
     def count_hardlinks(self, file_entity):
         params = {"fid": file_entity.fid}
@@ -871,4 +2547,5 @@ class FSDatabase:
         params = {"orig_fid": file_entity.fid, "link_fid": hardlink_file.fid}
         with self:
             self._execute_queries(FSRegularFileQuery.DB_QUERY_ADD_HARDLINK, params)
-            self.connection.commit()
+            self.dentries.invalidate_fid(hardlink_file.fid)
+            self._commit()
@@ -0,0 +1,169 @@
+"""Filesystem DB Path Index
+
+A local file holding every full path in the file system, one per line and
+sorted by their UTF-8 bytes, so locate can search it through mmap without
+asking the DB anything. updatedb writes it, adding only the files created
+since the last run when no path went away in between
+"""
+import os
+import re
+import mmap
+import heapq
+import fnmatch
+
+from collections import namedtuple
+
+DEFAULT_INDEX_PATH = ".fs_db_locatedb"
+INDEX_MAGIC = "rdbsh-locatedb"
+INDEX_VERSION = 2
+# Fixed width, so it can be written first and filled in once the paths are written
+HEADER_FORMAT = "{magic} {version} {last_change:020} {changes:020} {max_fid:020} {count:020}\n"
+GLOB_CHARS = re.compile(r"[*?\[]")
+BRACKET_EXPRESSION = re.compile(r"\[!?\]?[^\]]*\]")
+
+# count is every file the index covers, including the ones whose path couldn't be written to it
+IndexHeader = namedtuple("IndexHeader", ["last_change", "changes", "max_fid", "count"])
+
+def read_header(index_path):
+    """
+    The IndexHeader of the index, None when it's missing or not one this
+    version wrote
+    """
+    try:
+        with open(index_path, "rb") as index_file:
+            fields = index_file.readline().split()
+    except FileNotFoundError:
+        return None
+    if len(fields) != 6 or fields[0].decode() != INDEX_MAGIC or int(fields[1]) != INDEX_VERSION:
+        return None
+    return IndexHeader(*(int(field) for field in fields[2:]))
+
+def update_index(fs_db, index_path=DEFAULT_INDEX_PATH, rebuild=False):
+    """
+    Brings the index up to date with the file system and returns (paths
+    written, whether it was rebuilt). New files are merged into the paths
+    already there when nothing was removed, renamed or moved since the last
+    update (no path change was logged) and none committed out of fid order
+    (the counts add up), otherwise every path is dumped again and the path
+    changes logged long before are pruned, so the log stays small
+    """
+    header = None if rebuild else read_header(index_path)
+    last_change, changes, max_fid, count, created = fs_db.get_path_index_state(header.max_fid if header else 0)
+    incremental = (
+        header is not None and (header.last_change, header.changes) == (last_change, changes)
+        and header.count + created == count
+    )
+    if not incremental:
+        # Every path is dumped again anyway, so the changes logged long before can go
+        fs_db.prune_path_changes()
+        last_change, changes, max_fid, count, _ = fs_db.get_path_index_state()
+    streamed = {"paths": 0}
+    new_paths = _encoded(fs_db.stream_paths(header.max_fid if incremental else 0, max_fid), streamed)
+
+    # Written next to the index and swapped in, so locate never sees half of it
+    temp_path = f"{index_path}.tmp"
+    with open(temp_path, "wb") as temp_file:
+        temp_file.write(_header_line(last_change, changes, max_fid, 0))
+        if incremental:
+            with open(index_path, "rb") as index_file:
+                index_file.readline()
+                # Compared without the newline, which would sort before a path's tabs
+                written = _write_paths(temp_file, heapq.merge(index_file, new_paths, key=lambda line: line[:-1]))
+        else:
+            written = _write_paths(temp_file, new_paths)
+        temp_file.seek(0)
+        covered = (header.count if incremental else 0) + streamed["paths"]
+        temp_file.write(_header_line(last_change, changes, max_fid, covered))
+    os.replace(temp_path, index_path)
+    return written, not incremental
+
+def _header_line(last_change, changes, max_fid, count):
+    return HEADER_FORMAT.format(
+        magic=INDEX_MAGIC, version=INDEX_VERSION, last_change=last_change, changes=changes, max_fid=max_fid, count=count,
+    ).encode()
+
+def _encoded(full_paths, streamed):
+    for full_path in full_paths:
+        # A newline in a name would split it in two, such paths are left out but still counted as covered
+        streamed["paths"] += 1
+        if "\n" not in full_path:
+            yield full_path.encode("utf-8") + b"\n"
+
+def _write_paths(out_file, lines):
+    written = 0
+    for line in lines:
+        out_file.write(line)
+        written += 1
+    return written
+
+def locate(pattern, index_path=DEFAULT_INDEX_PATH, basename=False, limit=None):
+    """
+    Streams the indexed paths matching pattern, in sorted order. A pattern
+    with glob characters (* ? [...]) has to match the whole path (or its last
+    component with basename), any other pattern only has to appear in it
+    """
+    with open(index_path, "rb") as index_file, mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ) as index:
+        first_line = index.find(b"\n") + 1
+        if GLOB_CHARS.search(pattern):
+            matches = _glob_matches(index, first_line, pattern, basename)
+        else:
+            matches = _substring_matches(index, first_line, pattern.encode("utf-8"), basename)
+        for found, line in enumerate(matches):
+            if limit is not None and found >= limit:
+                break
+            yield line.decode("utf-8")
+
+def _substring_matches(index, start, needle, basename=False):
+    # mmap.find skips over the lines that can't match without splitting the index into lines
+    pos = index.find(needle, start)
+    while pos != -1:
+        line_start = index.rfind(b"\n", start - 1, pos) + 1
+        line_end = index.find(b"\n", pos)
+        if basename and pos <= index.rfind(b"/", line_start, line_end):
+            # Found in a parent directory's name, it may still be in the last component
+            pos = index.find(needle, pos + 1)
+            continue
+        yield index[line_start:line_end]
+        pos = index.find(needle, line_end + 1)
+
+def _glob_matches(index, start, pattern, basename=False):
+    matcher = re.compile(fnmatch.translate(pattern).encode("utf-8"))
+    literal = GLOB_CHARS.split(pattern)[0]
+    if literal.startswith("/") and not basename:
+        # Everything the pattern can match starts with its literal prefix, which is one run of sorted lines
+        prefix = literal.encode("utf-8")
+        line_start = _lower_bound(index, start, prefix)
+        while line_start < len(index):
+            line_end = index.find(b"\n", line_start)
+            line = index[line_start:line_end]
+            if not line.startswith(prefix):
+                break
+            if matcher.match(line):
+                yield line
+            line_start = line_end + 1
+        return
+    # Otherwise only the lines holding the longest literal part are tried
+    longest = max(GLOB_CHARS.split(BRACKET_EXPRESSION.sub("*", pattern)), key=len).encode("utf-8")
+    candidates = _substring_matches(index, start, longest, basename) if longest else _lines(index, start)
+    for line in candidates:
+        if matcher.match(line.rsplit(b"/", 1)[-1] if basename else line):
+            yield line
+
+def _lines(index, start):
+    line_start = start
+    while line_start < len(index):
+        line_end = index.find(b"\n", line_start)
+        yield index[line_start:line_end]
+        line_start = line_end + 1
+
+def _lower_bound(index, start, key):
+    # Binary search over byte offsets for the first line not sorting before key
+    low, high = start, len(index)
+    while low < high:
+        line_start = index.rfind(b"\n", start - 1, (low + high) // 2) + 1
+        line_end = index.find(b"\n", line_start)
+        if index[line_start:line_end] < key:
+            low = line_end + 1
+        else:
+            high = line_start
+    return low
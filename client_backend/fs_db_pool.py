@@ -0,0 +1,293 @@
+"""Filesystem DB Connection Pool
+
+Keeps a bounded set of MySQL connections, each holding its own long-lived
+cursors, which FSDatabase checks out for the duration of an operation
+"""
+import re
+import threading
+from queue import LifoQueue, Empty
+from collections import namedtuple
+from contextlib import contextmanager
+
+import mysql.connector as MySQLConnection
+from mysql.connector import errorcode as MySQLError
+from mysql.connector.errors import InterfaceError, OperationalError, ProgrammingError
+from mysql.connector.constants import SQLMode
+
+class PoolExhaustedError(RuntimeError):
+    pass
+
+
+class Statement:
+    """
+    A query template rendered once for both protocols: `sql` takes the
+    %(name)s params of the text protocol, `prepared_sql` takes the same
+    params positionally in `param_names` order. `transactional` statements
+    write or lock rows, so they have to run inside a transaction
+    """
+    PARAM = re.compile(r"%\((\w+)\)s")
+    # Also matches the UPDATE of SELECT ... FOR UPDATE and the writes of WITH ... UPDATE/DELETE
+    TRANSACTIONAL = re.compile(r"\b(INSERT|UPDATE|DELETE|REPLACE\s+INTO|FOR\s+SHARE|LOCK\s+IN\s+SHARE\s+MODE)\b", re.IGNORECASE)
+
+    __slots__ = ("sql", "prepared_sql", "param_names", "transactional")
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.param_names = tuple(Statement.PARAM.findall(sql))
+        self.prepared_sql = Statement.PARAM.sub("?", sql)
+        self.transactional = bool(Statement.TRANSACTIONAL.search(sql))
+
+    def bind(self, params):
+        return tuple(params[name] for name in self.param_names)
+
+
+class BufferedResult:
+    """
+    Rows of a prepared statement read in full right after it ran, so the
+    prepared cursor is free for the next execution straight away
+    """
+    def __init__(self, rows, lastrowid, rowcount):
+        self._rows = iter(rows)
+        self.lastrowid = lastrowid
+        self.rowcount = rowcount
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def __iter__(self):
+        return self._rows
+
+
+class PooledCursor:
+    """
+    Cursor for one nesting depth, running statements as server-side prepared
+    statements when it can and on the text protocol otherwise. Fetching goes
+    to whichever ran last
+    """
+    def __init__(self, pooled, raw):
+        self.pooled = pooled
+        # Raw rows only come back from the text protocol
+        self.raw = raw
+        self.text_cursor = pooled._new_cursor(raw)
+        self.active = self.text_cursor
+
+    def execute(self, statement, params):
+        if self.pooled.prepared and not self.raw:
+            result = self.pooled.execute_prepared(statement, params)
+            if result is not None:
+                self.active = result
+                return
+        self.text_cursor.execute(statement.sql, params)
+        self.active = self.text_cursor
+
+    def fetchone(self):
+        return self.active.fetchone()
+
+    def fetchall(self):
+        return self.active.fetchall()
+
+    def __iter__(self):
+        return iter(self.active)
+
+    @property
+    def lastrowid(self):
+        return self.active.lastrowid
+
+    @property
+    def rowcount(self):
+        return self.active.rowcount
+
+    def close(self):
+        self.text_cursor.close()
+
+
+class PooledConnection:
+    ISOLATION_LEVEL = "READ COMMITTED"
+
+    def __init__(self, db_configs, reuse_cursors=True, prepared=True):
+        # Reads run outside of any transaction, so they leave nothing to end when the connection
+        # is checked back in. FSDatabase sends START TRANSACTION before anything that writes
+        self.connection = MySQLConnection.connect(**{**db_configs, "autocommit": True})
+        self.connection.sql_mode = [*self.connection.sql_mode.split(","), SQLMode.NO_AUTO_VALUE_ON_ZERO]
+        # Transactions stay open across operations with autocommit off, and have to see
+        # what the other pooled connections commit in the meantime
+        cursor = self.connection.cursor()
+        cursor.execute(f"SET SESSION TRANSACTION ISOLATION LEVEL {PooledConnection.ISOLATION_LEVEL}")
+        cursor.close()
+        self.reuse_cursors = reuse_cursors
+        self.cursors = {}
+        self.prepared = prepared
+        # One prepared cursor per statement, each keeps its statement prepared on the server
+        self.prepared_cursors = {}
+        self.unpreparable = set()
+        self._row_types = {}
+
+    def _new_cursor(self, raw):
+        params = dict(named_tuple=True) if not raw else dict(raw=True)
+        # Buffered so a cursor never holds unread rows and can be reused right away
+        return self.connection.cursor(buffered=True, **params)
+
+    def cursor(self, depth, raw=False):
+        """
+        Returns the cursor for the given nesting depth, preparing it on first use
+        """
+        if not self.reuse_cursors:
+            return PooledCursor(self, raw)
+        key = (depth, raw)
+        if key not in self.cursors:
+            self.cursors[key] = PooledCursor(self, raw)
+        return self.cursors[key]
+
+    def execute_prepared(self, statement, params):
+        """
+        Runs the statement as a server-side prepared statement, returning None
+        when the server can't prepare it so it is run as text instead
+        """
+        sql = statement.prepared_sql
+        if sql in self.unpreparable:
+            return None
+        cursor = self.prepared_cursors.get(sql)
+        if cursor is None:
+            cursor = self.prepared_cursors[sql] = self.connection.cursor(prepared=True)
+        try:
+            cursor.execute(sql, statement.bind(params))
+        except ProgrammingError as err:
+            if err.errno != MySQLError.ER_UNSUPPORTED_PS:
+                raise
+            self.unpreparable.add(sql)
+            del self.prepared_cursors[sql]
+            cursor.close()
+            return None
+        rows = []
+        if cursor.with_rows:
+            row_type = self._row_type(tuple(cursor.column_names))
+            rows = [row_type._make(row) for row in cursor.fetchall()]
+        return BufferedResult(rows, cursor.lastrowid, cursor.rowcount)
+
+    def _row_type(self, column_names):
+        # Same rows as the named tuple cursors give
+        if column_names not in self._row_types:
+            self._row_types[column_names] = namedtuple("Row", column_names, rename=True)
+        return self._row_types[column_names]
+
+    def release_cursor(self, cursor):
+        if not self.reuse_cursors:
+            cursor.close()
+
+    def close(self):
+        for cursor in (*self.cursors.values(), *self.prepared_cursors.values()):
+            cursor.close()
+        self.cursors.clear()
+        self.prepared_cursors.clear()
+        self.connection.close()
+
+
+class PoolScope(threading.local):
+    """
+    Per-thread view of the connection a thread has checked out and the
+    cursors of its (possibly nested) operations
+    """
+    def __init__(self, autocommit=True):
+        self.pooled = None
+        self.cursors = []
+        self.use_raw = False
+        self.autocommit = autocommit
+        # Number of open transaction() blocks, including the implicit one
+        # kept open by autocommit-off writes
+        self.tx_depth = 0
+        self.implicit_tx = False
+
+
+class FSConnectionPool:
+    DEFAULT_POOL_SIZE = 1
+    # Seconds to wait for a free connection before raising PoolExhaustedError
+    DEFAULT_TIMEOUT = 30
+
+    def __init__(self, db_configs, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT, reuse_cursors=True, prepared=True):
+        if pool_size < 1:
+            raise ValueError("Connection pool needs at least one connection")
+        self.db_configs = db_configs
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.reuse_cursors = reuse_cursors
+        self.prepared = prepared
+        self._idle = LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        # Fail on a bad configuration right away instead of on the first query
+        self._reserve()
+        self.checkin(self._open())
+
+    def _reserve(self):
+        with self._lock:
+            if self._opened >= self.pool_size:
+                return False
+            self._opened += 1
+            return True
+
+    def _open(self):
+        try:
+            return PooledConnection(self.db_configs, reuse_cursors=self.reuse_cursors, prepared=self.prepared)
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def checkout(self):
+        try:
+            pooled = self._idle.get_nowait()
+        except Empty:
+            if self._reserve():
+                pooled = self._open()
+            else:
+                try:
+                    pooled = self._idle.get(timeout=self.timeout)
+                except Empty:
+                    raise PoolExhaustedError(f"All {self.pool_size} connections are checked out")
+        # Both can be switched on the pool after its connections were opened
+        pooled.reuse_cursors = self.reuse_cursors
+        pooled.prepared = self.prepared
+        return pooled
+
+    def checkin(self, pooled, discard=False):
+        if not discard and pooled.connection.in_transaction:
+            # Only left open by a caller of connection() that started one itself. Ending it lets go of
+            # its locks, which would otherwise block other writers and DDL while the connection sits idle
+            try:
+                pooled.connection.rollback()
+            except (InterfaceError, OperationalError):
+                discard = True
+        if discard:
+            with self._lock:
+                self._opened -= 1
+            try:
+                pooled.close()
+            except (InterfaceError, OperationalError):
+                pass
+            return
+        self._idle.put(pooled)
+
+    @contextmanager
+    def connection(self):
+        """
+        Checks out a connection that is not shared with FSDatabase operations
+        """
+        pooled = self.checkout()
+        broken = False
+        try:
+            yield pooled
+        except (InterfaceError, OperationalError):
+            broken = True
+            raise
+        finally:
+            self.checkin(pooled, discard=broken)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
@@ -0,0 +1,137 @@
+"""Filesystem DB File Streams
+
+io streams over a regular file's stored contents, so code written against
+file objects (shutil.copyfileobj, csv, json.load, ...) can read and write
+the DB without materializing the whole file
+"""
+import io
+
+class RegularFileIO(io.RawIOBase):
+    """
+    Unbuffered byte stream over a regular file. Reads fetch only the rows
+    holding the requested range, writes at or past the end are appended and
+    writes inside the file rewrite only the rows they fall in. Writes are
+    operations like any other: they commit on their own, or wait for
+    fs_db.commit() with autocommit off
+    """
+    # Read-ahead and write coalescing size of the buffers wrapping it
+    DEFAULT_BUFFER_SIZE = 1 << 20
+
+    def __init__(self, regular_file, readable, writable, append=False):
+        super().__init__()
+        self.file = regular_file
+        self.fs_db = regular_file.fs_db
+        self._readable = readable
+        self._writable = writable
+        self._append = append
+        self._modified = False
+        self._size = self.fs_db.get_size(regular_file)
+        if readable:
+            # Done on opening, so closing (which the garbage collector may do) only writes after a write
+            regular_file.open()
+        self._pos = self._size if append else 0
+
+    def readable(self):
+        return self._readable
+
+    def writable(self):
+        return self._writable
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self._readable:
+            raise io.UnsupportedOperation("File not open for reading")
+        contents = self.fs_db.read_content(self.file, self._pos, len(buffer))
+        buffer[:len(contents)] = contents
+        self._pos += len(contents)
+        return len(contents)
+
+    def readall(self):
+        if not self._readable:
+            raise io.UnsupportedOperation("File not open for reading")
+        contents = self.fs_db.read_content(self.file, self._pos)
+        self._pos += len(contents)
+        return contents
+
+    def write(self, contents):
+        if not self._writable:
+            raise io.UnsupportedOperation("File not open for writing")
+        contents = bytes(contents)
+        if self._append:
+            self._pos = self._size
+        if self._pos >= self._size:
+            # Anything skipped over by seeking past the end reads back as zeros
+            self.fs_db.append_content(self.file, b"\0" * (self._pos - self._size) + contents)
+        else:
+            self.fs_db.splice_content(self.file, self._pos, contents)
+        self._pos += len(contents)
+        self._size = max(self._size, self._pos)
+        self._modified = True
+        return len(contents)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence ({whence})")
+        if pos < 0:
+            raise ValueError(f"Negative seek position {pos}")
+        self._pos = pos
+        return pos
+
+    def tell(self):
+        return self._pos
+
+    def truncate(self, size=None):
+        if not self._writable:
+            raise io.UnsupportedOperation("File not open for writing")
+        size = self._pos if size is None else size
+        if size < self._size:
+            self.fs_db.truncate_content(self.file, size)
+        elif size > self._size:
+            self.fs_db.append_content(self.file, b"\0" * (size - self._size))
+        self._size = size
+        self._modified = True
+        return size
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._modified:
+                self.file.modify()
+        finally:
+            super().close()
+
+
+def open_regular_file(regular_file, mode, encoding="utf-8", buffer_size=None):
+    """
+    Opens a stream over the file for mode, which is read the same way as by
+    the built-in open(): 'r', 'w' (truncates) or 'a', optionally with '+',
+    and 'b' for bytes or 't' (the default) for text
+    """
+    flags = set(mode)
+    kinds = flags & set("rwa")
+    if len(flags) != len(mode) or not flags <= set("rwabt+") or len(kinds) != 1 or {"b", "t"} <= flags:
+        raise ValueError(f"Invalid mode: '{mode}'")
+    kind, update = kinds.pop(), "+" in flags
+    raw = RegularFileIO(regular_file, readable=kind == "r" or update, writable=kind != "r" or update, append=kind == "a")
+    if kind == "w":
+        raw.truncate(0)
+    buffer_size = buffer_size or RegularFileIO.DEFAULT_BUFFER_SIZE
+    if update:
+        buffered = io.BufferedRandom(raw, buffer_size)
+    elif kind == "r":
+        buffered = io.BufferedReader(raw, buffer_size)
+    else:
+        buffered = io.BufferedWriter(raw, buffer_size)
+    if "b" in flags:
+        return buffered
+    # Lines end in '\n' in the file system, nothing is translated
+    return io.TextIOWrapper(buffered, encoding=encoding, newline="\n")
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""Move file contents between storage engines
+
+Rewrites every regular file not yet stored with the chosen engine, one
+transaction per file so the conversion can be stopped and resumed
+"""
+from argparse import ArgumentParser
+
+from client_backend.fs_db_io import FSDatabase
+
+ENGINES = {
+    "lines": FSDatabase.LINE_STORAGE,
+    "blocks": FSDatabase.BLOCK_STORAGE,
+}
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Convert the contents of your MySQL File System to another storage engine")
+    parser.add_argument("engine", help="Storage engine to convert to", choices=ENGINES)
+    parser.add_argument("--config", help="Path to the DB config", default=".fs_db_rdbsh")
+    parser.add_argument("--default", help="Also store new files with this engine", action="store_true")
+
+    args = parser.parse_args()
+
+    fs_db = FSDatabase(args.config)
+    engine = ENGINES[args.engine]
+    if args.default:
+        fs_db.storage_engine = engine
+    converted = 0
+    for regular_file in fs_db.get_files_not_in_engine(engine):
+        fs_db.set_storage_engine(regular_file, engine)
+        converted += 1
+    print(f"Converted {converted} files to {args.engine} storage")
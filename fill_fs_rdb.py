@@ -30,23 +30,27 @@ def _to_db_path(path):
 def insertDataIntoDB(x, fs_db):
     print(f'Copying & Uploading: {x.as_posix()}')
     if x.is_symlink():
-        SymbolicLink(fs_db, _to_db_path(x), create_if_missing=True, linked_path=_to_db_path(x.resolve(strict=False)))
+        with fs_db.transaction():
+            SymbolicLink(fs_db, _to_db_path(x), create_if_missing=True, linked_path=_to_db_path(x.resolve(strict=False)))
     elif x.is_dir():
-        Directory(fs_db, _to_db_path(x), create_if_missing=True)
+        with fs_db.transaction():
+            Directory(fs_db, _to_db_path(x), create_if_missing=True)
         for x_child in x.iterdir():
             insertDataIntoDB(x_child, fs_db)
     elif x.is_file():
-        db_file = RegularFile(fs_db, _to_db_path(x), create_if_missing=True, contents="")
-        # NOTE: Unix doesn't return the original creator, so we just call the user the author
-        # NOTE: Also API doesn't support changing the author
-        # db_file.author = user
-        user = User(fs_db, x.stat().st_uid, create_if_missing=True, user_name=x.owner())
-        group = Group(fs_db, x.stat().st_gid, create_if_missing=True, group_name=x.group())
-        db_file.owner = user
-        db_file.group_owner = group
-        db_file.permissions = x.stat().st_mode & (S_IRWXU | S_IRWXG | S_IRWXO)
-        with x.open('rb') as f:
-            db_file.write(f.readlines())
+        # One commit per file instead of one per property
+        with fs_db.transaction():
+            # The file object is streamed in, the file is never held in memory whole
+            with x.open('rb') as f:
+                db_file = RegularFile(fs_db, _to_db_path(x), create_if_missing=True, contents=f)
+            # NOTE: Unix doesn't return the original creator, so we just call the user the author
+            # NOTE: Also API doesn't support changing the author
+            # db_file.author = user
+            user = User(fs_db, x.stat().st_uid, create_if_missing=True, user_name=x.owner())
+            group = Group(fs_db, x.stat().st_gid, create_if_missing=True, group_name=x.group())
+            db_file.owner = user
+            db_file.group_owner = group
+            db_file.permissions = x.stat().st_mode & (S_IRWXU | S_IRWXG | S_IRWXO)
     else:
         print('Warning: Encountered unsupported file type', x.as_posix())
 
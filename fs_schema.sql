@@ -1,8 +1,14 @@
 -- File System SQL Commands for ECE 356 Project
 
 -- Clean Up Existing Tables
+DROP TABLE IF EXISTS SchemaVersion;
+DROP TABLE IF EXISTS FileSystemSettings;
+DROP TABLE IF EXISTS PathChanges;
+DROP TABLE IF EXISTS FileLineIndex;
 DROP TABLE IF EXISTS GroupMemberships;
 DROP TABLE IF EXISTS FileContents;
+DROP TABLE IF EXISTS ContentTrigrams;
+DROP TABLE IF EXISTS ContentChunks;
 DROP TABLE IF EXISTS ParentDirectory;
 DROP TABLE IF EXISTS SymbolicLinks;
 DROP TABLE IF EXISTS HardLinks;
@@ -22,6 +28,8 @@ CREATE TABLE Files (
     groupOwnerID INT NOT NULL,
     authorID INT NOT NULL, 
     ownerID INT NOT NULL,
+    fileType CHAR(1) DEFAULT NULL, -- 'd' directory, 'f' regular file, 'l' symbolic link
+    fullPath VARCHAR(4096) DEFAULT NULL, -- Absolute path, kept up to date on rename/move
     PRIMARY KEY(fileID)
 );
 
@@ -35,6 +43,7 @@ CREATE TABLE Directories (
 CREATE TABLE ParentDirectory (
     fileID INT NOT NULL,
     parentDirectoryFileID INT NOT NULL,
+    fileName VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL, -- Copy of Files.fileName for (parent, name) lookups
     PRIMARY KEY (fileID)
 );
 
@@ -49,16 +58,43 @@ CREATE TABLE RegularFileMetadata (
     dateModified DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     dateLastOpened DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
     size BIGINT NOT NULL,
+    storageEngine CHAR(1) NOT NULL DEFAULT 'l', -- 'l' one FileContents row per line, 'b' fixed-size blocks
+    lineCount INT NOT NULL DEFAULT 0, -- Lines in the file, the last one may be unterminated
+    endsWithNewline BOOLEAN NOT NULL DEFAULT TRUE, -- Whether the last line is terminated, appends start a new line if so
     PRIMARY KEY (fileContentID)
 );
 
 CREATE TABLE FileContents(
     fileContentID INT NOT NULL,
-    lineNumber INT NOT NULL,
-    lineContent LONGBLOB NOT NULL,
+    lineNumber INT NOT NULL, -- Block number for files stored in blocks
+    byteOffset BIGINT NOT NULL DEFAULT 0, -- Offset of the row's first byte in the file
+    chunkHash BINARY(32) NOT NULL, -- The line or block, stored once in ContentChunks
     PRIMARY KEY (fileContentID, lineNumber)
 );
 
+CREATE TABLE ContentChunks (
+    chunkHash BINARY(32) NOT NULL, -- SHA-256 of the content
+    chunkContent LONGBLOB NOT NULL,
+    codec CHAR(1) NOT NULL DEFAULT 'n', -- 'n' stored as is, 'z' zlib compressed in the format of COMPRESS()
+    refCount INT NOT NULL, -- FileContents rows using the chunk, dropped once it reaches 0
+    trigramsIndexed BOOLEAN NOT NULL DEFAULT FALSE, -- Whether its trigrams are in ContentTrigrams
+    PRIMARY KEY (chunkHash)
+);
+
+CREATE TABLE ContentTrigrams (
+    trigram BINARY(3) NOT NULL, -- Three consecutive bytes of a line
+    chunkHash BINARY(32) NOT NULL,
+    PRIMARY KEY (trigram, chunkHash)
+);
+
+CREATE TABLE FileLineIndex (
+    fileContentID INT NOT NULL,
+    blockNumber INT NOT NULL,
+    firstLineNumber INT NOT NULL, -- Line the block's first byte belongs to
+    lineCount INT NOT NULL, -- Line breaks in the block
+    PRIMARY KEY (fileContentID, blockNumber)
+);
+
 CREATE TABLE SymbolicLinks (
     fileID INT NOT NULL,
     dateModified DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
@@ -85,6 +121,25 @@ CREATE TABLE GroupMemberships (
     PRIMARY KEY (groupID, userID)
 );
 
+CREATE TABLE FileSystemSettings (
+    settingName VARCHAR(64) NOT NULL,
+    settingValue VARCHAR(255) NOT NULL,
+    PRIMARY KEY (settingName)
+);
+
+CREATE TABLE PathChanges (
+    changeID BIGINT NOT NULL AUTO_INCREMENT, -- Appended to by every remove, rename and move, for the locate index
+    fileID INT NOT NULL, -- File whose path (and everything below it) went away
+    dateChanged DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, -- Rows a day old are dropped by the next full rebuild
+    PRIMARY KEY (changeID)
+);
+
+CREATE TABLE SchemaVersion (
+    version INT NOT NULL, -- Number of the migrations/ script this schema includes
+    dateApplied DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (version)
+);
+
 -- Foreign Keys
 ALTER TABLE Files ADD FOREIGN KEY (groupOwnerID) REFERENCES UserGroups(groupID);
 ALTER TABLE Files ADD FOREIGN KEY (authorID) REFERENCES Users(userID);
@@ -94,6 +149,9 @@ ALTER TABLE ParentDirectory ADD FOREIGN KEY (fileID) REFERENCES Files(fileID);
 ALTER TABLE ParentDirectory ADD FOREIGN KEY (parentDirectoryFileID) REFERENCES Directories(fileID);
 ALTER TABLE HardLinks ADD FOREIGN KEY (fileContentID) REFERENCES RegularFileMetadata(fileContentID);
 ALTER TABLE FileContents ADD FOREIGN KEY (fileContentID) REFERENCES RegularFileMetadata(fileContentID);
+ALTER TABLE FileContents ADD FOREIGN KEY (chunkHash) REFERENCES ContentChunks(chunkHash);
+ALTER TABLE ContentTrigrams ADD FOREIGN KEY (chunkHash) REFERENCES ContentChunks(chunkHash) ON DELETE CASCADE;
+ALTER TABLE FileLineIndex ADD FOREIGN KEY (fileContentID) REFERENCES RegularFileMetadata(fileContentID);
 ALTER TABLE SymbolicLinks ADD FOREIGN KEY (fileID) REFERENCES Files(fileID);
 ALTER TABLE GroupMemberships ADD FOREIGN KEY (groupID) REFERENCES UserGroups(groupID);
 ALTER TABLE GroupMemberships ADD FOREIGN KEY (userID) REFERENCES Users(userID);
@@ -104,4 +162,24 @@ ALTER TABLE UserGroups AUTO_INCREMENT=1000;
 ALTER TABLE Users ADD UNIQUE(userName);
 ALTER TABLE UserGroups ADD UNIQUE(groupName);
 
--- Additional Indicies
\ No newline at end of file
+-- Additional Indicies
+ALTER TABLE ParentDirectory ADD UNIQUE INDEX ParentDirectoryName (parentDirectoryFileID, fileName);
+ALTER TABLE HardLinks ADD INDEX HardLinksContent (fileContentID);
+ALTER TABLE Files ADD INDEX FilesName (fileName);
+ALTER TABLE Files ADD INDEX FilesOwner (ownerID);
+ALTER TABLE Files ADD INDEX FilesGroupOwner (groupOwnerID);
+ALTER TABLE Files ADD INDEX FilesFullPath (fullPath(255));
+ALTER TABLE GroupMemberships ADD INDEX GroupMembershipsUser (userID);
+ALTER TABLE FileLineIndex ADD INDEX FileLineIndexLine (fileContentID, firstLineNumber);
+ALTER TABLE FileContents ADD INDEX FileContentsOffset (fileContentID, byteOffset);
+ALTER TABLE ContentChunks ADD INDEX ContentChunksUnreferenced (refCount);
+
+-- File System Settings
+INSERT INTO FileSystemSettings (settingName, settingValue) VALUES
+    ('storageEngine', 'l'), -- Engine new files are stored with, 'l' lines or 'b' blocks
+    ('blockSize', '65536'), -- Bytes per block for files stored in blocks
+    ('compressThreshold', '0'), -- Lines and blocks of at least this many bytes are stored compressed, 0 turns it off
+    ('trigramIndex', '0'); -- 1 when the lines of files stored in lines are indexed in ContentTrigrams for grep
+
+-- Schema Version (every script in migrations/ is already part of this schema)
+INSERT INTO SchemaVersion (version) VALUES (1), (2), (3), (4), (5), (6), (7), (8), (9), (10), (11);
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Upgrade an existing file system database in place
+
+Applies every script in migrations/ that the database hasn't recorded in
+SchemaVersion yet, in order, recording each one as soon as it succeeds
+"""
+import re
+
+from argparse import ArgumentParser
+from pathlib import Path
+
+from client_backend.fs_db_io import FSDatabase
+
+MIGRATIONS_PATH = Path(__file__).resolve().parent.joinpath("migrations")
+MIGRATION_NAME = re.compile(r"^(\d+)_.*\.sql$")
+
+DB_QUERY_CREATE_SCHEMA_VERSION = (
+    "CREATE TABLE IF NOT EXISTS SchemaVersion ("
+    "version INT NOT NULL, "
+    "dateApplied DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+    "PRIMARY KEY (version)"
+    ")"
+)
+DB_QUERY_GET_VERSIONS = "SELECT version FROM SchemaVersion"
+DB_QUERY_ADD_VERSION = "INSERT INTO SchemaVersion (version) VALUES (%(version)s)"
+
+def find_migrations():
+    migrations = []
+    for script in MIGRATIONS_PATH.iterdir():
+        match = MIGRATION_NAME.match(script.name)
+        if match:
+            migrations.append((int(match.group(1)), script))
+    return sorted(migrations)
+
+def split_statements(script):
+    # Migrations are plain DDL/DML, no statement has a ';' or '--' inside a string
+    script = re.sub(r"--[^\n]*", "", script)
+    return [statement.strip() for statement in script.split(";") if statement.strip()]
+
+def migrate(connection, baseline=0):
+    cursor = connection.cursor()
+    cursor.execute(DB_QUERY_CREATE_SCHEMA_VERSION)
+    cursor.execute(DB_QUERY_GET_VERSIONS)
+    applied = {version for (version,) in cursor}
+    for version, script in find_migrations():
+        if version in applied:
+            continue
+        if version <= baseline:
+            print(f"Marking {script.name} as applied")
+        else:
+            print(f"Applying {script.name}")
+            # DDL commits implicitly in MySQL, a failed script has to be fixed up by hand before rerunning
+            for statement in split_statements(script.read_text()):
+                cursor.execute(statement)
+        cursor.execute(DB_QUERY_ADD_VERSION, {"version": version})
+        connection.commit()
+    cursor.close()
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Upgrade your MySQL File System schema in place")
+    parser.add_argument("--config", help="Path to the DB config", default=".fs_db_rdbsh")
+    parser.add_argument("--baseline",
+        help="Record migrations up to this version as applied without running them, "
+        "for databases created from an fs_schema.sql that already included them",
+        type=int,
+        default=0)
+
+    args = parser.parse_args()
+
+    with FSDatabase(args.config).pool.connection() as pooled:
+        migrate(pooled.connection, args.baseline)
@@ -0,0 +1,8 @@
+-- Store each file's type on its Files row so it can be read with one lookup
+
+ALTER TABLE Files ADD COLUMN fileType CHAR(1) DEFAULT NULL AFTER ownerID; -- 'd' directory, 'f' regular file, 'l' symbolic link
+
+-- Backfill from the type-specific tables
+UPDATE Files INNER JOIN Directories USING (fileID) SET fileType = 'd';
+UPDATE Files INNER JOIN HardLinks USING (fileID) SET fileType = 'f';
+UPDATE Files INNER JOIN SymbolicLinks USING (fileID) SET fileType = 'l';
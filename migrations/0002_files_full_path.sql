@@ -0,0 +1,15 @@
+-- Store each file's absolute path on its Files row so full names need no walk up to root
+
+ALTER TABLE Files ADD COLUMN fullPath VARCHAR(4096) DEFAULT NULL AFTER fileType; -- Absolute path, kept up to date on rename/move
+
+-- Backfill by walking down from the root
+WITH RECURSIVE Paths (fileID, fullPath) AS (
+    SELECT fileID, CAST('/' AS CHAR(4096))
+    FROM Files
+    WHERE fileID = 1 -- Root directory
+    UNION ALL
+    SELECT Files.fileID, CONCAT(IF(Paths.fullPath = '/', '', Paths.fullPath), '/', Files.fileName)
+    FROM Paths INNER JOIN ParentDirectory ON ParentDirectory.parentDirectoryFileID = Paths.fileID
+    INNER JOIN Files ON Files.fileID = ParentDirectory.fileID
+)
+UPDATE Files INNER JOIN Paths USING (fileID) SET Files.fullPath = Paths.fullPath;
@@ -0,0 +1,15 @@
+-- Index the lookups the query layer makes and keep each file's name next to its parent
+-- for unique (parent, name) lookups
+
+ALTER TABLE ParentDirectory ADD COLUMN fileName VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL DEFAULT '' AFTER parentDirectoryFileID; -- Copy of Files.fileName for (parent, name) lookups
+UPDATE ParentDirectory INNER JOIN Files USING (fileID) SET ParentDirectory.fileName = Files.fileName;
+ALTER TABLE ParentDirectory ALTER COLUMN fileName DROP DEFAULT;
+
+-- Fails if a directory already holds two files with the same name, rename one of them and rerun
+ALTER TABLE ParentDirectory ADD UNIQUE INDEX ParentDirectoryName (parentDirectoryFileID, fileName);
+ALTER TABLE HardLinks ADD INDEX HardLinksContent (fileContentID);
+ALTER TABLE Files ADD INDEX FilesName (fileName);
+ALTER TABLE Files ADD INDEX FilesOwner (ownerID);
+ALTER TABLE Files ADD INDEX FilesGroupOwner (groupOwnerID);
+ALTER TABLE Files ADD INDEX FilesFullPath (fullPath(255));
+ALTER TABLE GroupMemberships ADD INDEX GroupMembershipsUser (userID);
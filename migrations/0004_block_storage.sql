@@ -0,0 +1,22 @@
+-- Let file contents be stored in fixed-size blocks as well as one row per line
+
+ALTER TABLE RegularFileMetadata ADD COLUMN storageEngine CHAR(1) NOT NULL DEFAULT 'l' AFTER size; -- 'l' one FileContents row per line, 'b' fixed-size blocks
+
+CREATE TABLE FileLineIndex (
+    fileContentID INT NOT NULL,
+    blockNumber INT NOT NULL,
+    firstLineNumber INT NOT NULL, -- Line the block's first byte belongs to
+    lineCount INT NOT NULL, -- Line breaks in the block
+    PRIMARY KEY (fileContentID, blockNumber)
+);
+ALTER TABLE FileLineIndex ADD FOREIGN KEY (fileContentID) REFERENCES RegularFileMetadata(fileContentID);
+ALTER TABLE FileLineIndex ADD INDEX FileLineIndexLine (fileContentID, firstLineNumber);
+
+CREATE TABLE FileSystemSettings (
+    settingName VARCHAR(64) NOT NULL,
+    settingValue VARCHAR(255) NOT NULL,
+    PRIMARY KEY (settingName)
+);
+INSERT INTO FileSystemSettings (settingName, settingValue) VALUES
+    ('storageEngine', 'l'), -- Engine new files are stored with, 'l' lines or 'b' blocks
+    ('blockSize', '65536'); -- Bytes per block for files stored in blocks
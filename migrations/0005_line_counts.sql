@@ -0,0 +1,33 @@
+-- Track each file's line count and trailing newline so appends don't have to look for the last line
+
+ALTER TABLE RegularFileMetadata ADD COLUMN lineCount INT NOT NULL DEFAULT 0 AFTER storageEngine; -- Lines in the file, the last one may be unterminated
+ALTER TABLE RegularFileMetadata ADD COLUMN endsWithNewline BOOLEAN NOT NULL DEFAULT TRUE AFTER lineCount; -- Whether the last line is terminated, appends start a new line if so
+
+UPDATE RegularFileMetadata
+SET lineCount = (
+    SELECT COALESCE(MAX(lineNumber), 0) FROM FileContents
+    WHERE FileContents.fileContentID = RegularFileMetadata.fileContentID
+)
+WHERE storageEngine = 'l';
+UPDATE RegularFileMetadata
+INNER JOIN FileContents ON FileContents.fileContentID = RegularFileMetadata.fileContentID
+    AND FileContents.lineNumber = RegularFileMetadata.lineCount
+SET RegularFileMetadata.endsWithNewline = (RIGHT(FileContents.lineContent, 1) = X'0A')
+WHERE storageEngine = 'l';
+
+-- Blocks only index their line breaks, an unterminated last line counts as one more
+UPDATE RegularFileMetadata
+SET lineCount = (
+    SELECT COALESCE(SUM(FileLineIndex.lineCount), 0) FROM FileLineIndex
+    WHERE FileLineIndex.fileContentID = RegularFileMetadata.fileContentID
+)
+WHERE storageEngine = 'b';
+UPDATE RegularFileMetadata
+INNER JOIN (
+    SELECT fileContentID, MAX(blockNumber) AS lastBlockNumber FROM FileLineIndex GROUP BY fileContentID
+) AS LastBlock ON LastBlock.fileContentID = RegularFileMetadata.fileContentID
+INNER JOIN FileContents ON FileContents.fileContentID = LastBlock.fileContentID
+    AND FileContents.lineNumber = LastBlock.lastBlockNumber
+SET RegularFileMetadata.endsWithNewline = (RIGHT(FileContents.lineContent, 1) = X'0A'),
+    RegularFileMetadata.lineCount = RegularFileMetadata.lineCount + (RIGHT(FileContents.lineContent, 1) <> X'0A')
+WHERE storageEngine = 'b';
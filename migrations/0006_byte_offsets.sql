@@ -0,0 +1,20 @@
+-- Store where each row starts in its file so reads can seek to a byte offset
+
+ALTER TABLE FileContents ADD COLUMN byteOffset BIGINT NOT NULL DEFAULT 0 AFTER lineNumber; -- Offset of the row's first byte in the file
+ALTER TABLE FileContents ADD INDEX FileContentsOffset (fileContentID, byteOffset);
+
+UPDATE FileContents
+INNER JOIN (
+    SELECT fileContentID, lineNumber,
+        SUM(LENGTH(lineContent)) OVER (PARTITION BY fileContentID ORDER BY lineNumber) - LENGTH(lineContent) AS rowOffset
+    FROM FileContents
+) AS Offsets ON Offsets.fileContentID = FileContents.fileContentID AND Offsets.lineNumber = FileContents.lineNumber
+SET FileContents.byteOffset = Offsets.rowOffset;
+
+-- Sizes of files stored in lines were counted in characters, offsets are in bytes
+UPDATE RegularFileMetadata
+SET size = (
+    SELECT COALESCE(SUM(LENGTH(lineContent)), 0) FROM FileContents
+    WHERE FileContents.fileContentID = RegularFileMetadata.fileContentID
+)
+WHERE storageEngine = 'l';
@@ -0,0 +1,20 @@
+-- Store every distinct line or block once, shared by all the files containing it
+
+CREATE TABLE ContentChunks (
+    chunkHash BINARY(32) NOT NULL, -- SHA-256 of the content
+    chunkContent LONGBLOB NOT NULL,
+    refCount INT NOT NULL, -- FileContents rows using the chunk, dropped once it reaches 0
+    PRIMARY KEY (chunkHash)
+);
+ALTER TABLE ContentChunks ADD INDEX ContentChunksUnreferenced (refCount);
+
+ALTER TABLE FileContents ADD COLUMN chunkHash BINARY(32) AFTER byteOffset; -- The line or block, stored once in ContentChunks
+UPDATE FileContents SET chunkHash = UNHEX(SHA2(lineContent, 256));
+
+INSERT INTO ContentChunks (chunkHash, chunkContent, refCount)
+SELECT chunkHash, ANY_VALUE(lineContent), COUNT(*)
+FROM FileContents
+GROUP BY chunkHash;
+
+ALTER TABLE FileContents MODIFY COLUMN chunkHash BINARY(32) NOT NULL, DROP COLUMN lineContent;
+ALTER TABLE FileContents ADD FOREIGN KEY (chunkHash) REFERENCES ContentChunks(chunkHash);
@@ -0,0 +1,6 @@
+-- Let lines and blocks be stored zlib compressed
+
+ALTER TABLE ContentChunks ADD COLUMN codec CHAR(1) NOT NULL DEFAULT 'n' AFTER chunkContent; -- 'n' stored as is, 'z' zlib compressed in the format of COMPRESS()
+
+INSERT INTO FileSystemSettings (settingName, settingValue) VALUES
+    ('compressThreshold', '0'); -- Lines and blocks of at least this many bytes are stored compressed, 0 turns it off
@@ -0,0 +1,15 @@
+-- Optional trigram index over the lines of files stored in lines, used to narrow down grep
+
+ALTER TABLE ContentChunks ADD COLUMN trigramsIndexed BOOLEAN NOT NULL DEFAULT FALSE; -- Whether its trigrams are in ContentTrigrams
+
+CREATE TABLE ContentTrigrams (
+    trigram BINARY(3) NOT NULL, -- Three consecutive bytes of a line
+    chunkHash BINARY(32) NOT NULL,
+    PRIMARY KEY (trigram, chunkHash)
+);
+
+ALTER TABLE ContentTrigrams ADD FOREIGN KEY (chunkHash) REFERENCES ContentChunks(chunkHash) ON DELETE CASCADE;
+
+-- Off until turned on through FSDatabase.trigram_index, which indexes the lines already stored
+INSERT INTO FileSystemSettings (settingName, settingValue) VALUES
+    ('trigramIndex', '0'); -- 1 when the lines of files stored in lines are indexed in ContentTrigrams for grep
@@ -0,0 +1,4 @@
+-- Counter bumped by every remove, rename and move, so updatedb knows when only appending new paths is enough
+
+INSERT INTO FileSystemSettings (settingName, settingValue) VALUES
+    ('pathGeneration', '0'); -- Bumped whenever a full path goes away (remove, rename, move), for the locate index
@@ -0,0 +1,11 @@
+-- Paths that went away are logged one row each instead of bumping a single counter,
+-- which every remove, rename and move had to lock until it committed
+
+CREATE TABLE PathChanges (
+    changeID BIGINT NOT NULL AUTO_INCREMENT, -- Appended to by every remove, rename and move, for the locate index
+    fileID INT NOT NULL, -- File whose path (and everything below it) went away
+    dateChanged DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, -- Rows a day old are dropped by the next full rebuild
+    PRIMARY KEY (changeID)
+);
+
+DELETE FROM FileSystemSettings WHERE settingName = 'pathGeneration';
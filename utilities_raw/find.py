@@ -3,12 +3,13 @@
 
 Note: Change shebang to `rdbsh` to use has system utility with shell
 """
-import re
+import heapq
+
 from datetime import datetime, timedelta
 from sys import exit
 from argparse import ArgumentParser, Namespace, RawTextHelpFormatter
 
-from client_backend.fs_db_file import File, Directory, RegularFile, SymbolicLink
+from client_backend.fs_db_file import File, Directory, SymbolicLink
 from client_backend.fs_db_file import MissingFileError
 from client_backend.fs_db_users import User, Group
 from client_backend.fs_db_users import MissingGroupError, MissingUserError
@@ -34,6 +35,7 @@ def parse_args():
             '+empty - only empty files/directories',
             nargs="*"
     )
+    parser.add_argument('-j', '--jobs', help='search with N workers at once, each on its own pooled connection', type=int, default=1, metavar='N')
     return parser.parse_args(ARGV)
 
 def split_paths_from_expression(paths_and_expression):
@@ -106,49 +108,33 @@ def verify_expression(expression):
             return False
     return True
 
-def check_against_expression(f, expression):
-    type_to_filetype = {
-        "d": Directory,
-        "f": RegularFile,
-        "l": SymbolicLink,
-    }
+def compile_expression(expression):
+    # The expression as find_tree predicates, so the DB checks all of them in the one query
+    predicates = {}
+    if expression.name != "*":
+        predicates["name"] = _glob_to_sql(expression.name)
     if hasattr(expression, "type"):
-        if expression.type not in type_to_filetype:
-            return False
-        else:
-            if not isinstance(f, type_to_filetype[expression.type]):
-                return False
+        predicates["file_type"] = expression.type
     if hasattr(expression, "user"):
-        if f.owner != expression.user:
-            return False
-    if hasattr(expression, "empty"):
-        if isinstance(f, Directory):
-            if not f.empty():
-                return False
-        elif isinstance(f, RegularFile):
-            for line in f.readlines():
-                if line:
-                    # Has content
-                    return False
-        else:
-            # All other file types are "non-empty"
-            return False
+        predicates["owner_id"] = expression.user.uid
     if hasattr(expression, "group"):
-        if f.group_owner != expression.group:
-            return False
-    return True
+        predicates["group_id"] = expression.group.gid
+    if hasattr(expression, "empty"):
+        predicates["empty"] = True
+    return predicates
 
 def as_long_format(curr_file):
+    file_stat = curr_file.stat()
     filetype_desc = '-'
     link_desc = ''
-    filetype = curr_file.type
+    filetype = file_stat.type
     if filetype is SymbolicLink:
         filetype_desc = 'l'
         link_desc = f' -> {curr_file.linked_path}'
     permissions_str = f"{filetype_desc}{str(curr_file.permissions)} "
     hard_links_str = f"{curr_file.num_of_hard_links} "
-    owner_str = f"{curr_file.owner.name} "
-    group_owner_str = f"{curr_file.group_owner.name} "
+    owner_str = f"{file_stat.owner_name} "
+    group_owner_str = f"{file_stat.group_owner_name} "
     file_size_str = f"{curr_file.size} "
     file_date = curr_file.modified_date if isinstance(curr_file, Directory) else curr_file.created_date
     date_time_str = f"{file_date.strftime('%b %d %H:%M')} " if datetime.now() - file_date < timedelta(days=6*30) and file_date < datetime.now() else f"{file_date.strftime('%b %d %Y')}"
@@ -172,9 +158,23 @@ def _glob_to_sql(glob):
             .replace("_", "\_")
             .replace("?", "_"))
 
-def _glob_to_regex(glob):
-    # Will change any glob characters
-    return glob.replace("*", ".*").replace("_", "?")
+def find_outputs(start_file, limits, predicates, expression):
+    # Entities come with their stat already fetched by the query, so +ls sends nothing more per file
+    for found in start_file.find_tree(**predicates, **limits):
+        yield found.full_name, as_long_format(found) if expression.ls else found.full_name
+
+def path_order(found):
+    # Components compared one at a time, the order find_tree returns paths in
+    full_path, _ = found
+    return full_path.split("/")
+
+def split_tree(start_file):
+    # The start and its own entries, then the subtree below each subdirectory. Each comes back in path order and
+    # they are merged on it, so the output order doesn't depend on the workers
+    if not isinstance(start_file, Directory):
+        return [(start_file, {})]
+    subdirs = sorted((child for child in start_file.scandir() if isinstance(child, Directory)), key=lambda child: child.name)
+    return [(start_file, {"max_depth": 1})] + [(subdir, {"min_depth": 1}) for subdir in subdirs]
 
 def main(args):
     global FS, SHELL
@@ -183,20 +183,20 @@ def main(args):
     if not verify_expression(expression):
         print("find: invalid expression")
         return 1
-    regex_name = re.compile(_glob_to_regex(expression.name))
-    sql_name = _glob_to_sql(expression.name)
+    predicates = compile_expression(expression)
     paths = paths or ["."]
     failed_any_paths = False
     for path in paths:
         try:
-            files_to_check = []
             start_file = File(FS, path)
-            files_to_check.append(start_file)
-            if isinstance(start_file, Directory):
-                    files_to_check.extend(start_file.get_children_like(sql_name, search_subdirs=True))
-            for check_file in files_to_check:
-                if regex_name.match(check_file.name) and check_against_expression(check_file, expression):
-                    print(as_long_format(check_file) if expression.ls else check_file.full_name)
+            if args.jobs > 1:
+                searches = FS.parallel_map(lambda job: list(find_outputs(*job, predicates, expression)), split_tree(start_file), args.jobs)
+                found = heapq.merge(*searches, key=path_order)
+            else:
+                # Streamed straight from the single query
+                found = find_outputs(start_file, {}, predicates, expression)
+            for _, output in found:
+                print(output)
         except MissingFileError:
             print(f"find: '{path}': No such file or directory")
             failed_any_paths = True
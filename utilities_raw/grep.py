@@ -14,11 +14,27 @@ def parse_args():
     global ARGV
     parser = ArgumentParser(description='Find provided pattern in files')
     parser.add_argument('-r', '--recursive', help='recursively search the directory', action='store_true')
+    parser.add_argument('-j', '--jobs', help='search with N workers at once, each on its own pooled connection', type=int, default=1, metavar='N')
     parser.add_argument('paths', help='path(s) that match this file pattern will be searched', nargs="+")
     parser.add_argument('search_pattern', help='the (regexp) pattern to search for in matching files')
 
     return parser.parse_args(ARGV)
 
+def search_file(file_to_search, pattern):
+    return [(file_to_search.full_name, line_no, line_content) for line_no, line_content in file_to_search.find_in_file(pattern)]
+
+def search_job(job, pattern):
+    # A subdirectory is searched whole by one query, a file on its own
+    if isinstance(job, Directory):
+        return list(job.grep_tree(pattern))
+    return search_file(job, pattern)
+
+def split_directory(directory):
+    # The files and subdirectories right below it by name, each searched in path order, so put back together
+    # they come out in the order a single grep_tree gives whatever the worker count
+    children = [child for child in directory.scandir() if isinstance(child, (RegularFile, Directory))]
+    return sorted(children, key=lambda child: child.name)
+
 def main(args):
     global FS, SHELL
     paths = args.paths
@@ -43,15 +59,20 @@ def main(args):
             print(f"Line {line_no}: {line_content}", end="")
         return
 
-    for file_to_search in files:
-        for line_no, line_content in file_to_search.find_in_file(f".*{args.search_pattern}.*"):
-            print(f"{file_to_search.full_name} - Line {line_no}: {line_content}", end="")
+    pattern = f".*{args.search_pattern}.*"
+    for matches in FS.parallel_map(lambda f: search_file(f, pattern), files, args.jobs):
+        for full_path, line_no, line_content in matches:
+            print(f"{full_path} - Line {line_no}: {line_content}", end="")
 
     for directory in directories:
-        for file_to_search in directory.get_children_like("%", seach_subdirs=True):
-            if type(file_to_search) is RegularFile:
-                for line_no, line_content in file_to_search.find_in_file(f".*{args.search_pattern}.*"):
-                    print(f"{file_to_search.full_name} - Line {line_no}: {line_content}", end="")
+        if args.jobs > 1:
+            jobs = FS.parallel_map(lambda job: search_job(job, pattern), split_directory(directory), args.jobs)
+        else:
+            # The whole subtree is searched by one query, in path order
+            jobs = [directory.grep_tree(pattern)]
+        for matches in jobs:
+            for full_path, line_no, line_content in matches:
+                print(f"{full_path} - Line {line_no}: {line_content}", end="")
 
 
 if __name__ == "__main__":
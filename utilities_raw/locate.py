@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Find files by name in the index written by updatedb
+
+Note: Change shebang to `rdbsh` to use has system utility with shell
+"""
+from sys import exit
+from argparse import ArgumentParser
+
+from client_backend.fs_db_io import FSDatabase
+from client_backend.fs_db_locate import DEFAULT_INDEX_PATH, read_header, locate
+
+def parse_args():
+    global ARGV
+    parser = ArgumentParser(description='Find files by name in the index written by updatedb')
+    parser.add_argument('-d', '--database', help='index file to search', default=DEFAULT_INDEX_PATH)
+    parser.add_argument('-b', '--basename', help='match only the last component of each path', action='store_true')
+    parser.add_argument('-c', '--count', help='print the number of matching paths instead', action='store_true')
+    parser.add_argument('-l', '--limit', help='stop after N matching paths', type=int, metavar='N')
+    parser.add_argument('patterns', help='substring, or glob matching the whole path, to look for', nargs="+")
+
+    return parser.parse_args(ARGV)
+
+def main(args):
+    global FS, SHELL
+    if read_header(args.database) is None:
+        print(f"locate: {args.database}: No index, run updatedb first")
+        return 1
+
+    found = 0
+    for pattern in args.patterns:
+        limit = None if args.limit is None else args.limit - found
+        for full_path in locate(pattern, args.database, args.basename, limit):
+            found += 1
+            if not args.count:
+                print(full_path)
+    if args.count:
+        print(found)
+    # Like locate, nothing found is a failure
+    return 0 if found else 1
+
+
+if __name__ == "__main__":
+    import sys
+    from client_backend import shell_context
+    FS = FSDatabase('.fs_db_rdbsh')
+    ARGV = sys.argv[1:]
+    SHELL = shell_context
+    exit(main(parse_args()))
+
+if __name__ == "__rdbsh__":
+    exit(main(parse_args()))
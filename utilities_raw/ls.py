@@ -47,18 +47,20 @@ def get_name_relative_to(base_dir, curr_file):
 
 def list_contents(directory, args, include_header=True):
     global FS, SHELL
-    files = list(directory.walk(include_hidden=args.all)) if isinstance(directory, Directory) else []
+    # Children are listed along with their attributes, so their names are already known
+    files = [(child, child.name) for child in directory.scandir(include_hidden=args.all)] if isinstance(directory, Directory) else []
     if isinstance(directory, Directory) and args.all:
-        files.insert(0, directory)
+        files.insert(0, (directory, get_name_relative_to(directory, directory)))
         parent_directory = directory.get_parent_directory()
         if parent_directory == directory:
-            files.insert(0, parent_directory)
+            files.insert(0, (parent_directory, get_name_relative_to(directory, parent_directory)))
     max_column_widths = [0, 0, 0, 0, 0, 0, 0]
     if args.long_format:
         file_desc_list = []
         total_size = 0
 
-        for curr_file in files:
+        for curr_file, relative_name in files:
+            file_stat = curr_file.stat()
             total_size += curr_file.size
             filetype_desc = '-'
             link_desc = ''
@@ -68,12 +70,12 @@ def list_contents(directory, args, include_header=True):
                 link_desc = f' -> {curr_file.linked_path}'
             permissions_str = f"{filetype_desc}{str(curr_file.permissions)} "
             hard_links_str = f"{curr_file.num_of_hard_links} "
-            owner_str = f"{curr_file.owner.name} "
-            group_owner_str = f"{curr_file.group_owner.name} "
+            owner_str = f"{file_stat.owner_name} "
+            group_owner_str = f"{file_stat.group_owner_name} "
             file_size_str = f"{curr_file.size} "
             file_date = curr_file.modified_date if isinstance(curr_file, Directory) else curr_file.created_date
             date_time_str = f"{file_date.strftime('%b %d %H:%M')} " if datetime.now() - file_date < timedelta(days=6*30) and file_date < datetime.now() else f"{file_date.strftime('%b %d %Y')}"
-            relative_name_str = f"{get_name_relative_to(directory, curr_file)}{link_desc}"
+            relative_name_str = f"{relative_name}{link_desc}"
             max_column_widths[0] = max(max_column_widths[0], len(permissions_str))
             max_column_widths[1] = max(max_column_widths[1], len(hard_links_str))
             max_column_widths[2] = max(max_column_widths[2], len(owner_str))
@@ -109,8 +111,8 @@ def list_contents(directory, args, include_header=True):
         for file_desc in file_desc_list:
             print(" ".join([f"{column:<{max_column_widths[j]}}" for j, column in enumerate(file_desc)]))
     else:
-        for curr_file in files:
-            print(get_name_relative_to(directory, curr_file), end=" ")
+        for curr_file, relative_name in files:
+            print(relative_name, end=" ")
             if directory.full_name == "/" and curr_file == directory:
                 print("..", end=" ")
 
@@ -49,22 +49,24 @@ def rename_to(src_path, dst_path):
     global FS
 
     try:
-        # Either exists or does not. If does not exist, generic error is fine
-        # If wrong type then should've been deleted
-        src_file = File(FS, src_path)
-        src_path = PurePosixPath(src_file.full_name)
-        dst_path = to_abs_path(dst_path)
-        try:
-            resolved_dir = File.resolve_to(FS, dst_path, Directory)
-            dst_path = PurePosixPath(resolved_dir.full_name).joinpath(src_path.name)
-        except IncorrectFileTypeError:
-            File(FS, dst_path).remove()
-        except MissingFileError:
-            pass
-        dst_dir = Directory(FS, dst_path.parent)
-        if src_path.parent != dst_path.parent:
-            src_file.move(dst_dir)
-        src_file.name = dst_path.name
+        # Replacing the destination, moving and renaming happen all at once or not at all
+        with FS.transaction():
+            # Either exists or does not. If does not exist, generic error is fine
+            # If wrong type then should've been deleted
+            src_file = File(FS, src_path)
+            src_path = PurePosixPath(src_file.full_name)
+            dst_path = to_abs_path(dst_path)
+            try:
+                resolved_dir = File.resolve_to(FS, dst_path, Directory)
+                dst_path = PurePosixPath(resolved_dir.full_name).joinpath(src_path.name)
+            except IncorrectFileTypeError:
+                File(FS, dst_path).remove()
+            except MissingFileError:
+                pass
+            dst_dir = Directory(FS, dst_path.parent)
+            if src_path.parent != dst_path.parent:
+                src_file.move(dst_dir)
+            src_file.name = dst_path.name
 
     except (MissingFileError, IncorrectFileTypeError):
         print(f"cannot move '{str(src_path)}' to '{str(dst_path)}': No such file or directory")
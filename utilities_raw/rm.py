@@ -36,7 +36,8 @@ def main(args):
         filetype = curr_file.type
         if filetype is Directory:
             if args.recursive:
-                curr_file.remove(True)
+                with FS.transaction():
+                    curr_file.remove(True)
             else:
                 print(f"rm: cannot remove '{path}': Is a directory")
                 return 1
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""Update the local index of full paths searched by locate
+
+Note: Change shebang to `rdbsh` to use has system utility with shell
+"""
+from sys import exit
+from argparse import ArgumentParser
+
+from client_backend.fs_db_io import FSDatabase
+from client_backend.fs_db_locate import DEFAULT_INDEX_PATH, update_index
+
+def parse_args():
+    global ARGV
+    parser = ArgumentParser(description='Update the index of full paths searched by locate')
+    parser.add_argument('-o', '--output', help='index file to write', default=DEFAULT_INDEX_PATH)
+    parser.add_argument('--rebuild', help='dump every path again, even when only new files need adding', action='store_true')
+    parser.add_argument('-v', '--verbose', help='report the paths indexed and how', action='store_true')
+
+    return parser.parse_args(ARGV)
+
+def main(args):
+    global FS, SHELL
+    written, rebuilt = update_index(FS, args.output, args.rebuild)
+    if args.verbose:
+        print(f"updatedb: {written} paths in {args.output} ({'rebuilt' if rebuilt else 'new files added'})")
+
+
+if __name__ == "__main__":
+    import sys
+    from client_backend import shell_context
+    FS = FSDatabase('.fs_db_rdbsh')
+    ARGV = sys.argv[1:]
+    SHELL = shell_context
+    exit(main(parse_args()))
+
+if __name__ == "__rdbsh__":
+    exit(main(parse_args()))